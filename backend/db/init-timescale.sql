@@ -31,6 +31,10 @@ CREATE TABLE IF NOT EXISTS traces (
     metadata JSONB,
     tags VARCHAR(64)[],
 
+    -- Offloaded bodies (input/output then hold a preview), see trace_payloads
+    input_hash CHAR(64),
+    output_hash CHAR(64),
+
     PRIMARY KEY (timestamp, trace_id)
 );
 
@@ -53,6 +57,87 @@ CREATE UNIQUE INDEX IF NOT EXISTS idx_traces_trace_id_timestamp ON traces (trace
 -- Add retention policy (automatically drop chunks older than 30 days)
 SELECT add_retention_policy('traces', INTERVAL '30 days', if_not_exists => TRUE);
 
+-- Dimensions added by the phase 1 migrations, read by the rollup below
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS department_id UUID;
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS environment_id UUID;
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS version VARCHAR(50);
+
+-- Per-minute rollup of every trace (stored and sampled out), written by
+-- the processing service in the same transaction as the traces themselves.
+-- Missing dimensions are stored as '' or the nil UUID.
+CREATE TABLE IF NOT EXISTS traces_minutely (
+    bucket TIMESTAMPTZ NOT NULL,
+    workspace_id UUID NOT NULL,
+    agent_id VARCHAR(128) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    model_provider VARCHAR(32) NOT NULL,
+    department_id UUID NOT NULL,
+    environment_id UUID NOT NULL,
+    version VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    sampled_out_count BIGINT NOT NULL DEFAULT 0,
+    latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+    tokens_input_sum BIGINT NOT NULL DEFAULT 0,
+    tokens_output_sum BIGINT NOT NULL DEFAULT 0,
+    tokens_total_sum BIGINT NOT NULL DEFAULT 0,
+    cost_usd_sum DECIMAL(14, 6) NOT NULL DEFAULT 0,
+    -- DDSketch of latency_ms (bin index -> count), see backend/query/app/sketch.py
+    latency_sketch JSONB NOT NULL DEFAULT '{}'::jsonb,
+    PRIMARY KEY (bucket, workspace_id, agent_id, model, model_provider, department_id, environment_id, version, status)
+);
+SELECT create_hypertable('traces_minutely', 'bucket',
+    chunk_time_interval => INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+CREATE INDEX IF NOT EXISTS idx_traces_minutely_workspace_bucket ON traces_minutely (workspace_id, bucket DESC);
+SELECT add_retention_policy('traces_minutely', INTERVAL '30 days', if_not_exists => TRUE);
+
+-- Merge two latency sketches by adding their bin counts
+CREATE OR REPLACE FUNCTION latency_sketch_merge(a JSONB, b JSONB) RETURNS JSONB
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(jsonb_object_agg(bin, n), '{}'::jsonb)
+    FROM (
+        SELECT key AS bin, SUM(value::bigint) AS n
+        FROM (
+            SELECT * FROM jsonb_each_text(COALESCE(a, '{}'::jsonb))
+            UNION ALL
+            SELECT * FROM jsonb_each_text(COALESCE(b, '{}'::jsonb))
+        ) entries
+        GROUP BY key
+    ) merged
+$$;
+
+-- Keys of sampled-out traces already counted in traces_minutely (redelivery guard)
+CREATE TABLE IF NOT EXISTS traces_sampled_keys (
+    timestamp TIMESTAMPTZ NOT NULL,
+    trace_id VARCHAR(64) NOT NULL,
+    PRIMARY KEY (timestamp, trace_id)
+);
+SELECT create_hypertable('traces_sampled_keys', 'timestamp',
+    chunk_time_interval => INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+SELECT add_retention_policy('traces_sampled_keys', INTERVAL '7 days', if_not_exists => TRUE);
+
+-- Large input/output bodies, stored once per SHA-256 content hash
+CREATE TABLE IF NOT EXISTS trace_payloads (
+    content_hash CHAR(64) PRIMARY KEY,
+    body TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_trace_payloads_last_seen ON trace_payloads (last_seen_at);
+
+-- Purge bodies no longer referenced by retained traces
+CREATE OR REPLACE PROCEDURE purge_trace_payloads(job_id INT, config JSONB)
+LANGUAGE SQL AS $$
+    DELETE FROM trace_payloads WHERE last_seen_at < NOW() - INTERVAL '32 days';
+$$;
+SELECT add_job('purge_trace_payloads', '1 day')
+WHERE NOT EXISTS (SELECT 1 FROM timescaledb_information.jobs WHERE proc_name = 'purge_trace_payloads');
+
 -- Create continuous aggregate for hourly metrics
 CREATE MATERIALIZED VIEW IF NOT EXISTS traces_hourly
 WITH (timescaledb.continuous) AS
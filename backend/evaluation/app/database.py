@@ -36,10 +36,15 @@ async def close_postgres_pool():
 async def get_trace_by_id(pool: asyncpg.Pool, workspace_id: str, trace_id: str) -> Optional[dict]:
     """Get trace data by ID"""
     query = """
-        SELECT trace_id, agent_id, input, output, status, timestamp
-        FROM traces
-        WHERE workspace_id = $1 AND trace_id = $2
-        ORDER BY timestamp DESC
+        SELECT t.trace_id, t.agent_id,
+               COALESCE(pi.body, t.input) AS input,
+               COALESCE(po.body, t.output) AS output,
+               t.status, t.timestamp
+        FROM traces t
+        LEFT JOIN trace_payloads pi ON pi.content_hash = t.input_hash
+        LEFT JOIN trace_payloads po ON po.content_hash = t.output_hash
+        WHERE t.workspace_id = $1 AND t.trace_id = $2
+        ORDER BY t.timestamp DESC
         LIMIT 1
     """
 
@@ -216,9 +216,14 @@ async def evaluate_batch(
 
         # Fetch all traces with agent_id
         query = """
-            SELECT trace_id, agent_id, input, output, status
-            FROM traces
-            WHERE workspace_id = $1 AND trace_id = ANY($2) AND status = 'success'
+            SELECT t.trace_id, t.agent_id,
+                   COALESCE(pi.body, t.input) AS input,
+                   COALESCE(po.body, t.output) AS output,
+                   t.status
+            FROM traces t
+            LEFT JOIN trace_payloads pi ON pi.content_hash = t.input_hash
+            LEFT JOIN trace_payloads po ON po.content_hash = t.output_hash
+            WHERE t.workspace_id = $1 AND t.trace_id = ANY($2) AND t.status = 'success'
         """
         rows = await pool.fetch(query, x_workspace_id, trace_ids)
 
@@ -586,9 +591,14 @@ async def evaluate_agent(
 
         # Fetch trace data with agent_id
         query = """
-            SELECT trace_id, input, output, status, agent_id
-            FROM traces
-            WHERE workspace_id = $1 AND trace_id = ANY($2) AND status = 'success' AND agent_id = $3
+            SELECT t.trace_id,
+                   COALESCE(pi.body, t.input) AS input,
+                   COALESCE(po.body, t.output) AS output,
+                   t.status, t.agent_id
+            FROM traces t
+            LEFT JOIN trace_payloads pi ON pi.content_hash = t.input_hash
+            LEFT JOIN trace_payloads po ON po.content_hash = t.output_hash
+            WHERE t.workspace_id = $1 AND t.trace_id = ANY($2) AND t.status = 'success' AND t.agent_id = $3
         """
         rows = await pool.fetch(query, workspace_uuid, trace_ids, agent_id)
 
@@ -0,0 +1,201 @@
+"""Lag-aware admission control for trace ingestion"""
+import asyncio
+import logging
+import math
+import time
+from typing import Mapping, Optional
+from .config import get_settings
+from .sharding import shard_for
+
+logger = logging.getLogger(__name__)
+
+
+class ShardState:
+    """Latest backlog sample and drain-rate estimate of one stream shard"""
+
+    __slots__ = ("backlog", "entries_read", "drain_rate", "admitted")
+
+    def __init__(self):
+        self.backlog = 0
+        self.entries_read: Optional[int] = None
+        self.drain_rate: Optional[float] = None  # Entries consumed per second (EWMA)
+        self.admitted: dict[str, int] = {}  # Traces admitted per workspace this window
+
+
+class AdmissionController:
+    """
+    Rejects traces while the processing service is too far behind
+
+    A background task samples each shard stream every ``sample_interval_s``
+    (XLEN and XINFO GROUPS) and estimates its backlog (consumer-group lag
+    plus pending entries) and drain rate. Per shard:
+
+    - below the high watermark every trace is admitted;
+    - between the high and critical watermarks each workspace gets an equal
+      share of what the processors drained in the last interval, so a hot
+      workspace is throttled before it affects the others;
+    - above the critical watermark everything is rejected.
+
+    Watermarks are fractions of the per-shard stream maxlen, so traces are
+    rejected with a Retry-After instead of being trimmed unprocessed.
+    Admission fails open when no recent sample is available.
+    """
+
+    def __init__(self, publisher, consumer_group: str = "processors"):
+        """
+        Initialize controller
+
+        Args:
+            publisher: TracePublisher whose client and shard streams are sampled
+            consumer_group: Processing service consumer group
+        """
+        settings = get_settings()
+        self.client = publisher.client
+        self.streams = publisher.streams
+        self.shards = publisher.shards
+        self.consumer_group = consumer_group
+        self.enabled = settings.admission_enabled
+        self.high_watermark = int(publisher.maxlen * settings.admission_high_watermark)
+        self.critical_watermark = int(publisher.maxlen * settings.admission_critical_watermark)
+        self.sample_interval = settings.admission_sample_interval_s
+        self.max_retry_after = settings.admission_max_retry_after_s
+        self.min_fair_share = settings.admission_min_fair_share
+
+        self.state = [ShardState() for _ in self.streams]
+        self.sampled_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the background sampler"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background sampler"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.warning(f"Admission sampling failed: {str(e)}")
+            await asyncio.sleep(self.sample_interval)
+
+    async def sample(self):
+        """Sample backlog and drain rate of every shard and start a new fairness window"""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for stream in self.streams:
+                pipe.xlen(stream)
+                pipe.xinfo_groups(stream)
+            results = await pipe.execute(raise_on_error=False)
+
+        now = time.monotonic()
+        elapsed = now - self.sampled_at if self.sampled_at else None
+
+        for shard, state in enumerate(self.state):
+            length, groups = results[2 * shard], results[2 * shard + 1]
+            if isinstance(length, Exception):
+                raise length
+
+            group = self._find_group(groups)
+            if group is None:
+                # Processing has not created its group yet: everything is backlog
+                state.backlog = length
+                state.entries_read = None
+                state.drain_rate = None
+            else:
+                lag = group.get("lag")
+                state.backlog = (lag if lag is not None else length) + group.get("pending", 0)
+                self._update_drain_rate(state, group.get("entries-read"), elapsed)
+
+            state.admitted = {}
+
+        self.sampled_at = now
+
+    def _find_group(self, groups) -> Optional[dict]:
+        if isinstance(groups, Exception):
+            return None
+        for group in groups:
+            name = group.get("name")
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+            if name == self.consumer_group:
+                return group
+        return None
+
+    @staticmethod
+    def _update_drain_rate(state: ShardState, entries_read: Optional[int], elapsed: Optional[float]):
+        """EWMA of the consumer group's read rate (entries-read needs Redis 7)"""
+        if entries_read is not None and state.entries_read is not None and elapsed:
+            rate = max(entries_read - state.entries_read, 0) / elapsed
+            state.drain_rate = rate if state.drain_rate is None else 0.5 * state.drain_rate + 0.5 * rate
+        state.entries_read = entries_read
+
+    def _retry_after(self, state: ShardState) -> int:
+        """Seconds until the shard's backlog should drain below the high watermark"""
+        if not state.drain_rate:
+            return self.max_retry_after
+        seconds = (state.backlog - self.high_watermark) / state.drain_rate
+        return min(max(math.ceil(seconds), 1), self.max_retry_after)
+
+    def admit(self, counts: Mapping[str, int]) -> Optional[int]:
+        """
+        Decide whether to accept traces, all or nothing
+
+        Args:
+            counts: Number of traces to publish per workspace_id
+
+        Returns:
+            Optional[int]: None if admitted (the traces are counted against
+                their workspaces' fair share), else the Retry-After in seconds
+        """
+        if not self.enabled or time.monotonic() - self.sampled_at > 5 * self.sample_interval:
+            return None
+
+        retry_after = None
+        shard_counts = []
+        for workspace_id, count in counts.items():
+            workspace_id = str(workspace_id)
+            state = self.state[shard_for(workspace_id, self.shards)]
+            shard_counts.append((state, workspace_id, count))
+
+            if state.backlog < self.high_watermark:
+                continue
+            if state.backlog < self.critical_watermark:
+                # Fair share of what was drained in the last interval
+                budget = (state.drain_rate or 0) * self.sample_interval
+                active = len(state.admitted) + (workspace_id not in state.admitted)
+                fair_share = max(budget / active, self.min_fair_share)
+                if state.admitted.get(workspace_id, 0) + count <= fair_share:
+                    continue
+                rejected = max(math.ceil(self.sample_interval), 1)
+            else:
+                rejected = self._retry_after(state)
+            retry_after = max(retry_after or 0, rejected)
+
+        if retry_after is not None:
+            return retry_after
+
+        for state, workspace_id, count in shard_counts:
+            if state.backlog >= self.high_watermark:
+                state.admitted[workspace_id] = state.admitted.get(workspace_id, 0) + count
+        return None
+
+    def under_pressure(self) -> Optional[int]:
+        """
+        Retry-After for low-priority traffic (bulk backfills)
+
+        Returns:
+            Optional[int]: None if every shard is below the high watermark,
+                else the Retry-After in seconds of the most backlogged shard
+        """
+        if not self.enabled or time.monotonic() - self.sampled_at > 5 * self.sample_interval:
+            return None
+        backlogged = [state for state in self.state if state.backlog >= self.high_watermark]
+        if not backlogged:
+            return None
+        return max(self._retry_after(state) for state in backlogged)
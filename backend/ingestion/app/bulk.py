@@ -0,0 +1,240 @@
+"""Streaming NDJSON decoding for bulk trace ingestion"""
+import zlib
+from typing import AsyncIterator, Iterator, Optional
+import zstandard
+
+SUPPORTED_ENCODINGS = ("identity", "gzip", "zstd")
+
+# Size of the decompressed pieces handed to the line splitter
+PIECE_BYTES = 64 * 1024
+
+
+class BulkDecodeError(ValueError):
+    """Raised when a bulk request body cannot be decompressed"""
+
+
+class BulkBodyTooLarge(BulkDecodeError):
+    """Raised when a body chunk decompresses to more than the allowed size (a decompression bomb)"""
+
+
+class _GzipDecompressor:
+    """Incremental gzip decompressor that also handles concatenated members"""
+
+    def __init__(self, max_output: int):
+        self.max_output = max_output
+        self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """Decompressed pieces of at most PIECE_BYTES, produced as they are consumed"""
+        produced = 0
+        while True:
+            out = self._obj.decompress(data, PIECE_BYTES)
+            produced += len(out)
+            if produced > self.max_output:
+                raise BulkBodyTooLarge(f"Body chunk decompresses to more than {self.max_output} bytes")
+            if out:
+                yield out
+            if self._obj.eof:
+                data = self._obj.unused_data
+                if not data:
+                    return
+                self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                continue
+            data = self._obj.unconsumed_tail
+            if not data and len(out) < PIECE_BYTES:
+                return
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _ZstdDecompressor:
+    """
+    Incremental zstd decompressor reading across frames
+
+    The zstd decompression object has no output limit, so input is pushed
+    through a stream writer whose output (in PIECE_BYTES writes) is
+    counted as it is produced, aborting once ``max_output`` is exceeded.
+    """
+
+    def __init__(self, max_output: int):
+        self.max_output = max_output
+        self._pieces: list[bytes] = []
+        self._produced = 0
+        self._writer = zstandard.ZstdDecompressor().stream_writer(self, write_size=PIECE_BYTES)
+
+    def write(self, data: bytes) -> int:
+        """Output sink of the stream writer"""
+        self._produced += len(data)
+        if self._produced > self.max_output:
+            raise BulkBodyTooLarge(f"Body chunk decompresses to more than {self.max_output} bytes")
+        self._pieces.append(bytes(data))
+        return len(data)
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        self._pieces, self._produced = [], 0
+        self._writer.write(data)
+        pieces, self._pieces = self._pieces, []
+        yield from pieces
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _decompressor(content_encoding: str, max_output: int):
+    """Decompressor for a Content-Encoding (None for identity)"""
+    encoding = (content_encoding or "identity").lower()
+    if encoding == "gzip":
+        return _GzipDecompressor(max_output)
+    if encoding == "zstd":
+        return _ZstdDecompressor(max_output)
+    if encoding == "identity":
+        return None
+    raise BulkDecodeError(
+        f"Unsupported content encoding: {content_encoding}. "
+        f"Supported: {', '.join(SUPPORTED_ENCODINGS)}"
+    )
+
+
+async def read_body(
+    chunks: AsyncIterator[bytes],
+    content_encoding: str = "identity",
+    max_bytes: int = 32 * 1024 * 1024
+) -> bytes:
+    """
+    Read a body that can only be decoded whole, decompressing it as it arrives
+
+    The compressed body is never buffered, and decompression stops as soon
+    as the output exceeds ``max_bytes``, so a decompression bomb costs at
+    most that much memory.
+
+    Args:
+        chunks: Raw body chunks (e.g. ``request.stream()``)
+        content_encoding: identity, gzip or zstd
+        max_bytes: Largest accepted (decompressed) body
+
+    Raises:
+        BulkDecodeError: If the encoding is unsupported or the body cannot be decompressed
+        BulkBodyTooLarge: If the body is larger than ``max_bytes``
+    """
+    decompressor = _decompressor(content_encoding, max_bytes)
+    body = bytearray()
+
+    def append(data: bytes):
+        if len(body) + len(data) > max_bytes:
+            raise BulkBodyTooLarge(f"Body is larger than {max_bytes} bytes")
+        body.extend(data)
+
+    try:
+        async for chunk in chunks:
+            if decompressor is None:
+                append(chunk)
+                continue
+            for data in decompressor.decompress(chunk):
+                append(data)
+        if decompressor is not None:
+            append(decompressor.flush())
+    except (zlib.error, zstandard.ZstdError) as e:
+        raise BulkDecodeError(f"Failed to decompress body: {str(e)}") from e
+    return bytes(body)
+
+
+class NDJSONStream:
+    """
+    Incrementally decompresses a request body and splits it into lines
+
+    Only the current partial line is buffered, so memory stays bounded by
+    ``max_line_bytes`` plus the decompressed output of one network chunk
+    regardless of the body size. A chunk may decompress to at most
+    ``max_inflated_bytes`` (gzip output is also split as it is produced);
+    beyond that ``BulkBodyTooLarge`` is raised. Lines longer than
+    ``max_line_bytes`` are discarded and yielded as ``None`` so the caller
+    can report them.
+    """
+
+    def __init__(
+        self,
+        content_encoding: str = "identity",
+        max_line_bytes: int = 4 * 1024 * 1024,
+        max_inflated_bytes: int = 64 * 1024 * 1024
+    ):
+        """
+        Initialize stream
+
+        Args:
+            content_encoding: identity, gzip or zstd
+            max_line_bytes: Longest accepted line (one trace)
+            max_inflated_bytes: Most decompressed bytes allowed per fed chunk
+
+        Raises:
+            BulkDecodeError: If the content encoding is not supported
+        """
+        self._decompressor = _decompressor(content_encoding, max_inflated_bytes)
+        self.max_line_bytes = max_line_bytes
+        self.line_number = 0
+        self._buffer = bytearray()
+        self._discarding = False
+
+    def feed(self, chunk: bytes) -> Iterator[tuple[int, Optional[bytes]]]:
+        """
+        Feed a raw body chunk and yield the complete lines it finishes
+
+        Yields:
+            tuple: (line_number, line) - line is None if it was too long
+
+        Raises:
+            BulkDecodeError: If the chunk cannot be decompressed
+            BulkBodyTooLarge: If the chunk decompresses to more than ``max_inflated_bytes``
+        """
+        if self._decompressor is None:
+            yield from self._split(chunk)
+            return
+
+        try:
+            for data in self._decompressor.decompress(chunk):
+                yield from self._split(data)
+        except (zlib.error, zstandard.ZstdError) as e:
+            raise BulkDecodeError(f"Failed to decompress body: {str(e)}") from e
+
+    def close(self) -> Iterator[tuple[int, Optional[bytes]]]:
+        """Flush the decompressor and yield the final unterminated line"""
+        try:
+            tail = self._decompressor.flush() if self._decompressor else b""
+        except (zlib.error, zstandard.ZstdError) as e:
+            raise BulkDecodeError(f"Failed to decompress body: {str(e)}") from e
+
+        yield from self._split(tail)
+        if self._buffer or self._discarding:
+            yield from self._emit()
+
+    def _split(self, data: bytes) -> Iterator[tuple[int, Optional[bytes]]]:
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end == -1:
+                self._append(data[start:])
+                return
+            self._append(data[start:end])
+            yield from self._emit()
+            start = end + 1
+
+    def _append(self, data: bytes):
+        if self._discarding or not data:
+            return
+        if len(self._buffer) + len(data) > self.max_line_bytes:
+            self._buffer.clear()
+            self._discarding = True
+        else:
+            self._buffer += data
+
+    def _emit(self) -> Iterator[tuple[int, Optional[bytes]]]:
+        self.line_number += 1
+        if self._discarding:
+            self._discarding = False
+            yield self.line_number, None
+            return
+
+        line = bytes(self._buffer).strip()
+        self._buffer.clear()
+        if line:
+            yield self.line_number, line
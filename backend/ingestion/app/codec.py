@@ -0,0 +1,43 @@
+"""Stream entry encoding for traces:pending
+
+Entries carry the serialized trace in ``data`` and its format in the ``enc``
+header field. Entries without ``enc`` are the original JSON format, so
+consumers can always tell how to decode an entry regardless of which
+publisher version wrote it. Keep in sync with processing/app/codec.py.
+"""
+import json
+import msgpack
+
+FIELD_ENCODING = "enc"
+FIELD_DATA = "data"
+
+# Envelope identifiers: <serialization>/<envelope version>
+ENCODING_JSON = "json/1"
+ENCODING_MSGPACK = "msgpack/1"
+
+ENCODINGS = {"json": ENCODING_JSON, "msgpack": ENCODING_MSGPACK}
+
+
+class TraceCodec:
+    """Serializes traces into stream entries using one configured encoding"""
+
+    def __init__(self, encoding: str = "msgpack"):
+        """
+        Initialize codec
+
+        Args:
+            encoding: "msgpack" (compact binary) or "json"
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported stream encoding: {encoding}. Valid options: {', '.join(ENCODINGS)}")
+        self.encoding = ENCODINGS[encoding]
+
+    def dumps(self, trace_data: dict) -> bytes:
+        """Serialize a trace dictionary (as produced by model_dump(mode='json'))"""
+        if self.encoding == ENCODING_MSGPACK:
+            return msgpack.packb(trace_data, default=str)
+        return json.dumps(trace_data, default=str).encode()
+
+    def entry(self, payload: bytes) -> dict:
+        """Build the stream entry fields for a serialized trace"""
+        return {FIELD_ENCODING: self.encoding, FIELD_DATA: payload}
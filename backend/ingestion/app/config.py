@@ -0,0 +1,68 @@
+"""Ingestion Service Configuration"""
+from pydantic_settings import BaseSettings
+from functools import lru_cache
+
+
+class Settings(BaseSettings):
+    """Application settings loaded from environment variables"""
+
+    # Service
+    app_name: str = "Ingestion Service"
+    debug: bool = False
+
+    # Redis
+    redis_url: str = "redis://localhost:6379/0"
+    redis_max_connections: int = 50
+
+    # Stream publishing
+    stream_maxlen: int = 100000  # Keep about the last 100k messages across all shards
+    stream_shards: int = 1  # traces:pending:{n} by workspace; 1 keeps the single traces:pending stream
+    stream_encoding: str = "msgpack"  # Entry encoding: msgpack or json
+    publish_max_batch_size: int = 500  # Flush coalesced XADDs at this size
+    publish_flush_interval_ms: float = 2.0  # ...or this long after the first queued trace
+
+    # Admission control (watermarks are fractions of the per-shard maxlen)
+    admission_enabled: bool = True
+    admission_high_watermark: float = 0.5  # Above this backlog, workspaces get a fair share
+    admission_critical_watermark: float = 0.9  # Above this backlog, everything is rejected
+    admission_sample_interval_s: float = 1.0  # Backlog sampling period and fairness window
+    admission_max_retry_after_s: int = 60
+    admission_min_fair_share: int = 100  # Traces per workspace per window always admitted below critical
+
+    # Duplicate suppression (trace_id + timestamp)
+    dedup_enabled: bool = True
+    dedup_window_s: int = 3600  # Bloom filter window; retries are caught for 1-2 windows
+    dedup_bloom_bits: int = 1 << 24  # 2 MiB per window, ~1% false positives at 1.7M traces
+    dedup_hashes: int = 7
+    dedup_exact_ttl_s: int = 600  # Exact keys confirming Bloom hits
+    dedup_borderline: str = "accept"  # Bloom-only hits: accept (DB dedups) or reject
+
+    # Large body offload (input/output stored once by content hash)
+    payload_offload_enabled: bool = True
+    payload_offload_min_bytes: int = 4096  # Bodies at least this large are offloaded
+    payload_preview_chars: int = 512  # Prefix kept inline in the trace
+    payload_staging_ttl_s: int = 86400  # Redis staging lifetime; processing must catch up within it
+
+    # Head sampling (per-workspace rules in the traces:sampling:rules hash override these)
+    sampling_head_rate: float = 1.0  # Share of unremarkable successful traces kept in full
+    sampling_rules_refresh_s: int = 30
+
+    # OTLP/HTTP receiver
+    otlp_publish_chunk_size: int = 500  # Converted spans per pipelined XADD
+    otlp_max_body_bytes: int = 32 * 1024 * 1024  # Largest decompressed export (413 beyond)
+
+    # Streaming NDJSON bulk ingestion
+    bulk_publish_chunk_size: int = 1000  # Traces per pipelined XADD
+    bulk_max_line_bytes: int = 4 * 1024 * 1024  # Longest accepted trace line
+    bulk_max_inflated_bytes: int = 64 * 1024 * 1024  # Decompressed bytes allowed per received chunk (413 beyond)
+    bulk_max_errors: int = 100  # Per-line errors returned in the response
+
+    class Config:
+        env_file = ".env"
+        case_sensitive = False
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Get cached settings instance"""
+    return Settings()
@@ -0,0 +1,204 @@
+"""Windowed duplicate suppression for ingested traces"""
+import hashlib
+import logging
+import time
+from .config import get_settings
+from .models import TraceInput
+
+logger = logging.getLogger(__name__)
+
+# Verdicts returned by the dedup script, per trace
+NEW = 0
+DUPLICATE = 1  # Bloom hit confirmed by the exact short-horizon key
+BORDERLINE = 2  # First Bloom hit: a retry or a false positive
+
+# Check and add traces in one round-trip. Exact keys are only read and
+# written for Bloom hits, so traces seen for the first time cost no key.
+# KEYS: current bloom, previous bloom, stats hash, then one exact key per trace
+# ARGV: hashes per trace, bloom TTL, exact TTL, then the bit offsets of every trace
+DEDUP_SCRIPT = """
+local k = tonumber(ARGV[1])
+local verdicts = {}
+local duplicates, borderline = 0, 0
+
+for i = 4, #KEYS do
+    local base = 3 + (i - 4) * k
+    local in_current, in_previous = 1, 1
+    for j = 1, k do
+        local offset = ARGV[base + j]
+        if in_current == 1 and redis.call('GETBIT', KEYS[1], offset) == 0 then in_current = 0 end
+        if in_previous == 1 and redis.call('GETBIT', KEYS[2], offset) == 0 then in_previous = 0 end
+    end
+    for j = 1, k do
+        redis.call('SETBIT', KEYS[1], ARGV[base + j], 1)
+    end
+
+    local verdict = 0
+    if in_current == 1 or in_previous == 1 then
+        if redis.call('SET', KEYS[i], 1, 'NX', 'EX', ARGV[3]) then
+            verdict = 2
+            borderline = borderline + 1
+        else
+            verdict = 1
+            duplicates = duplicates + 1
+        end
+    end
+    verdicts[#verdicts + 1] = verdict
+end
+
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('HINCRBY', KEYS[3], 'checked', #KEYS - 3)
+redis.call('HINCRBY', KEYS[3], 'duplicates', duplicates)
+redis.call('HINCRBY', KEYS[3], 'borderline', borderline)
+return verdicts
+"""
+
+
+class TraceDeduplicator:
+    """
+    Suppresses SDK retries before they are published
+
+    A trace is identified by (trace_id, timestamp), the key the writer's
+    ON CONFLICT clause deduplicates on. Keys are added to a Redis bitmap
+    Bloom filter per ``window_s`` time window; a trace is checked against
+    the current and previous window, so retries are caught for at least
+    one full window. A trace missing from the filter is new and costs no
+    other key. A Bloom hit sets an exact key with a short TTL: the first
+    hit of a key (a retry, or a false positive) is borderline and accepted
+    by default, leaving the database constraint as the final arbiter;
+    further hits within the exact horizon find the key and are dropped as
+    duplicates. Only retried traces and false positives (about 1%) hold
+    exact keys. Repeats within one checked list are duplicates.
+
+    Counts are kept in the ``traces:dedup:stats`` hash.
+    """
+
+    KEY_PREFIX = "traces:dedup"
+
+    def __init__(self, client):
+        """
+        Initialize deduplicator
+
+        Args:
+            client: Async Redis client (shared with the publisher)
+        """
+        settings = get_settings()
+        self.client = client
+        self.enabled = settings.dedup_enabled
+        self.window_s = settings.dedup_window_s
+        self.bloom_bits = settings.dedup_bloom_bits
+        self.hashes = settings.dedup_hashes
+        self.exact_ttl_s = settings.dedup_exact_ttl_s
+        self.drop_borderline = settings.dedup_borderline == "reject"
+        self.stats_key = f"{self.KEY_PREFIX}:stats"
+        self._script = client.register_script(DEDUP_SCRIPT)
+
+    @staticmethod
+    def key(trace: TraceInput) -> bytes:
+        """Dedup key of a trace"""
+        return hashlib.blake2b(
+            f"{trace.trace_id}\x00{trace.timestamp.isoformat()}".encode('utf-8'),
+            digest_size=16
+        ).digest()
+
+    def _offsets(self, key: bytes) -> list[int]:
+        """Bloom filter bit positions of a key (double hashing)"""
+        h1 = int.from_bytes(key[:8], 'little')
+        h2 = int.from_bytes(key[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bloom_bits for i in range(self.hashes)]
+
+    def _exact_key(self, key: bytes) -> str:
+        return f"{self.KEY_PREFIX}:seen:{key.hex()}"
+
+    async def check(self, keys: list[bytes]) -> list[int]:
+        """
+        Check and record traces
+
+        Args:
+            keys: Dedup keys, in publish order (repeats within the list are duplicates)
+
+        Returns:
+            list[int]: NEW, DUPLICATE or BORDERLINE for each key
+        """
+        if not keys:
+            return []
+
+        # Repeats within the list never reach Redis
+        unique = list(dict.fromkeys(keys))
+        window = int(time.time() // self.window_s)
+        args = [self.hashes, 2 * self.window_s, self.exact_ttl_s]
+        for key in unique:
+            args.extend(self._offsets(key))
+
+        verdicts = dict(zip(unique, await self._script(
+            keys=[
+                f"{self.KEY_PREFIX}:bloom:{window}",
+                f"{self.KEY_PREFIX}:bloom:{window - 1}",
+                self.stats_key,
+                *(self._exact_key(key) for key in unique)
+            ],
+            args=args
+        )))
+        seen = set()
+        result = []
+        for key in keys:
+            result.append(DUPLICATE if key in seen else verdicts[key])
+            seen.add(key)
+        return result
+
+    async def filter(self, keys: list[bytes], payloads: list) -> tuple[list, list[bytes], int]:
+        """
+        Drop duplicate traces before publishing
+
+        Fails open: if Redis cannot be checked, every trace is kept.
+
+        Args:
+            keys: Dedup key of each payload
+            payloads: Serialized traces
+
+        Returns:
+            tuple: (payloads, keys, duplicates) - the traces to publish,
+                their keys (for ``forget``) and the number dropped
+        """
+        if not self.enabled or not keys:
+            return payloads, keys, 0
+
+        try:
+            verdicts = await self.check(keys)
+        except Exception as e:
+            logger.warning(f"Dedup check failed, publishing without it: {str(e)}")
+            return payloads, [], 0
+
+        kept_payloads, kept_keys = [], []
+        for key, payload, verdict in zip(keys, payloads, verdicts):
+            if verdict == DUPLICATE or (verdict == BORDERLINE and self.drop_borderline):
+                continue
+            kept_payloads.append(payload)
+            kept_keys.append(key)
+
+        duplicates = len(payloads) - len(kept_payloads)
+        if duplicates:
+            logger.info(f"Suppressed {duplicates} duplicate traces")
+        return kept_payloads, kept_keys, duplicates
+
+    async def forget(self, keys: list[bytes]):
+        """
+        Remove the exact keys of traces that failed to publish
+
+        Their Bloom bits remain, so a retry is borderline rather than a
+        confirmed duplicate and is accepted under the default policy.
+        """
+        if not self.enabled or not keys:
+            return
+        try:
+            await self.client.delete(*(self._exact_key(key) for key in keys))
+        except Exception as e:
+            logger.warning(f"Failed to forget dedup keys: {str(e)}")
+
+    async def get_stats(self) -> dict:
+        """Dedup hit counts since the stats hash was created"""
+        stats = await self.client.hgetall(self.stats_key)
+        return {
+            (k.decode('utf-8') if isinstance(k, bytes) else k): int(v)
+            for k, v in stats.items()
+        }
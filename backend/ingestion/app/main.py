@@ -1,6 +1,6 @@
 """Ingestion Service - Main FastAPI Application"""
 from fastapi import FastAPI
-from .routes import router
+from .routes import router, publisher, admission
 import logging
 
 # Configure logging
@@ -20,6 +20,21 @@ app = FastAPI(
 app.include_router(router)
 
 
+@app.on_event("startup")
+async def startup():
+    """Start sampling the stream backlog and refreshing sampling rules"""
+    await admission.start()
+    await publisher.sampler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush queued traces and close Redis connections on shutdown"""
+    await admission.stop()
+    await publisher.sampler.stop()
+    await publisher.close()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
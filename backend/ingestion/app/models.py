@@ -48,4 +48,15 @@ class BatchTraceResponse(BaseModel):
     """Batch trace ingestion response"""
     accepted: int
     rejected: int
+    duplicates: int = 0  # Retries of recently accepted traces, not queued again
     errors: list[dict] = Field(default_factory=list)
+
+
+class BulkTraceResponse(BaseModel):
+    """Bulk (NDJSON) trace ingestion response"""
+    lines: int
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+    errors: list[dict] = Field(default_factory=list)
+    errors_truncated: bool = False
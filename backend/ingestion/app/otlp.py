@@ -0,0 +1,285 @@
+"""OTLP/HTTP trace decoding and GenAI span-to-trace conversion"""
+import json
+from datetime import datetime, timezone
+from typing import Iterator, NamedTuple, Optional
+from google.protobuf.message import DecodeError
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse
+)
+
+CONTENT_TYPE_PROTOBUF = "application/x-protobuf"
+CONTENT_TYPE_JSON = "application/json"
+
+# Span status codes (opentelemetry.proto.trace.v1.Status.StatusCode)
+STATUS_CODE_ERROR = 2
+
+# GenAI semantic-convention attributes, in order of preference
+MODEL_ATTRS = ("gen_ai.response.model", "gen_ai.request.model")
+PROVIDER_ATTRS = ("gen_ai.provider.name", "gen_ai.system")
+INPUT_TOKEN_ATTRS = ("gen_ai.usage.input_tokens", "gen_ai.usage.prompt_tokens")
+OUTPUT_TOKEN_ATTRS = ("gen_ai.usage.output_tokens", "gen_ai.usage.completion_tokens")
+INPUT_ATTRS = ("gen_ai.input.messages", "gen_ai.prompt")
+OUTPUT_ATTRS = ("gen_ai.output.messages", "gen_ai.completion")
+AGENT_ATTRS = ("gen_ai.agent.id", "gen_ai.agent.name")
+COST_ATTRS = ("gen_ai.usage.cost",)
+
+
+class OTLPDecodeError(ValueError):
+    """Raised when an OTLP export request body cannot be decoded"""
+
+
+class OTLPSpan(NamedTuple):
+    """Span fields needed for conversion, independent of the wire encoding"""
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    name: str
+    start_time_unix_nano: int
+    end_time_unix_nano: int
+    status_code: int
+    status_message: str
+    attributes: dict
+    resource_attributes: dict
+
+
+# ---------------------------------------------------------------------------
+# Protobuf decoding
+# ---------------------------------------------------------------------------
+
+def _proto_value(value):
+    """Convert a protobuf AnyValue to a Python value"""
+    kind = value.WhichOneof("value")
+    if kind == "array_value":
+        return [_proto_value(v) for v in value.array_value.values]
+    if kind == "kvlist_value":
+        return {kv.key: _proto_value(kv.value) for kv in value.kvlist_value.values}
+    if kind == "bytes_value":
+        return value.bytes_value.hex()
+    return getattr(value, kind) if kind else None
+
+
+def _proto_attributes(attributes) -> dict:
+    return {kv.key: _proto_value(kv.value) for kv in attributes}
+
+
+def iter_spans_protobuf(body: bytes) -> Iterator[OTLPSpan]:
+    """Yield the spans of a protobuf ExportTraceServiceRequest"""
+    request = ExportTraceServiceRequest()
+    try:
+        request.ParseFromString(body)
+    except DecodeError as e:
+        raise OTLPDecodeError(f"Invalid protobuf payload: {str(e)}") from e
+
+    for resource_spans in request.resource_spans:
+        resource_attrs = _proto_attributes(resource_spans.resource.attributes)
+        for scope_spans in resource_spans.scope_spans:
+            for span in scope_spans.spans:
+                yield OTLPSpan(
+                    trace_id=span.trace_id.hex(),
+                    span_id=span.span_id.hex(),
+                    parent_span_id=span.parent_span_id.hex(),
+                    name=span.name,
+                    start_time_unix_nano=span.start_time_unix_nano,
+                    end_time_unix_nano=span.end_time_unix_nano,
+                    status_code=span.status.code,
+                    status_message=span.status.message,
+                    attributes=_proto_attributes(span.attributes),
+                    resource_attributes=resource_attrs
+                )
+
+
+# ---------------------------------------------------------------------------
+# JSON decoding (OTLP/JSON protobuf mapping: camelCase keys, hex IDs)
+# ---------------------------------------------------------------------------
+
+def _json_value(value: dict):
+    """Convert an OTLP/JSON AnyValue to a Python value"""
+    if not value:
+        return None
+    if "stringValue" in value:
+        return value["stringValue"]
+    if "intValue" in value:
+        return int(value["intValue"])  # int64 is encoded as a string
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    if "boolValue" in value:
+        return bool(value["boolValue"])
+    if "arrayValue" in value:
+        return [_json_value(v) for v in value["arrayValue"].get("values", [])]
+    if "kvlistValue" in value:
+        return _json_attributes(value["kvlistValue"].get("values", []))
+    if "bytesValue" in value:
+        return value["bytesValue"]
+    return None
+
+
+def _json_attributes(attributes: list) -> dict:
+    return {kv["key"]: _json_value(kv.get("value", {})) for kv in attributes or []}
+
+
+def _json_status_code(code) -> int:
+    if isinstance(code, str):
+        return STATUS_CODE_ERROR if code == "STATUS_CODE_ERROR" else 0
+    return int(code or 0)
+
+
+def iter_spans_json(body: bytes) -> Iterator[OTLPSpan]:
+    """Yield the spans of an OTLP/JSON ExportTraceServiceRequest"""
+    try:
+        request = json.loads(body)
+        resource_spans_list = request.get("resourceSpans", [])
+    except (ValueError, AttributeError) as e:
+        raise OTLPDecodeError(f"Invalid JSON payload: {str(e)}") from e
+
+    # Elements of the wrong shape (e.g. a span that is not an object) only
+    # surface while iterating: report them as a malformed request too
+    try:
+        for resource_spans in resource_spans_list:
+            resource_attrs = _json_attributes(resource_spans.get("resource", {}).get("attributes"))
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    status = span.get("status", {})
+                    yield OTLPSpan(
+                        trace_id=span.get("traceId", ""),
+                        span_id=span.get("spanId", ""),
+                        parent_span_id=span.get("parentSpanId", ""),
+                        name=span.get("name", ""),
+                        start_time_unix_nano=int(span.get("startTimeUnixNano", 0)),
+                        end_time_unix_nano=int(span.get("endTimeUnixNano", 0)),
+                        status_code=_json_status_code(status.get("code")),
+                        status_message=status.get("message", ""),
+                        attributes=_json_attributes(span.get("attributes")),
+                        resource_attributes=resource_attrs
+                    )
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        raise OTLPDecodeError(f"Invalid JSON payload: {type(e).__name__}: {str(e)}") from e
+
+
+def iter_spans(body: bytes, content_type: str) -> Iterator[OTLPSpan]:
+    """
+    Lazily decode the spans of an OTLP export request
+
+    Args:
+        body: Raw (already decompressed) request body
+        content_type: Media type of the body (protobuf or JSON)
+
+    Raises:
+        OTLPDecodeError: If the media type is unsupported or the body is malformed
+    """
+    if content_type == CONTENT_TYPE_PROTOBUF:
+        return iter_spans_protobuf(body)
+    if content_type == CONTENT_TYPE_JSON:
+        return iter_spans_json(body)
+    raise OTLPDecodeError(f"Unsupported content type: {content_type}")
+
+
+# ---------------------------------------------------------------------------
+# GenAI span mapping
+# ---------------------------------------------------------------------------
+
+def _first(attributes: dict, keys: tuple):
+    for key in keys:
+        value = attributes.get(key)
+        if value is not None and value != "":
+            return value
+    return None
+
+
+def _indexed_content(attributes: dict, prefix: str) -> Optional[str]:
+    """Join legacy indexed message attributes such as gen_ai.prompt.0.content"""
+    parts = []
+    index = 0
+    while f"{prefix}.{index}.content" in attributes:
+        parts.append(str(attributes[f"{prefix}.{index}.content"]))
+        index += 1
+    return "\n".join(parts) if parts else None
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def span_to_trace(span: OTLPSpan, workspace_id: Optional[str] = None) -> Optional[dict]:
+    """
+    Map a GenAI span to the TraceInput schema
+
+    Spans without a GenAI model attribute are not LLM calls and are skipped.
+
+    Args:
+        span: Decoded span
+        workspace_id: Workspace from the request header; falls back to the
+            ``workspace.id`` resource attribute
+
+    Returns:
+        dict: Trace data for TraceInput validation, or None to skip the span
+    """
+    attrs = span.attributes
+    model = _first(attrs, MODEL_ATTRS)
+    if model is None:
+        return None
+
+    status = "success"
+    error = None
+    if span.status_code == STATUS_CODE_ERROR:
+        error_type = str(attrs.get("error.type", ""))
+        status = "timeout" if "timeout" in error_type.lower() else "error"
+        error = span.status_message or error_type or None
+
+    input_value = _first(attrs, INPUT_ATTRS)
+    if input_value is None:
+        input_value = _indexed_content(attrs, "gen_ai.prompt")
+    output_value = _first(attrs, OUTPUT_ATTRS)
+    if output_value is None:
+        output_value = _indexed_content(attrs, "gen_ai.completion")
+
+    metadata = {
+        "otel": {
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_span_id or None,
+            "span_name": span.name,
+            "operation": attrs.get("gen_ai.operation.name"),
+        }
+    }
+    if error:
+        metadata["error"] = error
+
+    return {
+        "trace_id": f"{span.trace_id}-{span.span_id}",
+        "agent_id": _first(attrs, AGENT_ATTRS) or span.resource_attributes.get("service.name") or "unknown",
+        "workspace_id": workspace_id or span.resource_attributes.get("workspace.id"),
+        "timestamp": datetime.fromtimestamp(span.start_time_unix_nano / 1e9, tz=timezone.utc),
+        "input": _text(input_value),
+        "output": _text(output_value),
+        "latency_ms": max(1, round((span.end_time_unix_nano - span.start_time_unix_nano) / 1e6)),
+        "status": status,
+        "model": str(model),
+        "model_provider": str(_first(attrs, PROVIDER_ATTRS) or "unknown"),
+        "tokens_input": _first(attrs, INPUT_TOKEN_ATTRS),
+        "tokens_output": _first(attrs, OUTPUT_TOKEN_ATTRS),
+        "cost_usd": _first(attrs, COST_ATTRS),
+        "metadata": metadata,
+    }
+
+
+def export_response(content_type: str, rejected_spans: int = 0, error_message: str = "") -> tuple[bytes, str]:
+    """
+    Build an ExportTraceServiceResponse in the request's encoding
+
+    Returns:
+        tuple: (body, media_type)
+    """
+    if content_type == CONTENT_TYPE_PROTOBUF:
+        response = ExportTraceServiceResponse()
+        if rejected_spans:
+            response.partial_success.rejected_spans = rejected_spans
+            response.partial_success.error_message = error_message
+        return response.SerializeToString(), CONTENT_TYPE_PROTOBUF
+
+    payload = {}
+    if rejected_spans:
+        payload["partialSuccess"] = {"rejectedSpans": rejected_spans, "errorMessage": error_message}
+    return json.dumps(payload).encode(), CONTENT_TYPE_JSON
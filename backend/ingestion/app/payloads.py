@@ -0,0 +1,56 @@
+"""Content-addressed offload of large trace input/output bodies"""
+import hashlib
+from .config import get_settings
+
+OFFLOADED_FIELDS = ("input", "output")
+
+
+def payload_key(content_hash: str) -> str:
+    """Redis key a body is staged under until processing persists it"""
+    return f"traces:payload:{content_hash}"
+
+
+class PayloadOffloader:
+    """
+    Replaces large input/output bodies with a preview and a content hash
+
+    Bodies of at least ``min_bytes`` (UTF-8) are keyed by their SHA-256 and
+    staged in Redis next to the stream entry; the processing service moves
+    them into the ``trace_payloads`` table, where each distinct body (e.g.
+    a repeated prompt template) is stored once. The trace keeps the first
+    ``preview_chars`` characters plus ``input_hash``/``output_hash``.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.payload_offload_enabled
+        self.min_bytes = settings.payload_offload_min_bytes
+        self.preview_chars = settings.payload_preview_chars
+        self.staging_ttl_s = settings.payload_staging_ttl_s
+
+    def offload(self, trace_data: dict) -> dict:
+        """
+        Offload the large bodies of a trace dictionary, in place
+
+        Returns:
+            dict: Staged bodies by content hash (empty if nothing was offloaded)
+        """
+        bodies = {}
+        if not self.enabled:
+            return bodies
+
+        for field in OFFLOADED_FIELDS:
+            text = trace_data.get(field)
+            # Characters are 1-4 bytes, so short strings can be skipped unencoded
+            if not isinstance(text, str) or 4 * len(text) < self.min_bytes:
+                continue
+            body = text.encode('utf-8')
+            if len(body) < self.min_bytes:
+                continue
+
+            content_hash = hashlib.sha256(body).hexdigest()
+            bodies[content_hash] = body
+            trace_data[field] = text[:self.preview_chars]
+            trace_data[f"{field}_hash"] = content_hash
+
+        return bodies
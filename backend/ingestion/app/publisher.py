@@ -1,56 +1,193 @@
 """Redis Streams publisher for trace events"""
-import json
-import redis
-import os
-from typing import Optional
+import asyncio
+import redis.asyncio as redis
+from typing import NamedTuple, Optional
 import logging
+from .codec import TraceCodec
+from .dedup import TraceDeduplicator
+from .models import TraceInput
+from .payloads import PayloadOffloader, payload_key
+from .sampling import HeadSampler
+from .sharding import STREAM_BASE, all_streams, shard_for, shard_stream
+from .config import get_settings
 
 logger = logging.getLogger(__name__)
 
 
-class TracePublisher:
-    """Publishes traces to Redis Streams for async processing"""
+class EncodedTrace(NamedTuple):
+    """A serialized trace ready for publish_encoded"""
+    stream: str  # Shard stream
+    payload: bytes
+    bodies: dict  # Offloaded bodies by content hash, staged with the entry
+    dedup_key: Optional[bytes] = None  # Checked for duplicates in the coalesced flush
+
 
-    def __init__(self, redis_url: Optional[str] = None):
+class TracePublisher:
+    """
+    Publishes traces to Redis Streams for async processing
+
+    Uses a pooled asyncio Redis client. Concurrent single-trace publishes are
+    coalesced into one pipelined XADD round-trip, flushed as soon as
+    ``max_batch_size`` traces are queued or ``flush_interval_ms`` after the
+    first trace of the batch was queued, whichever comes first.
+
+    Traces are routed to a stream shard by workspace_id (see ``sharding``);
+    each shard is trimmed approximately to its share of ``stream_maxlen``.
+    Large input/output bodies are offloaded (see ``payloads``) and staged
+    in the same pipeline, ahead of the entries that reference them.
+    Traces not picked by head sampling (see ``sampling``) are published as
+    summaries without bodies. Single-trace publishes given a dedup key are
+    checked for duplicates (see ``dedup``) in one script call per flush.
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        max_batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        stream_shards: Optional[int] = None
+    ):
         """
         Initialize publisher
 
         Args:
-            redis_url: Redis connection URL (defaults to env variable)
+            redis_url: Redis connection URL (defaults to settings)
+            max_batch_size: Maximum traces per coalesced pipeline
+            flush_interval_ms: Maximum time a trace waits for its batch to fill
+            max_connections: Size of the Redis connection pool
+            stream_shards: Number of workspace shards of traces:pending
         """
-        url = redis_url or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-        self.client = redis.from_url(url, decode_responses=False)
-        self.stream_name = "traces:pending"
-
-    def publish_trace(self, trace_data: dict) -> str:
+        settings = get_settings()
+        self.pool = redis.ConnectionPool.from_url(
+            redis_url or settings.redis_url,
+            max_connections=max_connections or settings.redis_max_connections,
+            decode_responses=False
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        self.stream_name = STREAM_BASE
+        self.shards = max(stream_shards or settings.stream_shards, 1)
+        self.streams = all_streams(self.shards)
+        self.maxlen = -(-settings.stream_maxlen // self.shards)  # Per shard, rounded up
+        self.codec = TraceCodec(settings.stream_encoding)
+        self.offloader = PayloadOffloader()
+        self.sampler = HeadSampler(self.client)
+        self.deduplicator = TraceDeduplicator(self.client)
+        self.max_batch_size = max_batch_size or settings.publish_max_batch_size
+        self.flush_interval = (
+            flush_interval_ms if flush_interval_ms is not None else settings.publish_flush_interval_ms
+        ) / 1000
+
+        # Coalescing state: queued (entry, future) pairs and the deadline timer
+        self._pending: list[tuple[EncodedTrace, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def _encode(self, trace_data: dict, dedup_key: Optional[bytes] = None) -> EncodedTrace:
+        """Head-sample, offload large bodies and serialize a JSON-compatible trace dictionary"""
+        self.sampler.apply(trace_data)
+        bodies = self.offloader.offload(trace_data)
+        return EncodedTrace(
+            self._stream_for(trace_data.get('workspace_id')),
+            self.codec.dumps(trace_data),
+            bodies,
+            dedup_key
+        )
+
+    def _stream_for(self, workspace_id) -> str:
+        """Shard stream for a workspace"""
+        return shard_stream(shard_for(workspace_id, self.shards), self.shards)
+
+    def serialize(self, trace: TraceInput) -> EncodedTrace:
+        """Serialize a validated trace for publish_encoded"""
+        return self._encode(trace.model_dump(mode='json'))
+
+    async def publish_trace(self, trace_data: dict, dedup_key: Optional[bytes] = None) -> Optional[str]:
         """
         Publish a single trace to Redis Stream
 
+        The trace is queued and written together with other concurrently
+        published traces; the call resolves once its XADD has executed.
+
         Args:
             trace_data: Trace data dictionary
+            dedup_key: ``TraceDeduplicator.key`` of the trace, to suppress retries
 
         Returns:
-            str: Message ID from Redis
+            Optional[str]: Message ID from Redis, or None if the trace was
+                dropped as a duplicate
         """
-        try:
-            # Convert trace to JSON
-            trace_json = json.dumps(trace_data, default=str)
-
-            # Add to stream
-            message_id = self.client.xadd(
-                self.stream_name,
-                {"data": trace_json},
-                maxlen=100000  # Keep last 100k messages
-            )
-
-            logger.info(f"Published trace {trace_data.get('trace_id')} to stream: {message_id}")
-            return message_id.decode('utf-8') if isinstance(message_id, bytes) else message_id
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((self._encode(dict(trace_data), dedup_key), future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush)
+
+        message_id = await future
+        logger.debug(f"Published trace {trace_data.get('trace_id')} to stream: {message_id}")
+        return message_id
+
+    def _flush(self):
+        """Hand the queued traces to a background pipeline write"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._write_coalesced(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _write_coalesced(self, batch: list[tuple[EncodedTrace, asyncio.Future]]):
+        """Drop duplicates, write a coalesced batch and resolve each caller's future"""
+        keyed = [i for i, (entry, _) in enumerate(batch) if entry.dedup_key is not None]
+        kept, kept_keys, _ = await self.deduplicator.filter(
+            [batch[i][0].dedup_key for i in keyed], keyed
+        )
+        dropped = set(keyed) - set(kept)
+        written = [i for i in range(len(batch)) if i not in dropped]
 
+        try:
+            message_ids = await self._xadd_many([batch[i][0] for i in written]) if written else []
         except Exception as e:
-            logger.error(f"Failed to publish trace: {str(e)}")
-            raise
-
-    def publish_batch(self, traces: list[dict]) -> list[str]:
+            logger.error(f"Failed to publish coalesced batch of {len(written)} traces: {str(e)}")
+            await self.deduplicator.forget(kept_keys)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Duplicates resolve to None
+        message_ids = dict(zip(written, message_ids))
+        for i, (_, future) in enumerate(batch):
+            # The request may have been cancelled while waiting
+            if not future.done():
+                future.set_result(message_ids.get(i))
+
+    async def _xadd_many(self, entries: list[EncodedTrace]) -> list[str]:
+        """Stage offloaded bodies and XADD entries in a single non-transactional pipeline"""
+        bodies = {}
+        for entry in entries:
+            bodies.update(entry.bodies)
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            for content_hash, body in bodies.items():
+                pipe.set(payload_key(content_hash), body, ex=self.offloader.staging_ttl_s)
+            for entry in entries:
+                pipe.xadd(entry.stream, self.codec.entry(entry.payload), maxlen=self.maxlen, approximate=True)
+            results = await pipe.execute()
+
+        return [
+            (r.decode('utf-8') if isinstance(r, bytes) else r) for r in results[len(bodies):]
+        ]
+
+    async def publish_batch(self, traces: list[dict]) -> list[str]:
         """
         Publish multiple traces to Redis Stream
 
@@ -60,37 +197,38 @@ class TracePublisher:
         Returns:
             list[str]: List of message IDs from Redis
         """
-        message_ids = []
+        return await self.publish_encoded([self._encode(dict(trace)) for trace in traces])
+
+    async def publish_encoded(self, payloads: list) -> list[str]:
+        """
+        Publish already-serialized traces to Redis Stream
+
+        Args:
+            payloads: Traces serialized with ``serialize``, one per trace
 
+        Returns:
+            list[str]: List of message IDs from Redis
+        """
         try:
-            # Use pipeline for efficiency
-            pipe = self.client.pipeline()
-
-            for trace in traces:
-                trace_json = json.dumps(trace, default=str)
-                pipe.xadd(
-                    self.stream_name,
-                    {"data": trace_json},
-                    maxlen=100000
-                )
-
-            # Execute pipeline
-            results = pipe.execute()
-            message_ids = [
-                (r.decode('utf-8') if isinstance(r, bytes) else r) for r in results
-            ]
-
-            logger.info(f"Published {len(traces)} traces to stream")
+            message_ids = await self._xadd_many(payloads)
+            logger.info(f"Published {len(payloads)} traces to stream")
             return message_ids
 
         except Exception as e:
             logger.error(f"Failed to publish batch: {str(e)}")
             raise
 
-    def get_stream_length(self) -> int:
-        """Get current length of traces stream"""
-        return self.client.xlen(self.stream_name)
-
-    def close(self):
-        """Close Redis connection"""
-        self.client.close()
+    async def get_stream_length(self) -> int:
+        """Get current length of the traces stream, summed over all shards"""
+        async with self.client.pipeline(transaction=False) as pipe:
+            for stream in self.streams:
+                pipe.xlen(stream)
+            return sum(await pipe.execute())
+
+    async def close(self):
+        """Flush queued traces and close the Redis connection pool"""
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        await self.client.aclose()
+        await self.pool.disconnect()
@@ -1,15 +1,63 @@
 """Ingestion API routes"""
-from fastapi import APIRouter, HTTPException, status, Header
-from .models import TraceInput, BatchTraceInput, TraceResponse, BatchTraceResponse
+from fastapi import APIRouter, HTTPException, status, Header, Request, Response
+from pydantic import ValidationError
+from typing import Optional
+from collections import Counter
+import asyncio
+from .models import TraceInput, TraceResponse, BatchTraceResponse, BulkTraceResponse
 from .publisher import TracePublisher
-from .validation import validate_trace, validate_batch
+from .validation import validate_batch_json, BatchFormatError
+from .otlp import (
+    iter_spans, span_to_trace, export_response, OTLPDecodeError,
+    CONTENT_TYPE_PROTOBUF, CONTENT_TYPE_JSON
+)
+from .bulk import NDJSONStream, BulkDecodeError, BulkBodyTooLarge, read_body
+from .admission import AdmissionController
+from .dedup import TraceDeduplicator
+from .config import get_settings
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1", tags=["ingestion"])
+settings = get_settings()
 
 # Initialize publisher
 publisher = TracePublisher()
+admission = AdmissionController(publisher)
+deduplicator = publisher.deduplicator
+
+
+def _backlog_too_high(retry_after: int) -> HTTPException:
+    """429 response telling the client when to retry"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Processing backlog is too high, retry later",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+def _check_admission(counts) -> None:
+    """Raise 429 with Retry-After if the processing backlog is too high"""
+    retry_after = admission.admit(counts)
+    if retry_after is not None:
+        raise _backlog_too_high(retry_after)
+
+
+async def _publish_new(keys: list[bytes], payloads: list) -> tuple[int, int]:
+    """
+    Publish serialized traces, skipping duplicates of recently seen traces
+
+    Returns:
+        tuple: (published, duplicates)
+    """
+    payloads, keys, duplicates = await deduplicator.filter(keys, payloads)
+    if payloads:
+        try:
+            await publisher.publish_encoded(payloads)
+        except Exception:
+            await deduplicator.forget(keys)
+            raise
+    return len(payloads), duplicates
 
 
 @router.post("/traces", response_model=TraceResponse, status_code=status.HTTP_202_ACCEPTED)
@@ -19,11 +67,22 @@ async def ingest_trace(trace: TraceInput):
 
     This endpoint accepts a trace and queues it for async processing.
     The trace will be validated, enriched, and stored in TimescaleDB.
+    Returns 429 with Retry-After while the processing backlog is too high.
+    A retry of a recently accepted trace is acknowledged as a duplicate
+    without being queued again.
     """
+    _check_admission({trace.workspace_id: 1})
+
     try:
-        # Convert to dict and publish to Redis Stream
+        # Convert to dict and publish to Redis Stream (checked for duplicates in the coalesced flush)
         trace_dict = trace.model_dump(mode='json')
-        message_id = publisher.publish_trace(trace_dict)
+        message_id = await publisher.publish_trace(trace_dict, dedup_key=TraceDeduplicator.key(trace))
+        if message_id is None:
+            return TraceResponse(
+                trace_id=trace.trace_id,
+                status="duplicate",
+                message="Trace was already received and is not queued again"
+            )
 
         return TraceResponse(
             trace_id=trace.trace_id,
@@ -40,26 +99,45 @@ async def ingest_trace(trace: TraceInput):
 
 
 @router.post("/traces/batch", response_model=BatchTraceResponse, status_code=status.HTTP_202_ACCEPTED)
-async def ingest_batch(batch: BatchTraceInput):
+async def ingest_batch(request: Request):
     """
     Ingest multiple traces in a single request
 
     Accepts up to 100 traces. Invalid traces are rejected with error details.
     Valid traces are queued for processing.
+
+    The raw body is validated once and each valid trace is serialized
+    straight into the stream payload, without intermediate model dumps.
+    The batch is admitted or rejected (429) as a whole. Duplicates of
+    recently accepted traces are counted but not queued again.
     """
-    # Validate all traces
-    traces_data = [trace.model_dump(mode='json') for trace in batch.traces]
-    valid_traces, validation_errors = validate_batch(traces_data)
+    body = await request.body()
+    workspaces = Counter()
+    keys = []
+
+    def serialize(trace: TraceInput):
+        workspaces[trace.workspace_id] += 1
+        keys.append(TraceDeduplicator.key(trace))
+        return publisher.serialize(trace)
+
+    try:
+        payloads, validation_errors = validate_batch_json(body, serialize=serialize)
+    except BatchFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid batch: {str(e)}"
+        )
+
+    _check_admission(workspaces)
 
     # Publish valid traces
     published_count = 0
+    duplicates = 0
     publish_errors = []
 
-    if valid_traces:
+    if payloads:
         try:
-            valid_traces_dicts = [t.model_dump(mode='json') for t in valid_traces]
-            publisher.publish_batch(valid_traces_dicts)
-            published_count = len(valid_traces)
+            published_count, duplicates = await _publish_new(keys, payloads)
         except Exception as e:
             logger.error(f"Failed to publish batch: {str(e)}")
             publish_errors.append({
@@ -73,29 +151,230 @@ async def ingest_batch(batch: BatchTraceInput):
     return BatchTraceResponse(
         accepted=published_count,
         rejected=rejected_count,
+        duplicates=duplicates,
         errors=all_errors
     )
 
 
-@router.post("/traces/otlp", status_code=status.HTTP_202_ACCEPTED)
+@router.post("/traces/bulk", response_model=BulkTraceResponse, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_bulk(request: Request):
+    """
+    Stream newline-delimited traces (NDJSON) for backfills and log replay
+
+    The body may be sent uncompressed or with Content-Encoding gzip or zstd,
+    and has no trace count limit. It is decompressed, split and validated
+    incrementally as it arrives, and valid traces are published in pipelined
+    chunks while the next chunk is being decoded, so memory stays bounded
+    by two chunks. Invalid lines are counted and the first errors are
+    returned with their line numbers. Duplicates of recently accepted
+    traces are counted but not queued again. A received chunk that
+    decompresses to more than ``bulk_max_inflated_bytes`` is rejected
+    with 413.
+
+    Bulk loads are low priority: they are rejected (429) up front while
+    any shard's backlog is above the high watermark.
+    """
+    retry_after = admission.under_pressure()
+    if retry_after is not None:
+        raise _backlog_too_high(retry_after)
+
+    try:
+        stream = NDJSONStream(
+            request.headers.get("content-encoding", "identity"),
+            settings.bulk_max_line_bytes,
+            settings.bulk_max_inflated_bytes
+        )
+    except BulkDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+    accepted = 0
+    rejected = 0
+    duplicates = 0
+    errors = []
+    chunk = []
+    keys = []
+    in_flight: Optional[asyncio.Task] = None  # Publish of the previous chunk
+
+    async def handle_lines(lines):
+        nonlocal rejected
+        for line_number, line in lines:
+            try:
+                if line is None:
+                    raise ValueError(f"Line exceeds {settings.bulk_max_line_bytes} bytes")
+                trace = TraceInput.model_validate_json(line)
+            except ValueError as e:  # includes pydantic ValidationError
+                rejected += 1
+                if len(errors) < settings.bulk_max_errors:
+                    errors.append({"line": line_number, "error": str(e)})
+                continue
+
+            chunk.append(publisher.serialize(trace))
+            keys.append(TraceDeduplicator.key(trace))
+            if len(chunk) >= settings.bulk_publish_chunk_size:
+                await publish_chunk()
+
+    async def publish_chunk():
+        nonlocal accepted, duplicates, chunk, keys, in_flight
+        if in_flight is not None:
+            published, skipped = await in_flight
+            accepted += published
+            duplicates += skipped
+            in_flight = None
+        if chunk:
+            in_flight = asyncio.create_task(_publish_new(keys, chunk))
+            chunk = []
+            keys = []
+
+    try:
+        async for body_chunk in request.stream():
+            await handle_lines(stream.feed(body_chunk))
+
+        await handle_lines(stream.close())
+        await publish_chunk()  # Publish the final partial chunk...
+        await publish_chunk()  # ...and wait for it
+
+    except BulkDecodeError as e:
+        if in_flight is not None:
+            published = (await asyncio.gather(in_flight, return_exceptions=True))[0]
+            if isinstance(published, tuple):
+                accepted += published[0]
+        raise HTTPException(
+            status_code=(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if isinstance(e, BulkBodyTooLarge)
+                else status.HTTP_400_BAD_REQUEST
+            ),
+            detail=f"{str(e)} (at line {stream.line_number}, {accepted} traces already queued)"
+        )
+    except Exception as e:
+        if in_flight is not None:
+            in_flight.cancel()
+        logger.error(f"Failed to publish bulk traces: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Failed to queue traces after {accepted} accepted: {str(e)}"
+        )
+
+    logger.info(
+        f"Bulk ingest: {stream.line_number} lines, {accepted} accepted, "
+        f"{rejected} rejected, {duplicates} duplicates"
+    )
+    return BulkTraceResponse(
+        lines=stream.line_number,
+        accepted=accepted,
+        rejected=rejected,
+        duplicates=duplicates,
+        errors=errors,
+        errors_truncated=rejected > len(errors)
+    )
+
+
+@router.post("/traces/otlp")
 async def ingest_otlp(
-    content_type: str = Header(...),
-    data: bytes = None
+    request: Request,
+    x_workspace_id: Optional[str] = Header(None, alias="X-Workspace-ID")
 ):
     """
     OTLP (OpenTelemetry Protocol) endpoint
 
-    Accepts traces in OTLP format (protobuf or JSON).
-    This is a basic implementation for Phase 1.
+    Accepts an OTLP/HTTP ExportTraceServiceRequest in protobuf or JSON,
+    optionally gzip- or zstd-compressed. The body is decompressed as it is
+    received, and rejected with 413 once it exceeds ``otlp_max_body_bytes``
+    (so a decompression bomb cannot exhaust memory). Spans carrying GenAI semantic-convention
+    attributes are converted to traces and queued in pipelined chunks as
+    they are decoded; other spans are ignored.
+
+    The workspace is taken from the X-Workspace-ID header, or from the
+    ``workspace.id`` resource attribute when the header is absent.
+
+    Each chunk is admitted before it is published; if the backlog is too
+    high before anything was queued the export is rejected with 429 and
+    Retry-After, which OTLP exporters retry. Once part of an export is
+    queued the remaining spans are reported as rejected instead, so a
+    retry does not duplicate them. Spans of a retried export that were
+    already queued are skipped by duplicate suppression.
     """
-    # Basic OTLP support - just acknowledge for now
-    # Full implementation would parse OTLP format and convert to our schema
-    logger.info(f"Received OTLP request with content-type: {content_type}")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in (CONTENT_TYPE_PROTOBUF, CONTENT_TYPE_JSON):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content type: {content_type}. Use {CONTENT_TYPE_PROTOBUF} or {CONTENT_TYPE_JSON}"
+        )
+
+    try:
+        body = await read_body(
+            request.stream(), request.headers.get("content-encoding", "identity"), settings.otlp_max_body_bytes
+        )
+    except BulkBodyTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BulkDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid OTLP request: {str(e)}")
+
+    try:
+        spans = iter_spans(body, content_type)
+
+        accepted = 0
+        rejected = 0
+        duplicates = 0
+        first_error = ""
+        chunk = []
+        keys = []
+        workspaces = Counter()
+
+        async def publish_chunk():
+            nonlocal accepted, rejected, duplicates, first_error, chunk, keys
+            retry_after = admission.admit(workspaces)
+            if retry_after is not None and accepted == 0:
+                raise _backlog_too_high(retry_after)
+            if retry_after is not None:
+                rejected += len(chunk)
+                first_error = first_error or "processing backlog is too high, retry later"
+            else:
+                published, skipped = await _publish_new(keys, chunk)
+                accepted += published
+                duplicates += skipped
+            chunk = []
+            keys = []
+            workspaces.clear()
+
+        for span in spans:
+            trace_data = span_to_trace(span, x_workspace_id)
+            if trace_data is None:
+                continue
+
+            try:
+                trace = TraceInput.model_validate(trace_data)
+            except ValidationError as e:
+                rejected += 1
+                first_error = first_error or f"span {span.span_id}: {str(e)}"
+                continue
+
+            chunk.append(publisher.serialize(trace))
+            keys.append(TraceDeduplicator.key(trace))
+            workspaces[trace.workspace_id] += 1
+            if len(chunk) >= settings.otlp_publish_chunk_size:
+                await publish_chunk()
+
+        if chunk:
+            await publish_chunk()
+
+    except HTTPException:
+        raise
+    except OTLPDecodeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid OTLP request: {str(e)}"
+        )
+    except Exception as e:
+        # OTLP clients retry on 503
+        logger.error(f"Failed to ingest OTLP export: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Failed to queue traces: {str(e)}"
+        )
 
-    return {
-        "status": "accepted",
-        "message": "OTLP ingestion is in development. Use /api/v1/traces for now."
-    }
+    logger.info(f"OTLP export: {accepted} spans queued, {rejected} rejected, {duplicates} duplicates")
+    content, media_type = export_response(content_type, rejected, first_error)
+    return Response(content=content, media_type=media_type)
 
 
 @router.get("/health")
@@ -103,11 +382,12 @@ async def health_check():
     """Health check endpoint"""
     # Check Redis connection
     try:
-        stream_length = publisher.get_stream_length()
+        stream_length = await publisher.get_stream_length()
         return {
             "status": "healthy",
             "service": "ingestion",
-            "stream_length": stream_length
+            "stream_length": stream_length,
+            "dedup": await deduplicator.get_stats()
         }
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,139 @@
+"""Per-workspace head sampling of ingested traces"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Optional
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+RULES_KEY = "traces:sampling:rules"  # Hash: workspace_id (or "default") -> JSON rule
+
+
+def sample_point(stage: str, trace_id: str) -> float:
+    """Deterministic position of a trace in [0, 1) for a sampling stage"""
+    digest = hashlib.blake2b(f"{stage}:{trace_id}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+class SamplingRule:
+    """
+    Sampling policy of one workspace
+
+    Errors, timeouts, traces carrying one of ``keep_tags`` and traces
+    costing at least ``min_cost_usd`` are always kept in full. Other traces
+    are kept with probability ``head_rate`` at ingestion and ``tail_rate``
+    at processing, where latency outliers above the workspace's
+    ``latency_percentile`` are kept as well. Keep in sync with
+    processing/app/sampling.py.
+    """
+
+    __slots__ = ("head_rate", "tail_rate", "latency_percentile", "keep_tags", "min_cost_usd")
+
+    def __init__(
+        self,
+        head_rate: float = 1.0,
+        tail_rate: float = 1.0,
+        latency_percentile: Optional[float] = None,
+        keep_tags: tuple = (),
+        min_cost_usd: Optional[float] = None
+    ):
+        self.head_rate = head_rate
+        self.tail_rate = tail_rate
+        self.latency_percentile = latency_percentile
+        self.keep_tags = frozenset(keep_tags)
+        self.min_cost_usd = min_cost_usd
+
+    @classmethod
+    def from_dict(cls, data: dict, default: Optional["SamplingRule"] = None) -> "SamplingRule":
+        """Build a rule from its JSON form, falling back to ``default`` for missing fields"""
+        base = {name: getattr(default, name) for name in cls.__slots__} if default else {}
+        base.update({name: data[name] for name in cls.__slots__ if name in data})
+        return cls(**base)
+
+    def always_keep(self, trace_data: dict) -> bool:
+        """Whether a trace must be kept regardless of the sample rate"""
+        if trace_data.get('status', 'success') != 'success':
+            return True
+        if self.keep_tags and self.keep_tags.intersection(trace_data.get('tags') or ()):
+            return True
+        cost = trace_data.get('cost_usd')
+        return self.min_cost_usd is not None and cost is not None and cost >= self.min_cost_usd
+
+
+class HeadSampler:
+    """
+    Head sampling at ingestion
+
+    Traces that are not sampled are still published, as summaries: the
+    input, output and metadata are dropped and ``sampled`` is set to False,
+    so processing counts them in the sampled-out rollup without storing
+    them. The decision is deterministic per trace_id, so retries agree.
+    Rules are refreshed from Redis in the background.
+    """
+
+    def __init__(self, client):
+        settings = get_settings()
+        self.client = client
+        self.refresh_interval = settings.sampling_rules_refresh_s
+        self.default = SamplingRule(head_rate=settings.sampling_head_rate)
+        self.rules: dict[str, SamplingRule] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start refreshing rules"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop refreshing rules"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to refresh sampling rules: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def refresh(self):
+        """Load per-workspace rules from Redis"""
+        raw = await self.client.hgetall(RULES_KEY)
+        rules = {
+            (k.decode('utf-8') if isinstance(k, bytes) else k): json.loads(v)
+            for k, v in raw.items()
+        }
+        settings = get_settings()
+        default = SamplingRule.from_dict(
+            rules.pop("default", {}), SamplingRule(head_rate=settings.sampling_head_rate)
+        )
+        self.default = default
+        self.rules = {workspace_id: SamplingRule.from_dict(rule, default) for workspace_id, rule in rules.items()}
+
+    def apply(self, trace_data: dict) -> bool:
+        """
+        Decide whether a JSON-compatible trace dictionary is kept in full
+
+        Sampled-out traces are reduced to summaries in place.
+
+        Returns:
+            bool: True if the trace is kept
+        """
+        rule = self.rules.get(str(trace_data.get('workspace_id')), self.default)
+        if (
+            rule.head_rate >= 1
+            or rule.always_keep(trace_data)
+            or sample_point("head", trace_data.get('trace_id', '')) < rule.head_rate
+        ):
+            return True
+
+        trace_data['input'] = ''
+        trace_data['output'] = ''
+        trace_data['metadata'] = {}
+        trace_data['sampled'] = False
+        return False
@@ -0,0 +1,28 @@
+"""Workspace sharding of the traces:pending stream
+
+Traces are routed to ``traces:pending:{n}`` by a stable hash of their
+workspace_id, so every trace of a workspace lands on the same shard and
+keeps its order. With a single shard the original ``traces:pending`` key is
+used unchanged. Keep in sync with processing/app/sharding.py.
+"""
+import zlib
+from typing import Optional
+
+STREAM_BASE = "traces:pending"
+
+
+def shard_for(workspace_id: Optional[str], shards: int) -> int:
+    """Shard index for a workspace (CRC32 of its id modulo the shard count)"""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(str(workspace_id).encode('utf-8')) % shards
+
+
+def shard_stream(shard: int, shards: int, base: str = STREAM_BASE) -> str:
+    """Stream key of a shard"""
+    return base if shards <= 1 else f"{base}:{shard}"
+
+
+def all_streams(shards: int, base: str = STREAM_BASE) -> list[str]:
+    """Stream keys of every shard"""
+    return [shard_stream(shard, shards, base) for shard in range(max(shards, 1))]
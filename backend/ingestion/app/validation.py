@@ -1,4 +1,6 @@
 """Input validation utilities"""
+import json
+from typing import Any, Callable
 from pydantic import ValidationError
 from .models import TraceInput, BatchTraceInput
 import logging
@@ -6,6 +8,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class BatchFormatError(ValueError):
+    """Raised when a batch request body is not a valid batch envelope"""
+
+
 def validate_trace(trace_data: dict) -> tuple[bool, TraceInput, str]:
     """
     Validate a single trace
@@ -53,3 +59,58 @@ def validate_batch(traces: list[dict]) -> tuple[list[TraceInput], list[dict]]:
             })
 
     return valid_traces, errors
+
+
+def validate_batch_json(
+    body: bytes,
+    serialize: Callable[[TraceInput], Any] = TraceInput.model_dump_json
+) -> tuple[list, list[dict]]:
+    """
+    Validate a raw batch request body and serialize the valid traces
+
+    The whole body is parsed and validated once in pydantic-core. Only when
+    that fails is the body re-parsed item by item, so that valid traces are
+    still accepted and each invalid one is reported by index.
+
+    Args:
+        body: Raw JSON request body ({"traces": [...]})
+        serialize: Serializer for each valid trace (the publisher's codec)
+
+    Returns:
+        tuple: (payloads, errors)
+            - payloads: Each valid trace serialized, ready to publish
+            - errors: List of error dicts with index and error message
+
+    Raises:
+        BatchFormatError: If the body is not a valid batch envelope
+    """
+    try:
+        batch = BatchTraceInput.model_validate_json(body)
+        return [serialize(trace) for trace in batch.traces], []
+    except ValidationError as e:
+        # Errors inside individual traces are reported per index below;
+        # anything else (bad JSON, missing list, size limits) rejects the batch
+        envelope_errors = [
+            err for err in e.errors()
+            if len(err['loc']) < 2 or err['loc'][0] != 'traces' or not isinstance(err['loc'][1], int)
+        ]
+        if envelope_errors:
+            raise BatchFormatError(str(e)) from e
+
+    traces = json.loads(body)['traces']
+    payloads = []
+    errors = []
+
+    for index, trace_data in enumerate(traces):
+        try:
+            payloads.append(serialize(TraceInput.model_validate(trace_data)))
+        except ValidationError as e:
+            error_msg = str(e)
+            logger.warning(f"Trace validation failed: {error_msg}")
+            errors.append({
+                "index": index,
+                "trace_id": trace_data.get("trace_id", "unknown") if isinstance(trace_data, dict) else "unknown",
+                "error": error_msg
+            })
+
+    return payloads, errors
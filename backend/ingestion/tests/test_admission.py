@@ -0,0 +1,156 @@
+"""Tests for lag-aware admission control"""
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from app.admission import AdmissionController
+from app.main import app
+
+WORKSPACE_A = "550e8400-e29b-41d4-a716-446655440000"
+WORKSPACE_B = "660e8400-e29b-41d4-a716-446655440000"
+
+
+class FakePipeline:
+    """Answers XLEN and XINFO GROUPS from the fake's shard state"""
+
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def xlen(self, name):
+        self.results.append(self.client.lengths[name])
+
+    def xinfo_groups(self, name):
+        self.results.append([self.client.groups[name]] if name in self.client.groups else [])
+
+    async def execute(self, raise_on_error=True):
+        return self.results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.lengths = {"traces:pending": 0}
+        self.groups = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePublisher:
+    def __init__(self):
+        self.client = FakeRedis()
+        self.streams = ["traces:pending"]
+        self.shards = 1
+        self.maxlen = 10000
+
+
+def set_backlog(publisher, lag, entries_read, pending=0):
+    publisher.client.lengths["traces:pending"] = lag + pending
+    publisher.client.groups["traces:pending"] = {
+        "name": b"processors", "lag": lag, "pending": pending, "entries-read": entries_read
+    }
+
+
+@pytest.fixture
+def publisher():
+    return FakePublisher()
+
+
+class TestAdmissionController:
+    """Test watermarks, fairness and Retry-After"""
+
+    @pytest.mark.asyncio
+    async def test_admits_below_high_watermark(self, publisher):
+        """A healthy backlog admits everything"""
+        controller = AdmissionController(publisher)
+        set_backlog(publisher, lag=100, entries_read=0)
+        await controller.sample()
+
+        assert controller.admit({WORKSPACE_A: 10000}) is None
+
+    @pytest.mark.asyncio
+    async def test_fails_open_without_sample(self, publisher):
+        """No sample yet means no throttling"""
+        controller = AdmissionController(publisher)
+
+        assert controller.admit({WORKSPACE_A: 1}) is None
+        assert controller.under_pressure() is None
+
+    @pytest.mark.asyncio
+    async def test_rejects_above_critical_with_retry_after(self, publisher):
+        """Retry-After is the time to drain back below the high watermark"""
+        controller = AdmissionController(publisher)
+        set_backlog(publisher, lag=9000, entries_read=0, pending=500)
+        await controller.sample()
+        # 1000 entries read since the last sample, one second ago
+        controller.sampled_at -= 1.0
+        set_backlog(publisher, lag=9000, entries_read=1000, pending=500)
+        await controller.sample()
+
+        retry_after = controller.admit({WORKSPACE_A: 1})
+
+        # backlog 9500, high watermark 5000, drain ~1000/s
+        assert 4 <= retry_after <= 5
+        assert controller.under_pressure() == retry_after
+
+    @pytest.mark.asyncio
+    async def test_fair_share_throttles_hot_workspace(self, publisher):
+        """Between the watermarks a hot workspace cannot starve a quiet one"""
+        controller = AdmissionController(publisher)
+        controller.min_fair_share = 10
+        set_backlog(publisher, lag=6000, entries_read=0)
+        await controller.sample()
+
+        assert controller.admit({WORKSPACE_A: 10}) is None
+        assert controller.admit({WORKSPACE_A: 1}) is not None
+        assert controller.admit({WORKSPACE_B: 5}) is None
+
+    @pytest.mark.asyncio
+    async def test_batch_is_all_or_nothing(self, publisher):
+        """A rejected batch does not count against the admitted workspaces"""
+        controller = AdmissionController(publisher)
+        controller.min_fair_share = 10
+        set_backlog(publisher, lag=6000, entries_read=0)
+        await controller.sample()
+
+        assert controller.admit({WORKSPACE_A: 5, WORKSPACE_B: 50}) is not None
+        assert controller.admit({WORKSPACE_A: 10}) is None
+
+
+class TestAdmissionEndpoints:
+    """Test 429 responses"""
+
+    def test_trace_rejected_with_retry_after(self):
+        """Rejected traces get 429 and a Retry-After header"""
+        trace = {
+            "trace_id": "trace_1",
+            "agent_id": "agent_001",
+            "workspace_id": WORKSPACE_A,
+            "timestamp": "2024-01-01T12:00:00Z",
+            "input": "question",
+            "output": "answer",
+            "latency_ms": 100,
+            "model": "gpt-4",
+            "model_provider": "openai"
+        }
+        with patch('app.routes.admission') as admission, patch('app.routes.publisher') as publisher:
+            admission.admit.return_value = 7
+            response = TestClient(app).post("/api/v1/traces", json=trace)
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+        assert not publisher.publish_trace.called
+
+    def test_bulk_rejected_under_pressure(self):
+        """Bulk loads are turned away as soon as any shard is backlogged"""
+        with patch('app.routes.admission') as admission:
+            admission.under_pressure.return_value = 12
+            response = TestClient(app).post("/api/v1/traces/bulk", content=b"{}\n")
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "12"
@@ -0,0 +1,190 @@
+"""Tests for streaming NDJSON bulk ingestion"""
+import gzip
+import json
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from app.main import app
+from app.bulk import NDJSONStream, BulkDecodeError, BulkBodyTooLarge, PIECE_BYTES, read_body
+
+
+@pytest.fixture
+def client():
+    """Create test client"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def mock_publisher():
+    """Patch the module-level publisher"""
+    with patch('app.routes.publisher') as mock, patch('app.routes.deduplicator.enabled', False):
+        mock.publish_encoded = AsyncMock(side_effect=lambda payloads: [f"{i}-0" for i in range(len(payloads))])
+        mock.serialize.side_effect = lambda trace: trace.model_dump_json()
+        yield mock
+
+
+def make_trace(i: int) -> dict:
+    return {
+        "trace_id": f"trace_{i}",
+        "agent_id": "agent_001",
+        "workspace_id": "550e8400-e29b-41d4-a716-446655440000",
+        "timestamp": "2024-01-01T12:00:00Z",
+        "input": "question",
+        "output": "answer",
+        "latency_ms": 100 + i,
+        "model": "gpt-4",
+        "model_provider": "openai"
+    }
+
+
+def ndjson(traces: list) -> bytes:
+    return b"".join(json.dumps(t).encode() + b"\n" for t in traces)
+
+
+class TestNDJSONStream:
+    """Test incremental decoding"""
+
+    def test_lines_split_across_chunks(self):
+        """Lines spanning chunk boundaries are reassembled"""
+        stream = NDJSONStream()
+        body = b'{"a": 1}\n{"b": 2}\n\n{"c": 3}'
+
+        lines = []
+        for i in range(0, len(body), 3):
+            lines.extend(stream.feed(body[i:i + 3]))
+        lines.extend(stream.close())
+
+        assert lines == [(1, b'{"a": 1}'), (2, b'{"b": 2}'), (4, b'{"c": 3}')]
+
+    def test_concatenated_gzip_members(self):
+        """Concatenated gzip files decode as one stream"""
+        stream = NDJSONStream("gzip")
+        body = gzip.compress(b"one\n") + gzip.compress(b"two\n")
+
+        lines = list(stream.feed(body)) + list(stream.close())
+
+        assert [line for _, line in lines] == [b"one", b"two"]
+
+    def test_overlong_line_is_flagged(self):
+        """Lines above the limit are discarded and yielded as None"""
+        stream = NDJSONStream(max_line_bytes=8)
+
+        lines = list(stream.feed(b"short\n" + b"x" * 20 + b"\nok\n"))
+
+        assert lines == [(1, b"short"), (2, None), (3, b"ok")]
+
+    def test_gzip_output_is_split_as_it_is_produced(self):
+        """A highly compressed chunk is decompressed piece by piece, not all at once"""
+        stream = NDJSONStream("gzip", max_line_bytes=16)
+        decompressor = stream._decompressor
+
+        pieces = list(decompressor.decompress(gzip.compress(b"x\n" * (4 * PIECE_BYTES))))
+
+        assert max(len(piece) for piece in pieces) <= PIECE_BYTES
+        assert sum(len(piece) for piece in pieces) == 8 * PIECE_BYTES
+
+    @pytest.mark.parametrize("encoding, compress", [
+        ("gzip", gzip.compress),
+        ("zstd", lambda data: zstandard.ZstdCompressor().compress(data))
+    ])
+    def test_decompression_bomb_is_rejected(self, encoding, compress):
+        """A chunk inflating beyond the limit raises instead of being buffered"""
+        stream = NDJSONStream(encoding, max_inflated_bytes=1024 * 1024)
+
+        with pytest.raises(BulkBodyTooLarge):
+            list(stream.feed(compress(b"\n" * (16 * 1024 * 1024))))
+
+    def test_unsupported_encoding(self):
+        """Unknown encodings are rejected up front"""
+        with pytest.raises(BulkDecodeError):
+            NDJSONStream("br")
+
+
+async def chunked(data: bytes, size: int = 1000):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestReadBody:
+    """Test whole-body reads with bounded decompression"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("encoding, compress", [
+        ("identity", lambda data: data),
+        ("gzip", gzip.compress),
+        ("zstd", lambda data: zstandard.ZstdCompressor().compress(data))
+    ])
+    async def test_body_is_decompressed_across_chunks(self, encoding, compress):
+        """Chunks are decompressed as they arrive into the original body"""
+        data = b"span " * 10000
+
+        assert await read_body(chunked(compress(data)), encoding) == data
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("encoding, compress", [
+        ("identity", lambda data: data),
+        ("gzip", gzip.compress),
+        ("zstd", lambda data: zstandard.ZstdCompressor().compress(data))
+    ])
+    async def test_body_over_the_limit_is_rejected(self, encoding, compress):
+        """Decompression stops once the output exceeds the limit"""
+        with pytest.raises(BulkBodyTooLarge):
+            await read_body(chunked(compress(b" " * (4 * 1024 * 1024)), 64 * 1024), encoding, 1024 * 1024)
+
+
+class TestBulkEndpoint:
+    """Test the bulk endpoint"""
+
+    def test_bulk_ingest_is_not_capped(self, client, mock_publisher):
+        """More than 100 traces are accepted and published in chunks"""
+        body = ndjson([make_trace(i) for i in range(2500)])
+
+        response = client.post("/api/v1/traces/bulk", content=body)
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data["accepted"] == 2500
+        assert data["rejected"] == 0
+        chunk_sizes = [len(call[0][0]) for call in mock_publisher.publish_encoded.call_args_list]
+        assert sum(chunk_sizes) == 2500
+        assert max(chunk_sizes) < 2500
+
+    def test_bulk_ingest_zstd_with_line_errors(self, client, mock_publisher):
+        """Invalid lines are reported by line number"""
+        bad = dict(make_trace(1), latency_ms=-5)
+        body = ndjson([make_trace(0), bad]) + b"not json\n" + ndjson([make_trace(2)])
+
+        response = client.post(
+            "/api/v1/traces/bulk",
+            content=zstandard.ZstdCompressor().compress(body),
+            headers={"Content-Encoding": "zstd"}
+        )
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data["lines"] == 4
+        assert data["accepted"] == 2
+        assert data["rejected"] == 2
+        assert [e["line"] for e in data["errors"]] == [2, 3]
+
+    def test_bulk_ingest_corrupt_body(self, client, mock_publisher):
+        """A body that fails to decompress returns 400"""
+        response = client.post(
+            "/api/v1/traces/bulk",
+            content=b"definitely not gzip",
+            headers={"Content-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 400
+
+    def test_bulk_ingest_decompression_bomb(self, client, mock_publisher):
+        """A body chunk inflating beyond the limit returns 413"""
+        with patch("app.routes.settings.bulk_max_inflated_bytes", 1024 * 1024):
+            response = client.post(
+                "/api/v1/traces/bulk",
+                content=zstandard.ZstdCompressor().compress(b" " * (16 * 1024 * 1024)),
+                headers={"Content-Encoding": "zstd"}
+            )
+
+        assert response.status_code == 413
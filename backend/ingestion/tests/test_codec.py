@@ -0,0 +1,49 @@
+"""Tests for stream entry encoding"""
+import json
+import msgpack
+import pytest
+from app.codec import TraceCodec
+from app.models import TraceInput
+
+
+@pytest.fixture
+def trace():
+    """Validated trace with large input/output"""
+    return TraceInput(
+        trace_id="trace_123",
+        agent_id="agent_001",
+        workspace_id="550e8400-e29b-41d4-a716-446655440000",
+        timestamp="2024-01-01T12:00:00Z",
+        input="question " * 500,
+        output="answer " * 500,
+        latency_ms=1500,
+        model="gpt-4",
+        model_provider="openai"
+    )
+
+
+class TestTraceCodec:
+    """Test the versioned stream envelope"""
+
+    def test_msgpack_entry_has_encoding_header(self, trace):
+        """msgpack entries are tagged and round-trip to the JSON view"""
+        codec = TraceCodec("msgpack")
+
+        fields = codec.entry(codec.dumps(trace.model_dump(mode='json')))
+
+        assert fields["enc"] == "msgpack/1"
+        assert msgpack.unpackb(fields["data"]) == json.loads(trace.model_dump_json())
+
+    def test_json_encoding(self, trace):
+        """The json encoding keeps the original payload format"""
+        codec = TraceCodec("json")
+
+        fields = codec.entry(codec.dumps({"trace_id": "a"}))
+
+        assert fields["enc"] == "json/1"
+        assert json.loads(fields["data"]) == {"trace_id": "a"}
+
+    def test_unknown_encoding(self):
+        """Unsupported encodings fail at startup"""
+        with pytest.raises(ValueError):
+            TraceCodec("avro")
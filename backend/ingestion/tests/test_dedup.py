@@ -0,0 +1,123 @@
+"""Tests for duplicate suppression"""
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, Mock, patch
+from app.dedup import TraceDeduplicator, NEW, DUPLICATE, BORDERLINE
+from app.main import app
+from app.models import TraceInput
+
+
+def make_trace(trace_id="trace_1", timestamp="2024-01-01T12:00:00Z") -> dict:
+    return {
+        "trace_id": trace_id,
+        "agent_id": "agent_001",
+        "workspace_id": "550e8400-e29b-41d4-a716-446655440000",
+        "timestamp": timestamp,
+        "input": "question",
+        "output": "answer",
+        "latency_ms": 100,
+        "model": "gpt-4",
+        "model_provider": "openai"
+    }
+
+
+@pytest.fixture
+def deduplicator():
+    """Deduplicator whose Redis script returns preset verdicts"""
+    client = Mock()
+    client.register_script.return_value = AsyncMock()
+    client.delete = AsyncMock()
+    return TraceDeduplicator(client)
+
+
+class TestTraceDeduplicator:
+    """Test keys, verdict handling and failure modes"""
+
+    def test_key_matches_writer_conflict_target(self):
+        """Keys are equal for the same (trace_id, timestamp) only"""
+        key = TraceDeduplicator.key(TraceInput(**make_trace()))
+
+        assert key == TraceDeduplicator.key(TraceInput(**make_trace(timestamp="2024-01-01T12:00:00+00:00")))
+        assert key != TraceDeduplicator.key(TraceInput(**make_trace(timestamp="2024-01-01T12:00:01Z")))
+        assert key != TraceDeduplicator.key(TraceInput(**make_trace(trace_id="trace_2")))
+
+    def test_bloom_offsets(self, deduplicator):
+        """Each key maps to the configured number of bits within the filter"""
+        offsets = deduplicator._offsets(TraceDeduplicator.key(TraceInput(**make_trace())))
+
+        assert len(offsets) == deduplicator.hashes
+        assert all(0 <= offset < deduplicator.bloom_bits for offset in offsets)
+
+    @pytest.mark.asyncio
+    async def test_confirmed_duplicates_are_dropped(self, deduplicator):
+        """Exact duplicates are dropped; borderline hits are kept by default"""
+        deduplicator._script.return_value = [NEW, DUPLICATE, BORDERLINE]
+
+        payloads, keys, duplicates = await deduplicator.filter([b"a", b"b", b"c"], ["A", "B", "C"])
+
+        assert payloads == ["A", "C"]
+        assert keys == [b"a", b"c"]
+        assert duplicates == 1
+        script_keys = deduplicator._script.call_args.kwargs["keys"]
+        assert script_keys[2] == "traces:dedup:stats"
+        assert len(script_keys) == 6
+
+    @pytest.mark.asyncio
+    async def test_repeats_within_a_list_are_duplicates(self, deduplicator):
+        """Repeated keys are checked once and their repeats dropped"""
+        deduplicator._script.return_value = [NEW, NEW]
+
+        payloads, _, duplicates = await deduplicator.filter([b"a", b"b", b"a"], ["A", "B", "A2"])
+
+        assert payloads == ["A", "B"]
+        assert duplicates == 1
+        assert len(deduplicator._script.call_args.kwargs["keys"]) == 5
+
+    @pytest.mark.asyncio
+    async def test_borderline_reject_policy(self, deduplicator):
+        """Borderline hits can be dropped too"""
+        deduplicator.drop_borderline = True
+        deduplicator._script.return_value = [NEW, BORDERLINE]
+
+        payloads, _, duplicates = await deduplicator.filter([b"a", b"b"], ["A", "B"])
+
+        assert payloads == ["A"]
+        assert duplicates == 1
+
+    @pytest.mark.asyncio
+    async def test_fails_open(self, deduplicator):
+        """A Redis failure publishes everything"""
+        deduplicator._script.side_effect = ConnectionError("Redis connection failed")
+
+        payloads, _, duplicates = await deduplicator.filter([b"a"], ["A"])
+
+        assert payloads == ["A"]
+        assert duplicates == 0
+
+
+class TestDedupEndpoints:
+    """Test duplicate handling in the API"""
+
+    def test_duplicate_trace_is_not_queued(self):
+        """A retried trace is acknowledged as a duplicate by the coalesced publish"""
+        with patch('app.routes.publisher') as publisher:
+            publisher.publish_trace = AsyncMock(return_value=None)
+            response = TestClient(app).post("/api/v1/traces", json=make_trace())
+
+        assert response.status_code == 202
+        assert response.json()["status"] == "duplicate"
+        assert publisher.publish_trace.call_args.kwargs["dedup_key"] == TraceDeduplicator.key(
+            TraceInput(**make_trace())
+        )
+
+    def test_failed_publish_forgets_keys(self):
+        """Keys of traces that were not queued are released for the retry"""
+        body = {"traces": [make_trace("a"), make_trace("b")]}
+        with patch('app.routes.deduplicator') as dedup, patch('app.routes.publisher') as publisher:
+            dedup.filter = AsyncMock(side_effect=lambda keys, payloads: (payloads, keys, 0))
+            dedup.forget = AsyncMock()
+            publisher.publish_encoded = AsyncMock(side_effect=ConnectionError("Redis connection failed"))
+            response = TestClient(app).post("/api/v1/traces/batch", json=body)
+
+        assert response.json()["accepted"] == 0
+        assert len(dedup.forget.call_args[0][0]) == 2
@@ -0,0 +1,220 @@
+"""Tests for OTLP/HTTP ingestion"""
+import gzip
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse
+)
+from app.main import app
+from app.otlp import iter_spans_json, iter_spans_protobuf, span_to_trace
+
+WORKSPACE_ID = "550e8400-e29b-41d4-a716-446655440000"
+TRACE_ID = "5b8efff798038103d269b633813fc60c"
+SPAN_ID = "eee19b7ec3c1b174"
+
+
+@pytest.fixture
+def client():
+    """Create test client"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def mock_publisher():
+    """Patch the module-level publisher"""
+    with patch('app.routes.publisher') as mock, patch('app.routes.deduplicator.enabled', False):
+        mock.publish_encoded = AsyncMock(side_effect=lambda payloads: [f"{i}-0" for i in range(len(payloads))])
+        mock.serialize.side_effect = lambda trace: trace.model_dump_json()
+        yield mock
+
+
+def _attr(key, **value):
+    return {"key": key, "value": value}
+
+
+@pytest.fixture
+def otlp_json():
+    """OTLP/JSON export with one GenAI span and one plain span"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                _attr("service.name", stringValue="support-agent"),
+                _attr("workspace.id", stringValue=WORKSPACE_ID),
+            ]},
+            "scopeSpans": [{
+                "spans": [
+                    {
+                        "traceId": TRACE_ID,
+                        "spanId": SPAN_ID,
+                        "name": "chat gpt-4",
+                        "startTimeUnixNano": "1704110400000000000",
+                        "endTimeUnixNano": "1704110400250000000",
+                        "status": {"code": 2, "message": "rate limited"},
+                        "attributes": [
+                            _attr("gen_ai.system", stringValue="openai"),
+                            _attr("gen_ai.request.model", stringValue="gpt-4"),
+                            _attr("gen_ai.usage.input_tokens", intValue="100"),
+                            _attr("gen_ai.usage.output_tokens", intValue="50"),
+                            _attr("gen_ai.prompt.0.content", stringValue="Hello"),
+                            _attr("gen_ai.completion.0.content", stringValue="Hi there"),
+                        ]
+                    },
+                    {
+                        "traceId": TRACE_ID,
+                        "spanId": "aaaaaaaaaaaaaaaa",
+                        "name": "http request",
+                        "startTimeUnixNano": "1704110400000000000",
+                        "endTimeUnixNano": "1704110400100000000",
+                        "attributes": [_attr("http.method", stringValue="GET")]
+                    }
+                ]
+            }]
+        }]
+    }
+
+
+class TestSpanConversion:
+    """Test GenAI span mapping"""
+
+    def test_json_genai_span_maps_to_trace(self, otlp_json):
+        """GenAI attributes map onto the TraceInput schema"""
+        spans = list(iter_spans_json(json.dumps(otlp_json).encode()))
+        trace = span_to_trace(spans[0])
+
+        assert trace["trace_id"] == f"{TRACE_ID}-{SPAN_ID}"
+        assert trace["workspace_id"] == WORKSPACE_ID
+        assert trace["agent_id"] == "support-agent"
+        assert trace["model"] == "gpt-4"
+        assert trace["model_provider"] == "openai"
+        assert trace["tokens_input"] == 100
+        assert trace["tokens_output"] == 50
+        assert trace["latency_ms"] == 250
+        assert trace["status"] == "error"
+        assert trace["input"] == "Hello"
+        assert trace["output"] == "Hi there"
+
+    def test_non_genai_span_is_skipped(self, otlp_json):
+        """Spans without a model attribute are not converted"""
+        spans = list(iter_spans_json(json.dumps(otlp_json).encode()))
+        assert span_to_trace(spans[1]) is None
+
+    def test_protobuf_spans_decode(self):
+        """Protobuf requests decode to the same span view"""
+        request = ExportTraceServiceRequest()
+        span = request.resource_spans.add().scope_spans.add().spans.add()
+        span.trace_id = bytes.fromhex(TRACE_ID)
+        span.span_id = bytes.fromhex(SPAN_ID)
+        span.start_time_unix_nano = 1704110400000000000
+        span.end_time_unix_nano = 1704110401000000000
+        kv = span.attributes.add()
+        kv.key = "gen_ai.request.model"
+        kv.value.string_value = "claude-3"
+
+        spans = list(iter_spans_protobuf(request.SerializeToString()))
+        trace = span_to_trace(spans[0], WORKSPACE_ID)
+
+        assert trace["trace_id"] == f"{TRACE_ID}-{SPAN_ID}"
+        assert trace["model"] == "claude-3"
+        assert trace["latency_ms"] == 1000
+        assert trace["status"] == "success"
+
+
+class TestOTLPEndpoint:
+    """Test the OTLP/HTTP receiver"""
+
+    def test_json_export_is_queued(self, client, mock_publisher, otlp_json):
+        """GenAI spans are published; the response is an OTLP JSON body"""
+        response = client.post(
+            "/api/v1/traces/otlp",
+            content=gzip.compress(json.dumps(otlp_json).encode()),
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {}
+        payloads = mock_publisher.publish_encoded.call_args[0][0]
+        assert len(payloads) == 1
+        assert json.loads(payloads[0])["model"] == "gpt-4"
+
+    def test_protobuf_export_reports_rejected_spans(self, client, mock_publisher):
+        """Spans that fail validation are reported as partial success"""
+        request = ExportTraceServiceRequest()
+        span = request.resource_spans.add().scope_spans.add().spans.add()
+        span.trace_id = bytes.fromhex(TRACE_ID)
+        span.span_id = bytes.fromhex(SPAN_ID)
+        kv = span.attributes.add()
+        kv.key = "gen_ai.request.model"
+        kv.value.string_value = "gpt-4"
+
+        # No workspace header or resource attribute -> invalid trace
+        response = client.post(
+            "/api/v1/traces/otlp",
+            content=request.SerializeToString(),
+            headers={"Content-Type": "application/x-protobuf"}
+        )
+
+        assert response.status_code == 200
+        parsed = ExportTraceServiceResponse()
+        parsed.ParseFromString(response.content)
+        assert parsed.partial_success.rejected_spans == 1
+        assert not mock_publisher.publish_encoded.called
+
+    def test_unsupported_content_type(self, client, mock_publisher):
+        """Unknown media types are rejected"""
+        response = client.post(
+            "/api/v1/traces/otlp",
+            content=b"spans",
+            headers={"Content-Type": "text/plain"}
+        )
+
+        assert response.status_code == 415
+
+    def test_malformed_body(self, client, mock_publisher):
+        """Undecodable bodies return 400"""
+        response = client.post(
+            "/api/v1/traces/otlp",
+            content=b"{not json",
+            headers={"Content-Type": "application/json"}
+        )
+
+        assert response.status_code == 400
+
+    def test_decompression_bomb_is_rejected(self, client, mock_publisher):
+        """An export inflating beyond the limit returns 413 without being decompressed in full"""
+        with patch("app.routes.settings.otlp_max_body_bytes", 1024 * 1024):
+            response = client.post(
+                "/api/v1/traces/otlp",
+                content=gzip.compress(b" " * (16 * 1024 * 1024)),
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+            )
+
+        assert response.status_code == 413
+        assert not mock_publisher.publish_encoded.called
+
+    def test_corrupt_compressed_body(self, client, mock_publisher):
+        """Bodies that do not decompress return 400"""
+        response = client.post(
+            "/api/v1/traces/otlp",
+            content=b"not gzip at all",
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 400
+
+    def test_malformed_span_structure(self, client, mock_publisher):
+        """Elements of the wrong shape return 400 rather than a retryable 503"""
+        for body in (
+            {"resourceSpans": ["not an object"]},
+            {"resourceSpans": [{"scopeSpans": [{"spans": [42]}]}]},
+            {"resourceSpans": [{"scopeSpans": [{"spans": [{"startTimeUnixNano": "soon"}]}]}]}
+        ):
+            response = client.post(
+                "/api/v1/traces/otlp",
+                json=body,
+                headers={"Content-Type": "application/json"}
+            )
+
+            assert response.status_code == 400
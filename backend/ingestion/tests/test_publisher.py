@@ -0,0 +1,173 @@
+"""Tests for the coalescing Redis Streams publisher"""
+import asyncio
+import hashlib
+import msgpack
+import pytest
+from unittest.mock import AsyncMock
+from app.dedup import NEW, DUPLICATE
+from app.publisher import TracePublisher
+from app.sharding import shard_for
+
+
+class FakePipeline:
+    """Records XADDs and returns sequential message IDs on execute"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+        self.sets = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, name, value, **kwargs):
+        self.sets.append((name, value, kwargs))
+        return self
+
+    def xadd(self, name, fields, **kwargs):
+        self.commands.append((name, fields, kwargs))
+        return self
+
+    async def execute(self):
+        if self.client.fail:
+            raise ConnectionError("Redis connection failed")
+        self.client.executed.append(self.commands)
+        self.client.staged.extend(self.sets)
+        start = self.client.next_id
+        self.client.next_id += len(self.commands)
+        return [True] * len(self.sets) + [f"{start + i}-0".encode() for i in range(len(self.commands))]
+
+
+class FakeRedis:
+    """Minimal async Redis stand-in supporting pipelines"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.executed = []
+        self.staged = []
+        self.next_id = 1
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def make_publisher(fake, **kwargs):
+    publisher = TracePublisher(redis_url="redis://localhost:6379/0", **kwargs)
+    publisher.client = fake
+    return publisher
+
+
+class TestTracePublisher:
+    """Test publish coalescing"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_publishes_share_one_pipeline(self):
+        """Concurrent single-trace publishes are flushed in one round-trip"""
+        fake = FakeRedis()
+        publisher = make_publisher(fake, max_batch_size=100, flush_interval_ms=5)
+
+        message_ids = await asyncio.gather(*[
+            publisher.publish_trace({"trace_id": f"trace_{i}"}) for i in range(10)
+        ])
+
+        assert len(fake.executed) == 1
+        assert len(fake.executed[0]) == 10
+        assert message_ids == [f"{i}-0" for i in range(1, 11)]
+
+    @pytest.mark.asyncio
+    async def test_flush_on_batch_size(self):
+        """A full batch is flushed without waiting for the deadline"""
+        fake = FakeRedis()
+        publisher = make_publisher(fake, max_batch_size=4, flush_interval_ms=10_000)
+
+        await asyncio.wait_for(
+            asyncio.gather(*[publisher.publish_trace({"trace_id": f"t{i}"}) for i in range(8)]),
+            timeout=1
+        )
+
+        assert [len(batch) for batch in fake.executed] == [4, 4]
+
+    @pytest.mark.asyncio
+    async def test_failure_propagates_to_every_waiter(self):
+        """A failed pipeline raises in every coalesced caller"""
+        publisher = make_publisher(FakeRedis(fail=True), flush_interval_ms=1)
+
+        results = await asyncio.gather(
+            publisher.publish_trace({"trace_id": "a"}),
+            publisher.publish_trace({"trace_id": "b"}),
+            return_exceptions=True
+        )
+
+        assert all(isinstance(r, ConnectionError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_uses_single_pipeline(self):
+        """Batch publishes go out as one pipeline"""
+        fake = FakeRedis()
+        publisher = make_publisher(fake)
+
+        message_ids = await publisher.publish_batch([{"trace_id": "a"}, {"trace_id": "b"}])
+
+        assert message_ids == ["1-0", "2-0"]
+        assert len(fake.executed) == 1
+        name, fields, kwargs = fake.executed[0][0]
+        assert name == "traces:pending"
+        assert "data" in fields
+        assert kwargs["approximate"] is True
+
+    @pytest.mark.asyncio
+    async def test_traces_are_sharded_by_workspace(self):
+        """Each workspace always lands on the same shard stream"""
+        fake = FakeRedis()
+        publisher = make_publisher(fake, stream_shards=4)
+        workspaces = [f"workspace_{i}" for i in range(8)]
+
+        await publisher.publish_batch([{"trace_id": w, "workspace_id": w} for w in workspaces])
+        await publisher.publish_batch([{"trace_id": w, "workspace_id": w} for w in workspaces])
+
+        first, second = ([name for name, _, _ in batch] for batch in fake.executed)
+        assert first == second
+        assert first == [f"traces:pending:{shard_for(w, 4)}" for w in workspaces]
+        assert publisher.maxlen == 25000
+
+    @pytest.mark.asyncio
+    async def test_large_bodies_are_offloaded_once(self):
+        """Large bodies are staged once by hash and the entry keeps a preview"""
+        fake = FakeRedis()
+        publisher = make_publisher(fake)
+        template = "You are a helpful assistant. " * 500
+        traces = [{"trace_id": f"t{i}", "input": template, "output": "short"} for i in range(3)]
+
+        message_ids = await publisher.publish_batch(traces)
+
+        content_hash = hashlib.sha256(template.encode()).hexdigest()
+        assert message_ids == ["1-0", "2-0", "3-0"]
+        assert [name for name, _, _ in fake.staged] == [f"traces:payload:{content_hash}"]
+        assert fake.staged[0][1] == template.encode()
+        entry = msgpack.unpackb(fake.executed[0][0][1]["data"])
+        assert entry["input_hash"] == content_hash
+        assert entry["input"] == template[:publisher.offloader.preview_chars]
+        assert entry["output"] == "short"
+        assert "output_hash" not in entry
+        assert traces[0]["input"] == template
+
+    @pytest.mark.asyncio
+    async def test_single_publishes_are_deduplicated_per_flush(self):
+        """Keyed single-trace publishes are checked in one call per flush; duplicates resolve to None"""
+        fake = FakeRedis()
+        publisher = make_publisher(fake, max_batch_size=100, flush_interval_ms=5)
+        publisher.deduplicator.enabled = True
+        publisher.deduplicator.check = AsyncMock(return_value=[NEW, DUPLICATE])
+
+        message_ids = await asyncio.gather(
+            publisher.publish_trace({"trace_id": "a"}, dedup_key=b"a"),
+            publisher.publish_trace({"trace_id": "b"}, dedup_key=b"b"),
+            publisher.publish_trace({"trace_id": "c"})
+        )
+
+        publisher.deduplicator.check.assert_awaited_once_with([b"a", b"b"])
+        assert message_ids == ["1-0", None, "2-0"]
+        assert len(fake.executed[0]) == 2
@@ -0,0 +1,74 @@
+"""Tests for head sampling"""
+import json
+import pytest
+from unittest.mock import AsyncMock, Mock
+from app.sampling import HeadSampler, SamplingRule
+
+WORKSPACE_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+def make_trace(i: int, **overrides) -> dict:
+    trace = {
+        "trace_id": f"trace_{i}",
+        "workspace_id": WORKSPACE_ID,
+        "input": "question",
+        "output": "answer",
+        "status": "success",
+        "latency_ms": 200,
+        "metadata": {"k": "v"},
+        "tags": []
+    }
+    trace.update(overrides)
+    return trace
+
+
+@pytest.fixture
+def sampler():
+    sampler = HeadSampler(Mock())
+    sampler.default = SamplingRule(head_rate=0.1)
+    return sampler
+
+
+class TestHeadSampler:
+    """Test head sampling decisions"""
+
+    def test_rate_is_respected_and_deterministic(self, sampler):
+        """About head_rate of successful traces are kept, the same ones every time"""
+        kept = [i for i in range(5000) if sampler.apply(make_trace(i))]
+
+        assert 350 < len(kept) < 650
+        assert kept == [i for i in range(5000) if sampler.apply(make_trace(i))]
+
+    def test_sampled_out_trace_becomes_summary(self, sampler):
+        """Dropped traces keep their metrics but lose their bodies"""
+        trace = next(t for t in (make_trace(i) for i in range(100)) if not sampler.apply(t))
+
+        assert trace["sampled"] is False
+        assert trace["input"] == "" and trace["output"] == ""
+        assert trace["metadata"] == {}
+        assert trace["latency_ms"] == 200
+
+    def test_errors_tags_and_cost_are_always_kept(self, sampler):
+        """Remarkable traces bypass the sample rate"""
+        sampler.default = SamplingRule(head_rate=0.0, keep_tags=("vip",), min_cost_usd=1.0)
+
+        assert sampler.apply(make_trace(1, status="error"))
+        assert sampler.apply(make_trace(2, status="timeout"))
+        assert sampler.apply(make_trace(3, tags=["vip"]))
+        assert sampler.apply(make_trace(4, cost_usd=2.5))
+        assert not sampler.apply(make_trace(5, cost_usd=0.01))
+
+    @pytest.mark.asyncio
+    async def test_workspace_rules_from_redis(self, sampler):
+        """Per-workspace rules override the default, which Redis can also set"""
+        sampler.client.hgetall = AsyncMock(return_value={
+            b"default": json.dumps({"head_rate": 0.5, "keep_tags": ["vip"]}).encode(),
+            WORKSPACE_ID.encode(): json.dumps({"head_rate": 0.0}).encode()
+        })
+
+        await sampler.refresh()
+
+        assert sampler.default.head_rate == 0.5
+        assert sampler.rules[WORKSPACE_ID].head_rate == 0.0
+        assert sampler.rules[WORKSPACE_ID].keep_tags == frozenset({"vip"})
+        assert not sampler.apply(make_trace(1))
@@ -1,7 +1,9 @@
 """Tests for trace validation"""
+import json
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.validation import validate_batch_json, BatchFormatError
 
 
 @pytest.fixture
@@ -63,3 +65,37 @@ class TestTraceValidation:
         response = client.post("/api/v1/traces", json=invalid_trace)
 
         assert response.status_code == 422
+
+
+class TestBatchJsonValidation:
+    """Test single-pass batch validation"""
+
+    def test_valid_batch_serializes_every_trace(self, base_trace):
+        """All traces valid: one payload per trace, no errors"""
+        base_trace.update({"input": "hi", "output": "hello", "model_provider": "openai"})
+        body = json.dumps({"traces": [base_trace, dict(base_trace, trace_id="trace_456")]})
+
+        payloads, errors = validate_batch_json(body.encode())
+
+        assert errors == []
+        assert [json.loads(p)["trace_id"] for p in payloads] == ["trace_123", "trace_456"]
+
+    def test_invalid_traces_reported_by_index(self, base_trace):
+        """Valid traces are kept while invalid ones are reported by index"""
+        base_trace.update({"input": "hi", "output": "hello", "model_provider": "openai"})
+        invalid = dict(base_trace, trace_id="bad", latency_ms=-1)
+        body = json.dumps({"traces": [base_trace, invalid, 42]})
+
+        payloads, errors = validate_batch_json(body.encode())
+
+        assert len(payloads) == 1
+        assert [(e["index"], e["trace_id"]) for e in errors] == [(1, "bad"), (2, "unknown")]
+
+    def test_envelope_errors_reject_the_batch(self, base_trace):
+        """Malformed bodies and size limits raise BatchFormatError"""
+        with pytest.raises(BatchFormatError):
+            validate_batch_json(b"not json")
+        with pytest.raises(BatchFormatError):
+            validate_batch_json(json.dumps({"traces": []}).encode())
+        with pytest.raises(BatchFormatError):
+            validate_batch_json(json.dumps({"traces": [base_trace] * 101}).encode())
@@ -0,0 +1,298 @@
+"""Historical backfill of traces (python -m app.backfill)"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import IO, Iterable, Iterator, Optional
+from .batch import TraceBatch
+from .config import get_settings
+from .processor import TraceProcessor
+from .writer import TraceWriter
+
+logger = logging.getLogger(__name__)
+
+# chunk_time_interval of the traces hypertable
+CHUNK_INTERVAL = timedelta(days=1)
+
+# Characters read at a time from a JSON array file
+READ_SIZE = 1024 * 1024
+_SEPARATORS = re.compile(r'[\s,]*')
+
+# Refresh policies of the continuous aggregates over traces that are currently scheduled
+AGGREGATE_POLICIES_SQL = """
+    SELECT j.job_id, ca.view_name
+    FROM timescaledb_information.jobs j
+    JOIN timescaledb_information.continuous_aggregates ca
+        ON ca.materialization_hypertable_schema = j.hypertable_schema
+        AND ca.materialization_hypertable_name = j.hypertable_name
+    WHERE j.proc_name = 'policy_refresh_continuous_aggregate'
+        AND ca.hypertable_name = 'traces'
+        AND j.scheduled
+"""
+
+AGGREGATES_SQL = """
+    SELECT view_name FROM timescaledb_information.continuous_aggregates WHERE hypertable_name = 'traces'
+"""
+
+
+def chunk_ranges(starts: Iterable[datetime], interval: timedelta = CHUNK_INTERVAL) -> list[tuple[datetime, datetime]]:
+    """Merge chunk start times into contiguous [start, end) ranges"""
+    ranges: list[list[datetime]] = []
+    for start in sorted(set(starts)):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + interval
+        else:
+            ranges.append([start, start + interval])
+    return [(start, end) for start, end in ranges]
+
+
+def _iter_json_array(f: IO[str]) -> Iterator[dict]:
+    """Elements of a JSON array file, decoded one at a time"""
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_SIZE).lstrip()[1:]  # Past the opening bracket
+    pos = 0
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if buffer.startswith(']', pos):
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The element continues past the buffer: read on
+            chunk = f.read(READ_SIZE)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+
+
+def read_traces(paths: list[str]) -> Iterator[dict]:
+    """Traces from JSON array files (synthetic_traces.json) or JSON Lines files, read incrementally"""
+    for path in paths:
+        with open(path, 'r') as f:
+            is_array = f.read(READ_SIZE).lstrip().startswith('[')
+            f.seek(0)
+            if is_array:
+                yield from _iter_json_array(f)
+            else:
+                yield from (json.loads(line) for line in f if line.strip())
+
+
+class Backfill:
+    """
+    Bulk load of historical traces
+
+    Loading history through ingestion and processing writes row batches
+    into chunks that continuous aggregate policies keep re-materialising.
+    A backfill instead:
+
+    - partitions the traces by hypertable chunk (one day), so each write
+      touches a single chunk and its indexes,
+    - writes the chunk batches over ``concurrency`` connections with the
+      writer's COPY path (staging table, idempotent insert, traces_minutely
+      rollup),
+    - pauses the refresh policies of the continuous aggregates over traces
+      for the duration of the load, then refreshes each aggregate over the
+      touched ranges only, and resumes the policies.
+
+    Traces are stored in full: no tail sampling is applied to history.
+
+    The input is streamed: it is read and processed ``batch_size`` traces
+    at a time, and each chunk's traces are buffered until they fill a
+    batch. At most ``concurrency`` batches wait for a writer, and once
+    more than ``max_buffered`` traces are buffered the fullest chunk is
+    written early, so memory stays flat however long the history is.
+    """
+
+    def __init__(
+        self,
+        writer: Optional[TraceWriter] = None,
+        concurrency: Optional[int] = None,
+        batch_size: int = 10000,
+        chunk_interval: timedelta = CHUNK_INTERVAL,
+        max_buffered: Optional[int] = None
+    ):
+        """
+        Initialize backfill
+
+        Args:
+            writer: Writer to use (default: a new one with a pool of ``concurrency`` connections)
+            concurrency: Chunks written at once (default: WRITER_CONCURRENCY)
+            batch_size: Traces per COPY within a chunk
+            chunk_interval: Partitioning interval (the hypertable's chunk interval)
+            max_buffered: Traces buffered across chunks before the fullest
+                is written early (default: 4 batches per connection)
+        """
+        self.concurrency = concurrency or get_settings().writer_concurrency
+        if writer is None:
+            writer = TraceWriter()
+            writer.pool_size = self.concurrency
+        self.writer = writer
+        self.processor = TraceProcessor()
+        self.batch_size = batch_size
+        self.chunk_interval = chunk_interval
+        self.max_buffered = max_buffered or 4 * batch_size * self.concurrency
+
+    def _chunk_start(self, timestamp: datetime) -> datetime:
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        seconds = self.chunk_interval.total_seconds()
+        return datetime.fromtimestamp(timestamp.timestamp() // seconds * seconds, tz=timezone.utc)
+
+    async def run(self, traces: Iterable[dict], refresh: bool = True) -> dict:
+        """
+        Load traces
+
+        Args:
+            traces: Raw trace dictionaries (as sent to ingestion), e.g. from ``read_traces``
+            refresh: Pause the aggregate policies and refresh the touched ranges
+
+        Returns:
+            dict: traces read, written and failed, chunks and ranges touched, seconds taken
+        """
+        started = time.monotonic()
+        stats = {"read": 0, "written": 0, "failed": 0, "chunks": 0, "ranges": []}
+        chunk_starts: set[datetime] = set()
+        buffers: dict[datetime, TraceBatch] = {}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        failures: list[Exception] = []
+
+        async def write_batches():
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                if failures:
+                    continue  # Drain without writing once the load has failed
+                try:
+                    written, rejected = await self.writer.write_batch(batch)
+                except Exception as e:
+                    failures.append(e)
+                    continue
+                stats["written"] += written
+                stats["failed"] += len(rejected)
+                logger.info(
+                    f"{stats['written']}/{stats['read']} traces written "
+                    f"({stats['written'] / max(time.monotonic() - started, 1e-6):.0f} traces/s)"
+                )
+
+        async def flush(chunk_start: datetime, size: int):
+            buffer = buffers.pop(chunk_start)
+            if len(buffer) > size:
+                buffers[chunk_start] = buffer.take(list(range(size, len(buffer))))
+                buffer = buffer.take(list(range(size)))
+            # Waits while every writer is busy
+            await queue.put(buffer)
+
+        paused = await self._pause_policies() if refresh else []
+        writers = [asyncio.create_task(write_batches()) for _ in range(self.concurrency)]
+        try:
+            traces = iter(traces)
+            while not failures:
+                raw = await asyncio.to_thread(lambda: list(islice(traces, self.batch_size)))
+                if not raw:
+                    break
+                batch, invalid = await asyncio.to_thread(self.processor.process_columns, raw)
+                stats["read"] += len(raw)
+                stats["failed"] += len(invalid)
+
+                by_chunk: dict[datetime, list[int]] = {}
+                for i, timestamp in enumerate(batch['timestamp']):
+                    by_chunk.setdefault(self._chunk_start(timestamp), []).append(i)
+                for chunk_start, indices in by_chunk.items():
+                    chunk_starts.add(chunk_start)
+                    buffers.setdefault(chunk_start, TraceBatch()).extend(batch.take(indices))
+                    while chunk_start in buffers and len(buffers[chunk_start]) >= self.batch_size:
+                        await flush(chunk_start, self.batch_size)
+
+                while sum(map(len, buffers.values())) > self.max_buffered:
+                    await flush(max(buffers, key=lambda start: len(buffers[start])), self.batch_size)
+
+            for chunk_start in sorted(buffers):
+                await flush(chunk_start, self.batch_size)
+            for _ in writers:
+                await queue.put(None)
+            await asyncio.gather(*writers)
+            if failures:
+                raise failures[0]
+
+            ranges = chunk_ranges(chunk_starts, self.chunk_interval)
+            stats["chunks"] = len(chunk_starts)
+            stats["ranges"] = [(start.isoformat(), end.isoformat()) for start, end in ranges]
+            logger.info(f"Backfilled {stats['written']} traces into {len(chunk_starts)} chunks ({stats['failed']} failed)")
+            if refresh:
+                await self._refresh_aggregates(ranges)
+        finally:
+            for writer in writers:
+                writer.cancel()
+            await self._resume_policies(paused)
+
+        stats["seconds"] = round(time.monotonic() - started, 1)
+        return stats
+
+    async def _pause_policies(self) -> list[int]:
+        """Unschedule the aggregate refresh policies; returns the paused job ids"""
+        async with self.writer.pool.acquire() as conn:
+            jobs = await conn.fetch(AGGREGATE_POLICIES_SQL)
+            for job in jobs:
+                await conn.execute("SELECT alter_job($1, scheduled => false)", job['job_id'])
+        if jobs:
+            logger.info(f"Paused refresh policies of {', '.join(job['view_name'] for job in jobs)}")
+        return [job['job_id'] for job in jobs]
+
+    async def _resume_policies(self, job_ids: list[int]):
+        if not job_ids:
+            return
+        async with self.writer.pool.acquire() as conn:
+            for job_id in job_ids:
+                await conn.execute("SELECT alter_job($1, scheduled => true)", job_id)
+        logger.info(f"Resumed {len(job_ids)} refresh policies")
+
+    async def _refresh_aggregates(self, ranges: list[tuple[datetime, datetime]]):
+        """Refresh every continuous aggregate over traces, over the touched ranges only"""
+        async with self.writer.pool.acquire() as conn:
+            views = [row['view_name'] for row in await conn.fetch(AGGREGATES_SQL)]
+            for view in views:
+                for start, end in ranges:
+                    # Transaction-controlling procedure: must run outside a transaction block
+                    await conn.execute(
+                        f"CALL refresh_continuous_aggregate('{view}', '{start.isoformat()}', '{end.isoformat()}')"
+                    )
+                logger.info(f"Refreshed {view} over {len(ranges)} ranges")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Backfill the files given on the command line"""
+    backfill = Backfill(concurrency=args.concurrency, batch_size=args.batch_size)
+    await backfill.writer.connect()
+    try:
+        return await backfill.run(read_traces(args.paths), refresh=not args.no_refresh)
+    finally:
+        await backfill.writer.disconnect()
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk load historical traces into TimescaleDB")
+    parser.add_argument("paths", nargs="+", help="JSON array or JSON Lines files of traces")
+    parser.add_argument("--concurrency", type=int, help="Chunks written at once (default: WRITER_CONCURRENCY)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Traces per COPY (default: 10000)")
+    parser.add_argument(
+        "--no-refresh", action="store_true",
+        help="Leave the aggregate policies running and skip the targeted refresh"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    stats = asyncio.run(run(parse_args()))
+    print(json.dumps(stats, indent=2))
+    sys.exit(0 if stats["failed"] == 0 else 1)
@@ -0,0 +1,93 @@
+"""Columnar representation of a batch of processed traces"""
+import json
+from typing import Iterator, Optional
+
+# Columns stored in the traces table, in INSERT/COPY order
+TRACE_COLUMNS = (
+    'trace_id', 'workspace_id', 'agent_id', 'timestamp', 'latency_ms',
+    'input', 'output', 'error', 'status', 'model', 'model_provider',
+    'tokens_input', 'tokens_output', 'tokens_total', 'cost_usd',
+    'metadata', 'tags', 'input_hash', 'output_hash'
+)
+
+# Columns that only live in the pipeline
+BATCH_COLUMNS = TRACE_COLUMNS + ('sampled',)
+
+
+class TraceRow:
+    """
+    View of one trace in a TraceBatch
+
+    Supports the dict operations code written against per-trace dicts
+    uses (``row['status']``, ``row.get('tags')``, assignment), reading and
+    writing the batch's columns in place.
+    """
+
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns: dict[str, list], index: int):
+        self.columns = columns
+        self.index = index
+
+    def __getitem__(self, name: str):
+        return self.columns[name][self.index]
+
+    def __setitem__(self, name: str, value):
+        self.columns[name][self.index] = value
+
+    def get(self, name: str, default=None):
+        column = self.columns.get(name)
+        return default if column is None else column[self.index]
+
+
+class TraceBatch:
+    """
+    Processed traces stored as one list per column (struct of arrays)
+
+    Built once per batch by ``TraceProcessor.process_columns``; per-column
+    passes replace per-trace dicts, and ``records`` feeds COPY directly.
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: Optional[dict[str, list]] = None):
+        self.columns = columns or {name: [] for name in BATCH_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.columns['trace_id'])
+
+    def __iter__(self) -> Iterator[TraceRow]:
+        columns = self.columns
+        return (TraceRow(columns, i) for i in range(len(self)))
+
+    def __getitem__(self, name: str) -> list:
+        return self.columns[name]
+
+    def where(self, mask: list[bool]) -> "TraceBatch":
+        """Traces whose mask entry is true, as a new batch"""
+        return TraceBatch({
+            name: [value for value, keep in zip(column, mask) if keep]
+            for name, column in self.columns.items()
+        })
+
+    def take(self, indices: list[int]) -> "TraceBatch":
+        """Traces at ``indices``, in that order, as a new batch"""
+        return TraceBatch({
+            name: [column[i] for i in indices]
+            for name, column in self.columns.items()
+        })
+
+    def extend(self, other: "TraceBatch"):
+        """Append the traces of ``other`` (same columns) in place"""
+        for name, column in self.columns.items():
+            column.extend(other.columns[name])
+
+    def records(self) -> list[tuple]:
+        """Rows in TRACE_COLUMNS order, ready for COPY or executemany"""
+        columns = dict(self.columns, metadata=list(map(json.dumps, self.columns['metadata'])))
+        return list(zip(*(columns[name] for name in TRACE_COLUMNS)))
+
+    def to_dicts(self) -> list[dict]:
+        """One dict per trace (for callers that need row-oriented traces)"""
+        names = list(self.columns)
+        return [dict(zip(names, row)) for row in zip(*self.columns.values())]
@@ -0,0 +1,76 @@
+"""Stream entry decoding for traces:pending
+
+Entries carry the serialized trace in ``data`` and its format in the ``enc``
+header field. Entries without ``enc`` predate the header and are JSON.
+Keep in sync with ingestion/app/codec.py.
+"""
+import json
+import msgpack
+
+FIELD_ENCODING = "enc"
+FIELD_DATA = "data"
+
+# Envelope identifiers: <serialization>/<envelope version>
+ENCODING_JSON = "json/1"
+ENCODING_MSGPACK = "msgpack/1"
+
+
+def _field(fields: dict, name: str):
+    """Read a field from an entry decoded with or without decode_responses"""
+    value = fields.get(name.encode())
+    return value if value is not None else fields.get(name)
+
+
+def decode_entry(fields: dict) -> dict:
+    """
+    Decode a stream entry into a trace dictionary
+
+    Args:
+        fields: Stream entry fields as returned by XREADGROUP
+
+    Returns:
+        dict: Trace data
+
+    Raises:
+        ValueError: If the entry has no data or an unknown encoding
+    """
+    encoding = _field(fields, FIELD_ENCODING) or ENCODING_JSON
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode('utf-8')
+
+    data = _field(fields, FIELD_DATA)
+    if data is None:
+        raise ValueError("Stream entry has no data field")
+
+    if encoding == ENCODING_MSGPACK:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        try:
+            return msgpack.unpackb(data)
+        except (msgpack.UnpackException, ValueError, TypeError) as e:
+            raise ValueError(f"Invalid msgpack payload: {str(e)}") from e
+
+    if encoding == ENCODING_JSON:
+        return json.loads(data)
+
+    raise ValueError(f"Unsupported stream encoding: {encoding}")
+
+
+def encode_entry(trace_data: dict, encoding: str = ENCODING_MSGPACK) -> dict:
+    """
+    Encode a trace dictionary as stream entry fields
+
+    Args:
+        trace_data: Trace data
+        encoding: Envelope identifier (msgpack/1 or json/1)
+
+    Returns:
+        dict: Stream entry fields
+    """
+    if encoding == ENCODING_MSGPACK:
+        data = msgpack.packb(trace_data, default=str)
+    elif encoding == ENCODING_JSON:
+        data = json.dumps(trace_data, default=str)
+    else:
+        raise ValueError(f"Unsupported stream encoding: {encoding}")
+    return {FIELD_ENCODING: encoding, FIELD_DATA: data}
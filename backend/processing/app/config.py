@@ -0,0 +1,79 @@
+"""Processing Service Configuration"""
+from pydantic_settings import BaseSettings
+from functools import lru_cache
+from typing import Optional
+
+
+class Settings(BaseSettings):
+    """Application settings loaded from environment variables"""
+
+    # Service
+    app_name: str = "Processing Service"
+    debug: bool = False
+
+    # Redis
+    redis_url: str = "redis://localhost:6379/0"
+
+    # TimescaleDB writes
+    write_mode: str = "copy"  # "copy" (staging table + INSERT ... SELECT) or "executemany"
+    writer_concurrency: int = 4  # Batches written concurrently (connection pool size)
+
+    # Consume -> process -> write pipeline
+    pipeline_block_ms: int = 1000  # XREADGROUP wait while no batch is being filled
+    pipeline_queue_depth: int = 4  # Batches buffered between stages before the reader waits
+
+    # Adaptive batching: size follows consumer lag, capped by write latency
+    batch_min_size: int = 100
+    batch_max_size: int = 5000
+    batch_target_write_ms: int = 500  # Batch write time above which batches shrink
+    batch_lag_sample_interval_s: float = 1.0
+    freshness_max_delay_ms: int = 2000  # Stream-to-database delay a buffered trace may reach
+
+    # Worker processes (python -m app.supervisor)
+    processing_workers: int = 0  # 0 = one per CPU core
+    worker_stats_interval_s: int = 10  # Heartbeat and throughput report into traces:workers
+
+    # Prometheus metrics (GET /metrics); see WorkerSupervisor for how workers share it
+    metrics_port: int = 9102  # 0 disables the metrics server
+
+    # Reclaiming entries left pending by crashed or restarted consumers
+    reclaim_interval_s: int = 30
+    reclaim_min_idle_ms: int = 60000  # Must exceed the time a live worker takes to write a batch
+    reclaim_max_deliveries: int = 5  # Entries delivered more often go to the DLQ
+
+    # Stream sharding (must match the ingestion service)
+    stream_shards: int = 1  # traces:pending:{n}; 1 keeps the single traces:pending stream
+    shard_lease_ttl_s: int = 30  # Shard ownership expires this long after the owner's last renewal
+
+    # Weighted fair scheduling across workspaces (weights in the traces:scheduling:weights hash)
+    fair_scheduling_enabled: bool = False
+    fair_quantum: int = 100  # Entries a workspace of weight 1 may take per round
+    fair_read_ahead: int = 2000  # Entries read ahead per shard stream; drained well within reclaim_min_idle_ms
+    fair_weights_refresh_s: int = 30
+
+    # Offloaded input/output bodies
+    payload_cache_size: int = 100000  # Content hashes remembered as already stored
+    # Remembered hashes are upserted again after this long, so trace_payloads.last_seen_at
+    # (refreshed at most daily, purged after 32 days) keeps up with bodies still referenced
+    payload_cache_ttl_s: int = 6 * 3600
+
+    # Tail sampling (per-workspace rules in the traces:sampling:rules hash override these)
+    sampling_tail_rate: float = 1.0  # Share of unremarkable successful traces stored in full
+    sampling_latency_percentile: Optional[float] = None  # e.g. 0.95 keeps the slowest 5%
+    sampling_rules_refresh_s: int = 30
+
+    # Inline guardrail scanning (PII, prompt injection, toxicity) of every consumed trace
+    guardrails_enabled: bool = False
+    guardrail_workers: int = 2  # Scanner processes per processing worker; 0 scans in a thread
+    guardrail_redact_pii: bool = False  # Redact detected PII in input/output before it is stored
+    guardrail_max_text_length: int = 100000  # Characters of each input/output scanned
+
+    class Config:
+        env_file = ".env"
+        case_sensitive = False
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Get cached settings instance"""
+    return Settings()
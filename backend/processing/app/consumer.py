@@ -1,50 +1,171 @@
 """Redis Streams consumer for trace processing"""
 import redis
-import json
 import logging
 import os
+import socket
 from typing import Optional, Callable
 import time
+from .codec import decode_entry
+from .config import get_settings
+from .metrics import DEAD_LETTERED, STAGE_SECONDS
+from .scheduling import FairScheduler
+from .sharding import STREAM_BASE, all_streams, assign_shards, shard_stream
 
 logger = logging.getLogger(__name__)
 
 
+# Renew a shard lease held by this consumer, or take it if it is free
+LEASE_ACQUIRE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+elseif not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Release a shard lease only if this consumer still holds it
+LEASE_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
 class TraceConsumer:
-    """Consumes traces from Redis Streams for processing"""
+    """
+    Consumes traces from Redis Streams for processing
+
+    With ``stream_shards`` > 1 the stream is split into workspace shards
+    (``traces:pending:{n}``), each with its own consumer group. Consumers
+    heartbeat into a shared registry and divide the shards between the live
+    members by rendezvous hashing; a shard is only read by the consumer
+    holding its lease, so traces of a workspace are processed in order.
+    With a single shard every consumer reads the shared stream as before.
+
+    With ``fair_scheduling_enabled`` the consumer reads up to
+    ``fair_read_ahead`` entries per owned stream ahead of the batch being
+    filled and hands them out by weighted deficit round-robin across
+    workspaces (see ``FairScheduler``), so one workspace's backlog no
+    longer holds back the traces of every other workspace on its streams.
+    """
+
+    CONSUMERS_KEY = "traces:consumers"
+    DLQ_STREAM = "traces:dead_letter"
 
-    def __init__(self, redis_url: Optional[str] = None, consumer_group: str = "processors"):
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        consumer_group: str = "processors",
+        stream_shards: Optional[int] = None
+    ):
         """
         Initialize consumer
 
         Args:
             redis_url: Redis connection URL
             consumer_group: Consumer group name for distributed processing
+            stream_shards: Number of workspace shards of traces:pending
         """
-        url = redis_url or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-        self.client = redis.from_url(url, decode_responses=False)
-        self.stream_name = "traces:pending"
+        settings = get_settings()
+        self.client = redis.from_url(redis_url or settings.redis_url, decode_responses=False)
+        self.stream_name = STREAM_BASE
         self.consumer_group = consumer_group
-        self.consumer_name = f"processor_{os.getpid()}"
+        self.consumer_name = f"processor_{socket.gethostname()}_{os.getpid()}"
+        self.shards = max(stream_shards or settings.stream_shards, 1)
+        self.lease_ttl_ms = settings.shard_lease_ttl_s * 1000
 
-        # Create consumer group if it doesn't exist
-        self._create_consumer_group()
+        # Shard streams this consumer currently reads
+        self.streams: list[str] = all_streams(self.shards) if self.shards == 1 else []
+        self._next_rebalance = 0.0
 
-    def _create_consumer_group(self):
+        # XAUTOCLAIM scan position per stream
+        self._reclaim_cursors: dict[str, str] = {}
+
+        # Per-workspace sub-queues of read-ahead entries (None reads strictly in stream order)
+        self.scheduler = FairScheduler(self.client) if settings.fair_scheduling_enabled else None
+        self.read_ahead = settings.fair_read_ahead
+        # Unassigned shards kept leased until their read-ahead entries have been handed out
+        self._draining: set[str] = set()
+
+        if self.shards > 1:
+            self._acquire_lease = self.client.register_script(LEASE_ACQUIRE_SCRIPT)
+            self._release_lease = self.client.register_script(LEASE_RELEASE_SCRIPT)
+
+        # Create consumer groups if they don't exist
+        for stream in all_streams(self.shards):
+            self._create_consumer_group(stream)
+
+    def _create_consumer_group(self, stream_name: str):
         """Create consumer group for distributed processing"""
         try:
             self.client.xgroup_create(
-                self.stream_name,
+                stream_name,
                 self.consumer_group,
                 id='0',
                 mkstream=True
             )
-            logger.info(f"Created consumer group: {self.consumer_group}")
+            logger.info(f"Created consumer group {self.consumer_group} on {stream_name}")
         except redis.ResponseError as e:
             if "BUSYGROUP" in str(e):
-                logger.info(f"Consumer group already exists: {self.consumer_group}")
+                logger.info(f"Consumer group already exists: {self.consumer_group} on {stream_name}")
             else:
                 raise
 
+    @staticmethod
+    def _lease_key(stream_name: str) -> str:
+        return f"{stream_name}:lease"
+
+    def rebalance(self):
+        """
+        Heartbeat and claim this consumer's share of the shard streams
+
+        Called from ``consume_batch`` every third of the lease TTL. Shards
+        assigned to another live consumer are released; assigned shards are
+        leased, which waits for the previous owner to release them (after
+        acknowledging its in-flight batch) or for its lease to expire.
+        """
+        now = time.time()
+        ttl_s = self.lease_ttl_ms / 1000
+
+        self.client.zadd(self.CONSUMERS_KEY, {self.consumer_name: now})
+        self.client.zremrangebyscore(self.CONSUMERS_KEY, '-inf', now - ttl_s)
+        consumers = [
+            member.decode('utf-8') if isinstance(member, bytes) else member
+            for member in self.client.zrangebyscore(self.CONSUMERS_KEY, now - ttl_s, '+inf')
+        ]
+
+        assigned = {
+            shard_stream(shard, self.shards)
+            for shard in assign_shards(self.consumer_name, consumers, self.shards)
+        }
+
+        draining = {stream for stream in self.streams if stream not in assigned and self._buffered(stream)}
+        for stream in self.streams:
+            if stream not in assigned and stream not in draining:
+                self._release_lease(keys=[self._lease_key(stream)], args=[self.consumer_name])
+
+        owned = [
+            stream for stream in all_streams(self.shards)
+            if (stream in assigned or stream in draining)
+            and self._acquire_lease(keys=[self._lease_key(stream)], args=[self.consumer_name, self.lease_ttl_ms])
+        ]
+        if self.scheduler is not None:
+            for stream in set(self.streams) - set(owned):
+                # Lease lost: the new owner reclaims these entries once they are idle
+                dropped = self.scheduler.discard(stream)
+                if dropped:
+                    logger.warning(f"Dropped {dropped} read-ahead entries of {stream} after losing its lease")
+        self._draining = draining.intersection(owned)
+        if owned != self.streams:
+            logger.info(f"{self.consumer_name} now owns {len(owned)}/{self.shards} shards ({len(consumers)} consumers)")
+        self.streams = owned
+        self._next_rebalance = now + ttl_s / 3
+
     def consume_batch(self, batch_size: int = 10, block_ms: int = 1000) -> list[dict]:
         """
         Consume a batch of traces from the stream
@@ -57,103 +178,334 @@ class TraceConsumer:
             list[dict]: List of trace data dictionaries with metadata
         """
         try:
-            # Read from stream using consumer group
-            messages = self.client.xreadgroup(
-                self.consumer_group,
-                self.consumer_name,
-                {self.stream_name: '>'},
-                count=batch_size,
-                block=block_ms
-            )
+            if self.shards > 1 and time.time() >= self._next_rebalance:
+                self.rebalance()
 
-            if not messages:
+            if not self.streams:
+                time.sleep(block_ms / 1000)
                 return []
 
-            traces = []
-            for stream, message_list in messages:
-                for message_id, message_data in message_list:
-                    try:
-                        # Parse trace data
-                        trace_json = message_data.get(b'data') or message_data.get('data')
-                        if isinstance(trace_json, bytes):
-                            trace_json = trace_json.decode('utf-8')
-
-                        trace_data = json.loads(trace_json)
+            if self.scheduler is not None:
+                return self._consume_fair(batch_size, block_ms)
 
-                        # Add message metadata
-                        trace_data['_message_id'] = message_id.decode('utf-8') if isinstance(message_id, bytes) else message_id
-                        trace_data['_stream_name'] = stream.decode('utf-8') if isinstance(stream, bytes) else stream
+            # Read from the owned streams using the consumer group
+            with STAGE_SECONDS.labels(stage="read").time():
+                messages = self.client.xreadgroup(
+                    self.consumer_group,
+                    self.consumer_name,
+                    {stream: '>' for stream in self.streams},
+                    count=batch_size,
+                    block=block_ms
+                )
 
-                        traces.append(trace_data)
-
-                    except Exception as e:
-                        logger.error(f"Failed to parse message {message_id}: {str(e)}")
-                        # Move to dead letter queue
-                        self._move_to_dlq(message_id, message_data, str(e))
+            if not messages:
+                return []
 
+            traces = []
+            with STAGE_SECONDS.labels(stage="parse").time():
+                for stream, message_list in messages:
+                    traces.extend(self._decode_messages(stream, message_list))
             return traces
 
         except Exception as e:
             logger.error(f"Failed to consume from stream: {str(e)}")
             return []
 
-    def acknowledge(self, message_id: str):
+    def _buffered(self, stream: str) -> int:
+        return self.scheduler.buffered(stream) if self.scheduler is not None else 0
+
+    def _consume_fair(self, batch_size: int, block_ms: int) -> list[dict]:
+        """Top up the read-ahead of the owned streams, then take a weighted fair batch"""
+        limit = max(self.read_ahead, batch_size)
+        readable = [
+            stream for stream in self.streams
+            if stream not in self._draining and self.scheduler.buffered(stream) < limit
+        ]
+        if readable:
+            with STAGE_SECONDS.labels(stage="read").time():
+                messages = self.client.xreadgroup(
+                    self.consumer_group,
+                    self.consumer_name,
+                    {stream: '>' for stream in readable},
+                    count=limit - min(self.scheduler.buffered(stream) for stream in readable),
+                    # Only wait for new entries while nothing is queued
+                    block=None if len(self.scheduler) else block_ms
+                )
+            if messages:
+                with STAGE_SECONDS.labels(stage="parse").time():
+                    for stream, message_list in messages:
+                        self.scheduler.push(self._decode_messages(stream, message_list))
+
+        return self.scheduler.pop(batch_size)
+
+    def _decode_messages(self, stream, message_list) -> list[dict]:
+        """Decode stream entries, moving undecodable ones to the DLQ"""
+        traces = []
+        for message_id, message_data in message_list:
+            try:
+                # Parse trace data (msgpack or legacy JSON envelope)
+                trace_data = decode_entry(message_data)
+
+                # Add message metadata
+                trace_data['_message_id'] = message_id.decode('utf-8') if isinstance(message_id, bytes) else message_id
+                trace_data['_stream_name'] = stream.decode('utf-8') if isinstance(stream, bytes) else stream
+
+                traces.append(trace_data)
+
+            except Exception as e:
+                logger.error(f"Failed to parse message {message_id}: {str(e)}")
+                # Move to dead letter queue
+                self._move_to_dlq(message_id, message_data, str(e), stream, reason="undecodable")
+        return traces
+
+    def reclaim_batch(self, batch_size: int = 100, min_idle_ms: int = 60000, max_deliveries: int = 5) -> list[dict]:
+        """
+        Claim entries left pending by crashed or restarted consumers
+
+        Scans the pending entries of the owned streams with XAUTOCLAIM,
+        resuming where the previous call stopped. Entries idle for at least
+        ``min_idle_ms`` are taken over by this consumer; entries delivered
+        more than ``max_deliveries`` times are moved to the DLQ instead of
+        being retried again.
+
+        Args:
+            batch_size: Maximum entries claimed per stream
+            min_idle_ms: Idle time after which an entry is considered abandoned
+            max_deliveries: Deliveries after which an entry is dead-lettered
+
+        Returns:
+            list[dict]: Claimed trace data dictionaries with metadata
+        """
+        traces = []
+        for stream in self.streams:
+            try:
+                next_id, messages, *_ = self.client.xautoclaim(
+                    stream,
+                    self.consumer_group,
+                    self.consumer_name,
+                    min_idle_ms,
+                    start_id=self._reclaim_cursors.get(stream, '0-0'),
+                    count=batch_size
+                )
+                self._reclaim_cursors[stream] = next_id
+
+                # Entries trimmed from the stream come back without data
+                messages = [(message_id, data) for message_id, data in messages if data]
+                if self.scheduler is not None:
+                    # Entries waiting in this consumer's read-ahead are not abandoned
+                    messages = [
+                        (message_id, data) for message_id, data in messages
+                        if (stream, message_id.decode('utf-8') if isinstance(message_id, bytes) else message_id)
+                        not in self.scheduler
+                    ]
+                if not messages:
+                    continue
+
+                deliveries = {
+                    entry['message_id']: entry['times_delivered']
+                    for entry in self.client.xpending_range(
+                        stream,
+                        self.consumer_group,
+                        min=messages[0][0],
+                        max=messages[-1][0],
+                        count=len(messages),
+                        consumername=self.consumer_name
+                    )
+                }
+
+                retry = []
+                for message_id, message_data in messages:
+                    if deliveries.get(message_id, 0) > max_deliveries:
+                        self._move_to_dlq(
+                            message_id, message_data, f"Exceeded {max_deliveries} deliveries", stream,
+                            reason="max_deliveries"
+                        )
+                    else:
+                        retry.append((message_id, message_data))
+
+                logger.info(f"Reclaimed {len(retry)} idle entries from {stream}")
+                traces.extend(self._decode_messages(stream, retry))
+
+            except Exception as e:
+                logger.error(f"Failed to reclaim pending entries from {stream}: {str(e)}")
+
+        return traces
+
+    def prune_consumers(self, idle_ms: int):
+        """
+        Remove consumers with no pending entries that have been idle for ``idle_ms``
+
+        Every worker restart joins the group under a new name, so departed
+        consumers would otherwise accumulate in XINFO CONSUMERS.
+        """
+        for stream in self.streams:
+            try:
+                for consumer in self.client.xinfo_consumers(stream, self.consumer_group):
+                    name = consumer['name']
+                    name = name.decode('utf-8') if isinstance(name, bytes) else name
+                    if name != self.consumer_name and consumer['pending'] == 0 and consumer['idle'] > idle_ms:
+                        self.client.xgroup_delconsumer(stream, self.consumer_group, name)
+                        logger.info(f"Removed idle consumer {name} from {stream}")
+            except Exception as e:
+                logger.error(f"Failed to prune consumers of {stream}: {str(e)}")
+
+    def acknowledge(self, message_id: str, stream_name: Optional[str] = None):
         """
         Acknowledge successful processing of a message
 
         Args:
             message_id: Message ID to acknowledge
+            stream_name: Shard stream the message was read from
         """
         try:
-            self.client.xack(self.stream_name, self.consumer_group, message_id)
+            self.client.xack(stream_name or self.stream_name, self.consumer_group, message_id)
             logger.debug(f"Acknowledged message: {message_id}")
         except Exception as e:
             logger.error(f"Failed to acknowledge message {message_id}: {str(e)}")
 
-    def acknowledge_batch(self, message_ids: list[str]):
+    def acknowledge_batch(self, message_ids: list[str], stream_name: Optional[str] = None):
         """
         Acknowledge multiple messages at once
 
         Args:
             message_ids: List of message IDs to acknowledge
+            stream_name: Shard stream the messages were read from
         """
         if not message_ids:
             return
 
         try:
-            self.client.xack(self.stream_name, self.consumer_group, *message_ids)
+            self.client.xack(stream_name or self.stream_name, self.consumer_group, *message_ids)
             logger.info(f"Acknowledged {len(message_ids)} messages")
         except Exception as e:
             logger.error(f"Failed to acknowledge batch: {str(e)}")
 
-    def _move_to_dlq(self, message_id: str, message_data: dict, error: str):
-        """Move failed message to dead letter queue"""
+    def acknowledge_messages(self, messages: list[tuple[str, str]]):
+        """
+        Acknowledge messages read from any of the shard streams
+
+        Args:
+            messages: (stream_name, message_id) pairs
+        """
+        by_stream: dict[str, list[str]] = {}
+        for stream_name, message_id in messages:
+            by_stream.setdefault(stream_name, []).append(message_id)
+
+        for stream_name, message_ids in by_stream.items():
+            self.acknowledge_batch(message_ids, stream_name)
+
+    def dead_letter(self, entries: list[tuple[str, str, str]], reason: str):
+        """
+        Move pending entries that were read but cannot be written to the DLQ
+
+        The entry data is read back from its stream. An entry that cannot be
+        moved stays pending, and is dead-lettered once it has been reclaimed
+        ``max_deliveries`` times.
+
+        Args:
+            entries: (stream_name, message_id, error) triples
+            reason: Dead-letter reason reported in the metrics
+        """
+        for stream_name, message_id, error in entries:
+            try:
+                found = self.client.xrange(stream_name, min=message_id, max=message_id, count=1)
+            except Exception as e:
+                logger.error(f"Failed to read message {message_id} for the DLQ: {str(e)}")
+                continue
+            if not found:
+                # Trimmed from the stream: there is nothing left to keep
+                logger.error(f"Message {message_id} was trimmed before it could be moved to the DLQ: {error}")
+                self.acknowledge(message_id, stream_name)
+                continue
+            self._move_to_dlq(message_id, found[0][1], error, stream_name, reason=reason)
+
+    def _move_to_dlq(self, message_id: str, message_data: dict, error: str, stream_name: Optional[str] = None,
+                     reason: str = "undecodable"):
+        """
+        Move failed message to dead letter queue
+
+        The original entry fields (including its ``enc`` header) are copied
+        verbatim, so DLQ entries decode with ``decode_entry`` like any other.
+        """
         try:
-            dlq_name = "traces:dead_letter"
             self.client.xadd(
-                dlq_name,
+                self.DLQ_STREAM,
                 {
+                    **message_data,
                     "original_message_id": str(message_id),
-                    "data": json.dumps(message_data, default=str),
                     "error": error,
                     "timestamp": str(int(time.time()))
                 }
             )
             # Acknowledge the original message
-            self.acknowledge(message_id)
+            self.acknowledge(message_id, stream_name)
+            DEAD_LETTERED.labels(reason=reason).inc()
             logger.warning(f"Moved message {message_id} to DLQ: {error}")
         except Exception as e:
             logger.error(f"Failed to move message to DLQ: {str(e)}")
 
+    def fetch_payloads(self, content_hashes: list[str]) -> dict[str, str]:
+        """
+        Fetch offloaded input/output bodies staged by the ingestion service
+
+        Args:
+            content_hashes: SHA-256 content hashes
+
+        Returns:
+            dict[str, str]: Body text by content hash (expired bodies are missing)
+        """
+        if not content_hashes:
+            return {}
+
+        values = self.client.mget([f"traces:payload:{content_hash}" for content_hash in content_hashes])
+        bodies = {
+            content_hash: value.decode('utf-8')
+            for content_hash, value in zip(content_hashes, values)
+            if value is not None
+        }
+        if len(bodies) < len(content_hashes):
+            logger.warning(f"{len(content_hashes) - len(bodies)} offloaded bodies expired before processing")
+        return bodies
+
+    def get_lag(self) -> Optional[int]:
+        """
+        Entries not yet read by the consumer group, over the owned streams
+
+        Returns:
+            Optional[int]: Total lag, or None if Redis does not report it
+                (before Redis 7, or after the stream was trimmed past unread entries)
+        """
+        lag = 0
+        for stream in self.streams:
+            for group in self.client.xinfo_groups(stream):
+                name = group['name']
+                if (name.decode('utf-8') if isinstance(name, bytes) else name) != self.consumer_group:
+                    continue
+                if group.get('lag') is None:
+                    return None
+                lag += group['lag']
+        # Entries read ahead are delivered but still waiting to be processed
+        return lag + (len(self.scheduler) if self.scheduler is not None else 0)
+
     def get_pending_count(self) -> int:
-        """Get count of pending messages in consumer group"""
+        """Get count of pending messages in consumer group, over all shards"""
         try:
-            info = self.client.xpending(self.stream_name, self.consumer_group)
-            return info['pending']
+            return sum(
+                self.client.xpending(stream, self.consumer_group)['pending']
+                for stream in all_streams(self.shards)
+            )
         except Exception as e:
             logger.error(f"Failed to get pending count: {str(e)}")
             return 0
 
     def close(self):
-        """Close Redis connection"""
+        """Release shard leases, leave the consumer registry and close Redis connection"""
+        if self.shards > 1:
+            try:
+                for stream in self.streams:
+                    self._release_lease(keys=[self._lease_key(stream)], args=[self.consumer_name])
+                self.client.zrem(self.CONSUMERS_KEY, self.consumer_name)
+            except Exception as e:
+                logger.error(f"Failed to release shard leases: {str(e)}")
+            self.streams = []
         self.client.close()
@@ -0,0 +1,419 @@
+"""Inline guardrail scanning of processed traces"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import asyncpg
+from .batch import TraceBatch
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Detectors of the guardrail service, which is built separately. Keep in sync
+# with guardrail/app/detectors/ (tests/test_guardrails.py fails on any drift)
+PII_PATTERNS = {
+    'email': re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'),
+    'phone': re.compile(r'\b(?:\+?1[-.]?)?\(?\d{3}\)?[-.]?\d{3}[-.]?\d{4}\b'),
+    'ssn': re.compile(r'\b\d{3}[-]?\d{2}[-]?\d{4}\b'),
+    'credit_card': re.compile(r'\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b'),
+    'ip_address': re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+}
+
+PII_SEVERITY = {
+    'email': 'medium',
+    'phone': 'medium',
+    'ssn': 'critical',
+    'credit_card': 'critical',
+    'ip_address': 'low'
+}
+
+PII_REDACTIONS = {
+    'email': '[EMAIL REDACTED]',
+    'phone': '[PHONE REDACTED]',
+    'ssn': '[SSN REDACTED]',
+    'credit_card': '[CARD REDACTED]',
+    'ip_address': '[IP REDACTED]'
+}
+
+INJECTION_PATTERNS = [
+    r'ignore\s+(previous|above|all)\s+instructions',
+    r'disregard\s+(previous|above|all)',
+    r'forget\s+everything',
+    r'new\s+instructions?:',
+    r'system\s*:\s*',
+    r'<\s*script\s*>',
+    r'eval\s*\(',
+    r'override\s+instructions',
+    r'act\s+as\s+if',
+]
+INJECTION_REGEXES = [(pattern, re.compile(pattern, re.IGNORECASE)) for pattern in INJECTION_PATTERNS]
+
+TOXIC_KEYWORDS = [
+    'hate', 'stupid', 'idiot', 'moron', 'dumb', 'ugly',
+    'kill', 'die', 'death', 'violence'
+]
+
+SCANNED_FIELDS = ('input', 'output')
+
+# Traces per scanner task; smaller batches are not split across processes
+MIN_CHUNK_SIZE = 64
+
+
+def detect_pii(text: str) -> list[dict]:
+    """Detect PII in text using regex patterns"""
+    return [
+        {
+            'type': pii_type,
+            'value': match.group(),
+            'position': match.span(),
+            'severity': PII_SEVERITY[pii_type]
+        }
+        for pii_type, pattern in PII_PATTERNS.items()
+        for match in pattern.finditer(text)
+    ]
+
+
+def redact_pii(text: str) -> str:
+    """Redact PII from text"""
+    for pii_type, pattern in PII_PATTERNS.items():
+        text = pattern.sub(PII_REDACTIONS[pii_type], text)
+    return text
+
+
+def detect_prompt_injection(text: str) -> list[dict]:
+    """Detect potential prompt injection attempts"""
+    return [
+        {'type': 'prompt_injection', 'pattern': pattern, 'severity': 'critical'}
+        for pattern, regex in INJECTION_REGEXES
+        if regex.search(text)
+    ]
+
+
+def detect_toxicity(text: str) -> dict:
+    """Detect toxic content using keyword matching"""
+    text_lower = text.lower()
+    toxic_count = sum(1 for keyword in TOXIC_KEYWORDS if keyword in text_lower)
+
+    # Confidence based on toxic keyword density
+    words = len(text.split())
+    confidence = min(1.0, toxic_count / max(1, words / 10))
+
+    if confidence > 0.7:
+        severity = 'high'
+    elif confidence > 0.4:
+        severity = 'medium'
+    else:
+        severity = 'low'
+
+    return {'is_toxic': confidence > 0.3, 'confidence': confidence, 'severity': severity}
+
+
+def scan_text(text: str, redact: bool = False) -> tuple[list[dict], Optional[str]]:
+    """
+    Run all detectors over one text, as ``POST /api/v1/guardrails/check`` does
+
+    Args:
+        text: Text to scan
+        redact: Return the text with its PII redacted (and leave detected
+            PII values out of the violations)
+
+    Returns:
+        tuple: (violations as type/severity/message/details dicts,
+            redacted text or None when there was nothing to redact)
+    """
+    violations = []
+
+    pii = detect_pii(text)
+    for detection in pii:
+        details = {'pii_type': detection['type'], 'position': list(detection['position'])}
+        if redact:
+            message = f"Detected {detection['type']}"
+        else:
+            message = f"Detected {detection['type']}: {detection['value']}"
+            details['value'] = detection['value']
+        violations.append({
+            'type': 'pii_detection',
+            'severity': detection['severity'],
+            'message': message,
+            'details': details
+        })
+
+    toxicity = detect_toxicity(text)
+    if toxicity['is_toxic']:
+        violations.append({
+            'type': 'toxicity',
+            'severity': toxicity['severity'],
+            'message': f"Toxic content detected (confidence: {toxicity['confidence']:.2f})",
+            'details': {'confidence': toxicity['confidence'], 'severity': toxicity['severity']}
+        })
+
+    for injection in detect_prompt_injection(text):
+        violations.append({
+            'type': 'prompt_injection',
+            'severity': injection['severity'],
+            'message': "Potential prompt injection detected",
+            'details': {'pattern': injection['pattern']}
+        })
+
+    redacted = redact_pii(text) if pii and redact else None
+    return violations, redacted
+
+
+def scan_texts(texts: list[tuple], redact: bool, max_length: int) -> list[tuple]:
+    """
+    Scan the input and output of several traces (runs in a scanner process)
+
+    Args:
+        texts: (input, output) per trace
+        redact: Redact PII
+        max_length: Characters of each text scanned
+
+    Returns:
+        list[tuple]: Per trace and field, (violations, redacted text or None)
+    """
+    results = []
+    for row in texts:
+        fields = []
+        for text in row:
+            if not text:
+                fields.append(([], None))
+                continue
+            violations, redacted = scan_text(text[:max_length], redact)
+            if redact and len(text) > max_length:
+                # The rest is not reported on, but never stored unredacted
+                tail = redact_pii(text[max_length:])
+                if redacted is not None or tail != text[max_length:]:
+                    redacted = (redacted if redacted is not None else text[:max_length]) + tail
+            fields.append((violations, redacted))
+        results.append(tuple(fields))
+    return results
+
+
+class GuardrailScanner:
+    """
+    Runs the guardrail detectors over every processed batch
+
+    Batches are split across a pool of ``guardrail_workers`` scanner
+    processes (or scanned in a thread when it is 0). With
+    ``guardrail_redact_pii`` the input and output columns are redacted in
+    place, before the batch is written to traces.
+
+    Offloaded bodies are scanned through the preview kept on the trace,
+    or in full when the caller passes them in (as it must with
+    redaction, see ``ProcessingService.scan_batch``). A redacted full body
+    is stored under the content hash of its redacted text, which replaces
+    the trace's hash and preview, so the body as received never reaches
+    trace_payloads.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.guardrails_enabled
+        self.workers = settings.guardrail_workers
+        self.redact = settings.guardrail_redact_pii
+        self.max_length = settings.guardrail_max_text_length
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Spawned, not forked: the worker process already runs threads and an event loop
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    async def scan(self, batch: TraceBatch, bodies: Optional[dict[str, str]] = None) -> list[tuple]:
+        """
+        Scan a batch, redacting it in place if configured
+
+        Args:
+            batch: Processed traces
+            bodies: Full offloaded bodies by content hash, scanned instead of
+                the previews; redacted bodies are added under their own hash
+
+        Returns:
+            list[tuple]: Violation records for ``ViolationWriter.write``
+        """
+        if bodies is None:
+            bodies = {}
+        hash_columns = [batch.columns.get(f"{field}_hash") for field in SCANNED_FIELDS]
+        texts = [
+            tuple(
+                bodies.get(hashes[i], text) if hashes is not None and hashes[i] else text
+                for text, hashes in zip(row, hash_columns)
+            )
+            for i, row in enumerate(zip(*(batch[field] for field in SCANNED_FIELDS)))
+        ]
+        if not texts:
+            return []
+
+        if self.workers > 0:
+            size = max(-(-len(texts) // self.workers), MIN_CHUNK_SIZE)
+            loop = asyncio.get_running_loop()
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(
+                    self._executor(), scan_texts, texts[start:start + size], self.redact, self.max_length
+                )
+                for start in range(0, len(texts), size)
+            ))
+            results = [result for chunk in chunks for result in chunk]
+        else:
+            results = await asyncio.to_thread(scan_texts, texts, self.redact, self.max_length)
+
+        records = []
+        for i, fields in enumerate(results):
+            for field, hashes, text, (violations, redacted) in zip(SCANNED_FIELDS, hash_columns, texts[i], fields):
+                if redacted is not None:
+                    if hashes is not None and hashes[i] in bodies:
+                        # Full offloaded body: store the redacted text as a body of its own
+                        content_hash = hashlib.sha256(redacted.encode('utf-8')).hexdigest()
+                        bodies[content_hash] = redacted
+                        hashes[i] = content_hash
+                        batch[field][i] = redacted[:len(batch[field][i])]
+                    else:
+                        batch[field][i] = redacted
+                for n, violation in enumerate(violations):
+                    records.append(self._record(batch, i, field, n, text, redacted, violation))
+        return records
+
+    def _record(self, batch: TraceBatch, i: int, field: str, n: int, text: str,
+                redacted: Optional[str], violation: dict) -> tuple:
+        trace_id = batch['trace_id'][i]
+        timestamp = batch['timestamp'][i]
+        # Deterministic ID, so redelivered traces do not record their violations twice
+        violation_id = uuid.uuid5(uuid.NAMESPACE_URL, f"trace-violation:{trace_id}:{timestamp.isoformat()}:{field}:{n}")
+        content = redacted if self.redact and redacted is not None else text
+        return (
+            violation_id,
+            batch['workspace_id'][i],
+            violation['type'],
+            trace_id,
+            timestamp,
+            violation['severity'],
+            violation['message'],
+            content[:1000],
+            redacted[:1000] if redacted is not None and violation['type'] == 'pii_detection' else None,
+            json.dumps(dict(violation['details'], field=field, source='processing'))
+        )
+
+    def close(self):
+        """Stop the scanner processes"""
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+class ViolationWriter:
+    """
+    Stores guardrail violations found by the scanner in the metadata database
+
+    Violations reference the workspace's active guardrail rule for their
+    type; as in the guardrail service, a default "log" rule is created for
+    workspaces that have none.
+    """
+
+    def __init__(self, postgres_url: Optional[str] = None):
+        """
+        Initialize writer
+
+        Args:
+            postgres_url: PostgreSQL (metadata) connection URL
+        """
+        self.postgres_url = postgres_url or os.getenv('POSTGRES_URL')
+        self.pool: Optional[asyncpg.Pool] = None
+        self._rule_ids: dict[tuple[str, str], uuid.UUID] = {}
+
+    async def connect(self):
+        """Create the database connection pool"""
+        try:
+            self.pool = await asyncpg.create_pool(self.postgres_url, min_size=1, max_size=2)
+            logger.info("Connected to PostgreSQL for guardrail violations")
+        except Exception as e:
+            logger.error(f"Failed to connect to PostgreSQL: {str(e)}")
+            raise
+
+    async def disconnect(self):
+        """Close the database connection pool"""
+        if self.pool:
+            await self.pool.close()
+
+    async def _resolve_rules(self, conn: asyncpg.Connection, keys: set[tuple[str, str]]):
+        """Look up (or create) the rule of each (workspace_id, violation type)"""
+        missing = [key for key in keys if key not in self._rule_ids]
+        if not missing:
+            return
+
+        rows = await conn.fetch(
+            """
+            SELECT DISTINCT ON (workspace_id, rule_type) workspace_id::text AS workspace_id, rule_type, id
+            FROM guardrail_rules
+            WHERE workspace_id = ANY($1::uuid[]) AND rule_type = ANY($2::text[]) AND is_active = true
+            ORDER BY workspace_id, rule_type, created_at
+            """,
+            list({workspace_id for workspace_id, _ in missing}),
+            list({rule_type for _, rule_type in missing})
+        )
+        for row in rows:
+            self._rule_ids[(row['workspace_id'], row['rule_type'])] = row['id']
+
+        for workspace_id, rule_type in missing:
+            if (workspace_id, rule_type) in self._rule_ids:
+                continue
+            self._rule_ids[(workspace_id, rule_type)] = await conn.fetchval(
+                """
+                INSERT INTO guardrail_rules (workspace_id, rule_type, name, action, is_active)
+                VALUES ($1, $2, $3, 'log', true)
+                RETURNING id
+                """,
+                workspace_id, rule_type, f"Default {rule_type} rule"
+            )
+
+    async def write(self, records: list[tuple]) -> int:
+        """
+        Bulk-insert violation records
+
+        Args:
+            records: Records from ``GuardrailScanner.scan``
+
+        Returns:
+            int: Number of violations written (or already present)
+
+        Raises:
+            Exception: If the write fails; the batch must not be acknowledged
+                (violation IDs are deterministic, so its redelivery is idempotent)
+        """
+        if not records:
+            return 0
+        if not self.pool:
+            await self.connect()
+
+        try:
+            async with self.pool.acquire() as conn:
+                await self._resolve_rules(conn, {(str(r[1]), r[2]) for r in records})
+                await conn.executemany(
+                    """
+                    INSERT INTO guardrail_violations
+                    (id, workspace_id, rule_id, trace_id, detected_at, violation_type,
+                     severity, message, detected_content, redacted_content, metadata)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+                    ON CONFLICT (id) DO NOTHING
+                    """,
+                    [
+                        (violation_id, workspace_id, self._rule_ids[(str(workspace_id), rule_type)],
+                         trace_id, detected_at, rule_type, *rest)
+                        for violation_id, workspace_id, rule_type, trace_id, detected_at, *rest in records
+                    ]
+                )
+        except Exception as e:
+            logger.error(f"Failed to write {len(records)} guardrail violations: {str(e)}")
+            self._rule_ids.clear()  # A cached rule may have been deleted
+            raise
+
+        return len(records)
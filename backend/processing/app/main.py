@@ -1,11 +1,24 @@
 """Processing Service - Consumes traces from Redis and writes to TimescaleDB"""
 import asyncio
+import json
 import logging
+import os
 import signal
 import sys
+import time
+from typing import Optional
+from .config import get_settings
+from .adaptive import AdaptiveBatcher, entry_time_ms
+from .batch import TraceBatch
 from .consumer import TraceConsumer
+from .guardrails import GuardrailScanner, ViolationWriter
+from .metrics import (
+    BATCH_SIZE, CONSUMER_LAG, DB_POOL_CONNECTIONS, PENDING_ENTRIES, QUEUED_BATCHES,
+    STAGE_SECONDS, TRACES, monitor_event_loop, serve_metrics
+)
 from .processor import TraceProcessor
 from .writer import TraceWriter
+from .sampling import TailSampler
 
 # Configure logging
 logging.basicConfig(
@@ -16,74 +29,362 @@ logger = logging.getLogger(__name__)
 
 
 class ProcessingService:
-    """Main processing service that orchestrates consume-process-write pipeline"""
+    """
+    Main processing service that orchestrates consume-process-write pipeline
+
+    The stages run concurrently, connected by bounded queues:
+
+    - a reader pulls batches from the Redis stream (the blocking XREADGROUP
+      runs in a worker thread, off the event loop), sized and flushed by
+      an ``AdaptiveBatcher``;
+    - a processor validates, enriches and samples each batch, and with
+      ``guardrails_enabled`` scans it for guardrail violations (redacting
+      PII if configured);
+    - ``writer_concurrency`` writers store batches (and their violations)
+      on the connection pool and acknowledge their entries once the write
+      has committed.
+
+    When the writers fall behind the queues fill up and the reader stops
+    reading, so unacknowledged entries never pile up in memory. Batches may
+    commit out of order; every write is idempotent.
+
+    Every ``reclaim_interval_s`` the reader claims entries that other
+    consumers left pending for longer than ``reclaim_min_idle_ms`` instead
+    of reading new ones. Throughput and a heartbeat are reported into the
+    ``traces:workers`` hash every ``worker_stats_interval_s``, and
+    per-stage latencies, batch sizes, lag, PEL size, dead-lettering, pool
+    use and event-loop lag are served in the Prometheus text format on
+    ``metrics_port``.
+    """
 
-    def __init__(self):
+    WORKERS_KEY = "traces:workers"
+
+    def __init__(self, metrics_port: Optional[int] = None):
+        """
+        Initialize service
+
+        Args:
+            metrics_port: Port serving /metrics (default: METRICS_PORT; 0 disables it)
+        """
+        settings = get_settings()
         self.consumer = TraceConsumer()
-        self.processor = TraceProcessor()
+        self.processor = TraceProcessor(TailSampler(self.consumer.client))
         self.writer = TraceWriter()
+        self.guardrails = GuardrailScanner()
+        self.violation_writer = ViolationWriter()
+        self.block_ms = settings.pipeline_block_ms
+        self.writer_concurrency = settings.writer_concurrency
+        self.batcher = AdaptiveBatcher(self.writer_concurrency)
+        self.lag_sample_interval = settings.batch_lag_sample_interval_s
+        self.reclaim_interval = settings.reclaim_interval_s
+        self.reclaim_min_idle_ms = settings.reclaim_min_idle_ms
+        self.reclaim_max_deliveries = settings.reclaim_max_deliveries
+        self.stats_interval = settings.worker_stats_interval_s
+        self.read_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.pipeline_queue_depth)
+        self.write_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.pipeline_queue_depth)
         self.running = False
         self.total_processed = 0
         self.total_failed = 0
 
+        self.metrics_port = settings.metrics_port if metrics_port is None else metrics_port
+
     async def start(self):
         """Start the processing service"""
         logger.info("Starting Processing Service...")
 
         # Connect to database
         await self.writer.connect()
+        if self.guardrails.enabled:
+            await self.violation_writer.connect()
 
         # Set up signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
 
         self.running = True
-        logger.info("Processing Service started successfully")
+        logger.info(f"Processing Service started successfully ({self.writer_concurrency} writers)")
 
-        # Main processing loop
-        while self.running:
-            await self.process_batch()
+        if self.metrics_port:
+            # Served from a daemon thread for the life of the process
+            serve_metrics(self.metrics_port)
+            logger.info(f"Serving metrics on port {self.metrics_port}")
 
-    async def process_batch(self):
-        """Process a single batch of traces"""
+        # Run the pipeline until the reader stops and the queues have drained
+        background = [asyncio.create_task(self.stats_loop()), asyncio.create_task(monitor_event_loop())]
         try:
-            # Consume traces from Redis Stream
-            traces = self.consumer.consume_batch(batch_size=100, block_ms=1000)
+            await asyncio.gather(
+                self.read_loop(),
+                self.process_loop(),
+                *(self.write_loop() for _ in range(self.writer_concurrency))
+            )
+        finally:
+            for task in background:
+                task.cancel()
+
+    async def read_loop(self):
+        """Read batches from Redis Streams until stopped"""
+        next_reclaim = time.monotonic() + self.reclaim_interval
+        next_lag_sample = 0.0
+        buffer: list[dict] = []
 
-            if not traces:
-                # No messages available, wait a bit
-                await asyncio.sleep(0.1)
-                return
+        while self.running:
+            try:
+                if time.monotonic() >= next_lag_sample:
+                    next_lag_sample = time.monotonic() + self.lag_sample_interval
+                    lag = await asyncio.to_thread(self.consumer.get_lag)
+                    self.batcher.observe_lag(lag)
+                    if lag is not None:
+                        CONSUMER_LAG.set(lag)
+                    PENDING_ENTRIES.set(await asyncio.to_thread(self.consumer.get_pending_count))
+                    self._sample_gauges()
+
+                if time.monotonic() >= next_reclaim:
+                    next_reclaim = time.monotonic() + self.reclaim_interval
+                    await asyncio.to_thread(self.consumer.prune_consumers, 10 * self.reclaim_min_idle_ms)
+                    reclaimed = await asyncio.to_thread(
+                        self.consumer.reclaim_batch,
+                        batch_size=self.batcher.batch_size,
+                        min_idle_ms=self.reclaim_min_idle_ms,
+                        max_deliveries=self.reclaim_max_deliveries
+                    )
+                    if reclaimed:
+                        await self.read_queue.put(reclaimed)
+                    continue
+
+                if len(buffer) >= self.batcher.batch_size:
+                    # The adaptive batch size shrank below what is already buffered: flush it as is
+                    traces = []
+                else:
+                    # Wait for more entries only until the buffered batch is due
+                    block_ms = self.block_ms
+                    if buffer:
+                        block_ms = min(block_ms, max(int(self._flush_in_ms(buffer)), 1))
+                    traces = await asyncio.to_thread(
+                        self.consumer.consume_batch,
+                        batch_size=self.batcher.batch_size - len(buffer),
+                        block_ms=block_ms
+                    )
+            except Exception as e:
+                logger.error(f"Error reading from stream: {str(e)}")
+                await asyncio.sleep(1)  # Wait before retrying
+                continue
+
+            buffer.extend(traces)
+            if buffer and (len(buffer) >= self.batcher.batch_size or self._flush_in_ms(buffer) <= 0):
+                logger.info(f"Consumed {len(buffer)} traces from stream")
+                # Waits while the processor and writers are behind
+                await self.read_queue.put(buffer)
+                buffer = []
+
+        if buffer:
+            await self.read_queue.put(buffer)
+        await self.read_queue.put(None)
 
-            logger.info(f"Consumed {len(traces)} traces from stream")
+    def _sample_gauges(self):
+        """Report the queue depths and pool use (sampled: callback gauges are not collected across processes)"""
+        QUEUED_BATCHES.labels(queue="read").set(self.read_queue.qsize())
+        QUEUED_BATCHES.labels(queue="write").set(self.write_queue.qsize())
+        pool = self.writer.pool
+        if pool:
+            DB_POOL_CONNECTIONS.labels(state="in_use").set(pool.get_size() - pool.get_idle_size())
+            DB_POOL_CONNECTIONS.labels(state="size").set(pool.get_size())
+            DB_POOL_CONNECTIONS.labels(state="max").set(pool.get_max_size())
 
-            # Extract message IDs for acknowledgment
-            message_ids = [trace.pop('_message_id') for trace in traces]
+    def _flush_in_ms(self, buffer: list[dict]) -> float:
+        """Time left before the buffered batch must be flushed"""
+        return self.batcher.flush_in_ms(min(entry_time_ms(trace['_message_id']) for trace in buffer))
 
-            # Process traces
-            processed_traces, failed_traces = self.processor.process_batch(traces)
+    async def process_loop(self):
+        """Process batches from the reader and hand them to the writers"""
+        while True:
+            traces = await self.read_queue.get()
+            if traces is None:
+                break
+
+            # Extract (stream, message ID, trace ID) for acknowledgment and dead-lettering
+            messages = [
+                (trace.pop('_stream_name'), trace.pop('_message_id'), trace.get('trace_id')) for trace in traces
+            ]
+
+            BATCH_SIZE.observe(len(traces))
+            try:
+                # CPU-bound, and tail sampling may refresh its rules from Redis
+                with STAGE_SECONDS.labels(stage="process").time():
+                    processed_traces, failed_traces = await asyncio.to_thread(
+                        self.processor.process_columns, traces
+                    )
+            except Exception as e:
+                # Left pending for redelivery
+                logger.error(f"Error processing batch: {str(e)}")
+                continue
 
             if failed_traces:
                 logger.warning(f"Failed to process {len(failed_traces)} traces")
-                self.total_failed += len(failed_traces)
+                self._count(failed=len(failed_traces))
 
-            if processed_traces:
-                # Write to TimescaleDB
-                successful, failed = await self.writer.write_batch(processed_traces)
-                self.total_processed += successful
-                self.total_failed += failed
+            violations, bodies = [], None
+            if self.guardrails.enabled:
+                try:
+                    with STAGE_SECONDS.labels(stage="scan").time():
+                        violations, bodies = await self.scan_batch(processed_traces)
+                except Exception as e:
+                    # Not written unscanned (or unredacted): left pending for redelivery
+                    logger.error(f"Error scanning batch: {str(e)}")
+                    continue
 
-                logger.info(
-                    f"Batch complete: {successful} written, {failed} failed. "
-                    f"Total: {self.total_processed} processed, {self.total_failed} failed"
-                )
+            await self.write_queue.put((messages, processed_traces, violations, bodies))
 
-            # Acknowledge messages
-            self.consumer.acknowledge_batch(message_ids)
+        for _ in range(self.writer_concurrency):
+            await self.write_queue.put(None)
 
-        except Exception as e:
-            logger.error(f"Error in process_batch: {str(e)}")
-            await asyncio.sleep(1)  # Wait before retrying
+    async def write_loop(self):
+        """Write processed batches, then acknowledge them"""
+        while True:
+            item = await self.write_queue.get()
+            if item is None:
+                break
+
+            messages, processed_traces, violations, bodies = item
+            try:
+                started = time.monotonic()
+                _, rejected = await self.write_batch(processed_traces, violations, bodies)
+                elapsed = time.monotonic() - started
+                self.batcher.observe_write(elapsed)
+                STAGE_SECONDS.labels(stage="write").observe(elapsed)
+            except Exception as e:
+                # Not acknowledged: the entries stay pending for redelivery
+                logger.error(f"Error writing batch: {str(e)}")
+                continue
+
+            if rejected:
+                # Rows the database refused are kept in the DLQ, not dropped with the batch
+                await asyncio.to_thread(self.consumer.dead_letter, [
+                    (stream, message_id, rejected[trace_id])
+                    for stream, message_id, trace_id in messages if trace_id in rejected
+                ], "rejected")
+
+            # Acknowledge messages only after their write committed
+            with STAGE_SECONDS.labels(stage="ack").time():
+                await asyncio.to_thread(self.consumer.acknowledge_messages, [
+                    (stream, message_id) for stream, message_id, trace_id in messages if trace_id not in rejected
+                ])
+
+    async def scan_batch(self, batch: TraceBatch) -> tuple[list[tuple], Optional[dict[str, str]]]:
+        """
+        Scan a processed batch for guardrail violations, redacting it in place if configured
+
+        With redaction the offloaded bodies are fetched and scanned in full,
+        so PII beyond the preview is redacted before anything is stored.
+
+        Returns:
+            tuple: (violation records, offloaded bodies by content hash for
+                ``write_batch``, or None when they were not fetched)
+        """
+        bodies = None
+        if self.guardrails.redact:
+            content_hashes = {
+                content_hash
+                for content_hash in batch['input_hash'] + batch['output_hash']
+                if content_hash
+            }
+            bodies = await asyncio.to_thread(self.consumer.fetch_payloads, list(content_hashes))
+        violations = await self.guardrails.scan(batch, bodies)
+        return violations, bodies
+
+    async def write_batch(
+        self,
+        processed_traces: TraceBatch,
+        violations: Optional[list[tuple]] = None,
+        bodies: Optional[dict[str, str]] = None
+    ) -> tuple[int, dict[str, str]]:
+        """
+        Write one processed batch to TimescaleDB, and its guardrail violations to PostgreSQL
+
+        Args:
+            processed_traces: Processed (and scanned) traces
+            violations: Records from ``scan_batch``
+            bodies: Offloaded bodies already fetched (and redacted) by ``scan_batch``
+
+        Returns:
+            tuple: (traces written, database error by trace ID of the rows it rejected)
+
+        Raises:
+            Exception: If any part of the batch could not be written for
+                another reason than its data; it must be redelivered
+        """
+        written, rejected = 0, {}
+
+        # Sampled-out traces only feed the rollup
+        sampled = processed_traces['sampled']
+        if not all(sampled):
+            sampled_out = processed_traces.where([not keep for keep in sampled])
+            written = await self.writer.write_sampled_out(sampled_out)
+            processed_traces = processed_traces.where(sampled)
+
+        if len(processed_traces):
+            # Store offloaded bodies before the traces that reference them
+            content_hashes = {
+                content_hash
+                for content_hash in processed_traces['input_hash'] + processed_traces['output_hash']
+                if content_hash
+            }
+            new_hashes = self.writer.payloads_to_store(content_hashes)
+            if new_hashes:
+                bodies = bodies or {}
+                to_write = {
+                    content_hash: bodies[content_hash] for content_hash in new_hashes if content_hash in bodies
+                }
+                unfetched = [content_hash for content_hash in new_hashes if content_hash not in bodies]
+                if unfetched:
+                    to_write.update(await asyncio.to_thread(self.consumer.fetch_payloads, unfetched))
+                await self.writer.write_payloads(to_write)
+
+            # Write to TimescaleDB
+            successful, rejected = await self.writer.write_batch(processed_traces)
+            written += successful
+
+        self._count(processed=written, failed=len(rejected))
+        if len(processed_traces):
+            logger.info(
+                f"Batch complete: {successful} written, {len(rejected)} rejected. "
+                f"Total: {self.total_processed} processed, {self.total_failed} failed"
+            )
+
+        if violations:
+            recorded = await self.violation_writer.write(violations)
+            logger.info(f"Recorded {recorded} guardrail violations")
+
+        return written, rejected
+
+    def _count(self, processed: int = 0, failed: int = 0):
+        """Add to the processed and failed totals"""
+        self.total_processed += processed
+        self.total_failed += failed
+        TRACES.labels(result="processed").inc(processed)
+        TRACES.labels(result="failed").inc(failed)
+
+    async def stats_loop(self):
+        """Report this worker's heartbeat and throughput"""
+        last_processed, last_time = self.total_processed, time.monotonic()
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            now = time.monotonic()
+            stats = {
+                "pid": os.getpid(),
+                "processed": self.total_processed,
+                "failed": self.total_failed,
+                "traces_per_s": round((self.total_processed - last_processed) / (now - last_time), 1),
+                "streams": len(self.consumer.streams),
+                "queued": self.read_queue.qsize() + self.write_queue.qsize(),
+                "heartbeat": time.time()
+            }
+            last_processed, last_time = self.total_processed, now
+            try:
+                await asyncio.to_thread(
+                    self.consumer.client.hset, self.WORKERS_KEY, self.consumer.consumer_name, json.dumps(stats)
+                )
+            except Exception as e:
+                logger.warning(f"Failed to report worker stats: {str(e)}")
 
     async def stop(self):
         """Stop the processing service gracefully"""
@@ -92,6 +393,12 @@ class ProcessingService:
 
         # Close connections
         await self.writer.disconnect()
+        await self.violation_writer.disconnect()
+        self.guardrails.close()
+        try:
+            self.consumer.client.hdel(self.WORKERS_KEY, self.consumer.consumer_name)
+        except Exception as e:
+            logger.warning(f"Failed to remove worker stats: {str(e)}")
         self.consumer.close()
 
         logger.info(f"Processing Service stopped. Total processed: {self.total_processed}, Total failed: {self.total_failed}")
@@ -102,9 +409,9 @@ class ProcessingService:
         self.running = False
 
 
-async def main():
+async def main(metrics_port: Optional[int] = None):
     """Main entry point"""
-    service = ProcessingService()
+    service = ProcessingService(metrics_port)
 
     try:
         await service.start()
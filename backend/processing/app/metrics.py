@@ -0,0 +1,85 @@
+"""Prometheus metrics of the processing service"""
+import asyncio
+import glob
+import os
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server
+
+# With PROMETHEUS_MULTIPROC_DIR set (as in the image), the workers forked by the
+# supervisor write their samples to files there and the supervisor serves all
+# of them on metrics_port. Without it, each process serves only its own.
+
+# Seconds; batch stages take from sub-millisecond (ack) to seconds (large writes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+STAGE_SECONDS = Histogram(
+    "processing_stage_seconds",
+    "Time spent on one batch per pipeline stage (read, parse, process, scan, write, ack)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "processing_batch_size", "Entries per processed batch", buckets=BATCH_SIZE_BUCKETS
+)
+TRACES = Counter(
+    "processing_traces", "Traces handled, by result (processed or failed)", ["result"]
+)
+DEAD_LETTERED = Counter(
+    "processing_dead_letter", "Stream entries moved to the dead-letter stream", ["reason"]
+)
+# Workers may own the same streams, so lag and PEL size are reported per worker (pid label)
+CONSUMER_LAG = Gauge(
+    "processing_consumer_lag", "Entries not yet read by the consumer group, over the owned streams",
+    multiprocess_mode="liveall"
+)
+PENDING_ENTRIES = Gauge(
+    "processing_pending_entries", "Entries read but not acknowledged (PEL size), over the owned streams",
+    multiprocess_mode="liveall"
+)
+QUEUED_BATCHES = Gauge(
+    "processing_queued_batches", "Batches waiting between pipeline stages", ["queue"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "processing_db_pool_connections", "TimescaleDB pool connections (in_use, size, max)", ["state"],
+    multiprocess_mode="livesum"
+)
+EVENT_LOOP_LAG = Histogram(
+    "processing_event_loop_lag_seconds", "Delay of event loop callbacks beyond their scheduled time",
+    buckets=LATENCY_BUCKETS
+)
+
+
+async def monitor_event_loop(interval_s: float = 0.1):
+    """Measure how late the event loop wakes up from a sleep, until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval_s
+        await asyncio.sleep(interval_s)
+        EVENT_LOOP_LAG.observe(max(loop.time() - scheduled, 0.0))
+
+
+def multiprocess_enabled() -> bool:
+    """Whether samples are collected across processes (PROMETHEUS_MULTIPROC_DIR is set)"""
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def reset_multiprocess_dir():
+    """Remove the sample files of previous runs; call before starting the workers"""
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited worker (its counters and histograms are kept)"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+
+def serve_metrics(port: int):
+    """Serve /metrics from a daemon thread: every worker's samples in multiprocess mode, else this process's"""
+    registry = REGISTRY
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
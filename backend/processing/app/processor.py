@@ -2,13 +2,48 @@
 import logging
 from datetime import datetime, timezone
 from typing import Optional
+from .batch import BATCH_COLUMNS, TraceBatch
+from .sampling import TailSampler
 
 logger = logging.getLogger(__name__)
 
+# Fields a trace must have, in the order they are reported missing
+REQUIRED_FIELDS = ('trace_id', 'workspace_id', 'agent_id', 'timestamp', 'latency_ms', 'model', 'model_provider')
+
+# Defaults of the optional fields
+OPTIONAL_FIELDS = {
+    'input': '',
+    'output': '',
+    'error': None,
+    'status': 'success',
+    'tokens_input': None,
+    'tokens_output': None,
+    'tokens_total': None,
+    'cost_usd': None,
+    'metadata': {},
+    'tags': [],
+    # Set when input/output hold a preview of an offloaded body
+    'input_hash': None,
+    'output_hash': None,
+    # False when only counted in the sampled-out rollup
+    'sampled': True
+}
+
+VALID_STATUSES = frozenset(('success', 'error', 'timeout'))
+
 
 class TraceProcessor:
     """Processes raw traces and extracts metrics"""
 
+    def __init__(self, sampler: Optional[TailSampler] = None):
+        """
+        Initialize processor
+
+        Args:
+            sampler: Tail sampler deciding which traces are stored in full
+        """
+        self.sampler = sampler
+
     def process_trace(self, trace_data: dict) -> dict:
         """
         Process a single trace
@@ -38,7 +73,12 @@ class TraceProcessor:
                 'tokens_total': trace_data.get('tokens_total'),
                 'cost_usd': trace_data.get('cost_usd'),
                 'metadata': trace_data.get('metadata', {}),
-                'tags': trace_data.get('tags', [])
+                'tags': trace_data.get('tags', []),
+                # Set when input/output hold a preview of an offloaded body
+                'input_hash': trace_data.get('input_hash'),
+                'output_hash': trace_data.get('output_hash'),
+                # False when only counted in the sampled-out rollup
+                'sampled': trace_data.get('sampled', True)
             }
 
             # Calculate total tokens if not provided
@@ -63,28 +103,104 @@ class TraceProcessor:
         """
         Process a batch of traces
 
+        Tail sampling decisions are made for the whole batch: each processed
+        trace has ``sampled`` set to whether it should be stored in full.
+
         Args:
             traces: List of raw trace dictionaries
 
         Returns:
             tuple: (processed_traces, failed_traces)
         """
-        processed = []
-        failed = []
+        batch, failed = self.process_columns(traces)
+        return batch.to_dicts(), failed
+
+    def process_columns(self, traces: list[dict]) -> tuple[TraceBatch, list[dict]]:
+        """
+        Process a batch of traces into columns
+
+        Same rules as ``process_trace``, applied one column at a time
+        instead of building a dict per trace.
 
+        Args:
+            traces: List of raw trace dictionaries
+
+        Returns:
+            tuple: (TraceBatch of processed traces, failed_traces)
+        """
+        failed = []
+        required = frozenset(REQUIRED_FIELDS)
+        valid = []
         for trace in traces:
-            try:
-                processed_trace = self.process_trace(trace)
-                processed.append(processed_trace)
-            except Exception as e:
-                logger.error(f"Failed to process trace {trace.get('trace_id', 'unknown')}: {str(e)}")
-                failed.append({
-                    'trace_id': trace.get('trace_id', 'unknown'),
-                    'error': str(e),
-                    'raw_data': trace
-                })
-
-        return processed, failed
+            if required.issubset(trace):
+                valid.append(trace)
+            else:
+                missing = next(name for name in REQUIRED_FIELDS if name not in trace)
+                failed.append(self._failure(trace, ValueError(f"Missing required field: '{missing}'")))
+
+        try:
+            latencies = [int(trace['latency_ms']) for trace in valid]
+        except (TypeError, ValueError):
+            # Isolate the traces with an invalid latency
+            latencies, kept = [], []
+            for trace in valid:
+                try:
+                    latencies.append(int(trace['latency_ms']))
+                    kept.append(trace)
+                except (TypeError, ValueError) as e:
+                    failed.append(self._failure(trace, e))
+            valid = kept
+
+        columns = {name: [trace[name] for trace in valid] for name in REQUIRED_FIELDS}
+        for name, default in OPTIONAL_FIELDS.items():
+            columns[name] = [trace.get(name, default) for trace in valid]
+        columns['latency_ms'] = latencies
+        columns['timestamp'] = self._parse_timestamps(columns['timestamp'])
+
+        # Calculate total tokens if not provided
+        columns['tokens_total'] = [
+            tokens_input + tokens_output if total is None and tokens_input and tokens_output else total
+            for tokens_input, tokens_output, total in zip(
+                columns['tokens_input'], columns['tokens_output'], columns['tokens_total']
+            )
+        ]
+
+        # Validate status
+        statuses = columns['status']
+        invalid = [i for i, status in enumerate(statuses) if status not in VALID_STATUSES]
+        if invalid:
+            logger.warning(f"Invalid status on {len(invalid)} traces (e.g. '{statuses[invalid[0]]}'), defaulting to 'success'")
+            for i in invalid:
+                statuses[i] = 'success'
+
+        batch = TraceBatch({name: columns[name] for name in BATCH_COLUMNS})
+        if self.sampler and len(batch):
+            self.sampler.decide(batch)
+
+        return batch, failed
+
+    @staticmethod
+    def _failure(trace: dict, error: Exception) -> dict:
+        logger.error(f"Failed to process trace {trace.get('trace_id', 'unknown')}: {str(error)}")
+        return {
+            'trace_id': trace.get('trace_id', 'unknown'),
+            'error': str(error),
+            'raw_data': trace
+        }
+
+    def _parse_timestamps(self, timestamps: list) -> list[datetime]:
+        """Parse a column of timestamps, once per distinct value"""
+        parsed = {}
+        column = []
+        for timestamp in timestamps:
+            if isinstance(timestamp, datetime):
+                column.append(timestamp)
+                continue
+            value = parsed.get(timestamp)
+            if value is None:
+                value = parsed[timestamp] = self._parse_timestamp(timestamp)
+            column.append(value)
+        return column
 
     def _parse_timestamp(self, timestamp) -> datetime:
         """Parse timestamp to datetime object"""
@@ -0,0 +1,229 @@
+"""Replay of dead-lettered stream entries (python -m app.replay)"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+from .codec import decode_entry
+from .consumer import TraceConsumer
+from .main import ProcessingService
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY = "traces:dlq:replay"  # Hash with the progress of the running (or last) replay
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value or ""
+
+
+def error_class(error: str) -> str:
+    """Error without its per-entry details ("Invalid msgpack payload: ..." -> "Invalid msgpack payload")"""
+    return error.split(':', 1)[0].strip() or "unknown"
+
+
+def stream_id(moment: Optional[datetime], default: str) -> str:
+    """XRANGE bound for entries dead-lettered at ``moment`` (entry IDs start with the time in ms)"""
+    return default if moment is None else str(int(moment.timestamp() * 1000))
+
+
+class DLQReplayer:
+    """
+    Reprocesses entries of the dead-letter stream
+
+    The DLQ is scanned in pages of ``page_size`` entries, keeping those
+    whose error matches ``error_pattern`` and that were dead-lettered
+    between ``since`` and ``until``. Each page of matching entries is
+    decoded, run through the current TraceProcessor and written with the
+    pipeline's own write path (staging COPY, payloads, rollup, guardrail
+    violations), with up to ``concurrency`` pages in flight.
+
+    Entries are deleted from the DLQ once their page has committed; entries
+    that still fail, and whole pages whose write failed, stay for the next
+    attempt. Writes are idempotent, so an interrupted replay can simply be
+    run again. Progress is logged and kept in the ``traces:dlq:replay`` hash.
+    """
+
+    def __init__(
+        self,
+        service: Optional[ProcessingService] = None,
+        page_size: int = 1000,
+        concurrency: Optional[int] = None
+    ):
+        """
+        Initialize replayer
+
+        Args:
+            service: Processing service whose processor and writers are used
+                (default: a new one without a metrics server)
+            page_size: Entries read (and written) per page
+            concurrency: Pages written at once (default: WRITER_CONCURRENCY)
+        """
+        self.service = service or ProcessingService(metrics_port=0)
+        self.client = self.service.consumer.client
+        self.page_size = page_size
+        self.concurrency = concurrency or self.service.writer_concurrency
+        self.stats: dict = {}
+
+    async def replay(
+        self,
+        error_pattern: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        dry_run: bool = False
+    ) -> dict:
+        """
+        Replay matching DLQ entries
+
+        Args:
+            error_pattern: Regular expression the entry's error must match
+            since: Only entries dead-lettered at or after this time
+            until: Only entries dead-lettered at or before this time
+            limit: Stop after this many matching entries
+            dry_run: Only count the matching entries (by error class)
+
+        Returns:
+            dict: scanned, matched, replayed and failed entry counts, and
+                matched entries by error class
+        """
+        pattern = re.compile(error_pattern) if error_pattern else None
+        start, end = stream_id(since, '-'), stream_id(until, '+')
+        self.stats = {"scanned": 0, "matched": 0, "replayed": 0, "failed": 0, "errors": {}, "started_at": time.time()}
+
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight: set[asyncio.Task] = set()
+        while limit is None or self.stats["matched"] < limit:
+            page = await asyncio.to_thread(
+                self.client.xrange, TraceConsumer.DLQ_STREAM, min=start, max=end, count=self.page_size
+            )
+            if not page:
+                break
+            start = '(' + _text(page[-1][0])
+
+            matched = []
+            for entry_id, fields in page:
+                self.stats["scanned"] += 1
+                error = _text(fields.get(b'error', fields.get('error')))
+                if pattern is not None and not pattern.search(error):
+                    continue
+                errors = self.stats["errors"]
+                errors[error_class(error)] = errors.get(error_class(error), 0) + 1
+                self.stats["matched"] += 1
+                matched.append((entry_id, fields))
+                if limit is not None and self.stats["matched"] >= limit:
+                    break
+
+            if matched and not dry_run:
+                # Waits while `concurrency` pages are being written
+                await slots.acquire()
+                task = asyncio.create_task(self._replay_page(matched))
+                task.add_done_callback(lambda _: slots.release())
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            await self._report()
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        await self._report(done=True)
+        return self.stats
+
+    async def _replay_page(self, entries: list[tuple]):
+        """Process and write one page of entries, then delete the replayed ones"""
+        traces, entry_ids = [], {}
+        for entry_id, fields in entries:
+            try:
+                trace = decode_entry(fields)
+            except Exception as e:
+                logger.warning(f"DLQ entry {_text(entry_id)} still does not decode: {str(e)}")
+                self.stats["failed"] += 1
+                continue
+            traces.append(trace)
+            entry_ids[id(trace)] = entry_id
+
+        try:
+            batch, failed = await asyncio.to_thread(self.service.processor.process_columns, traces)
+            violations, bodies = [], None
+            if self.service.guardrails.enabled:
+                violations, bodies = await self.service.scan_batch(batch)
+            _, unwritten = await self.service.write_batch(batch, violations, bodies)
+        except Exception as e:
+            logger.error(f"Failed to replay {len(traces)} DLQ entries: {str(e)}")
+            self.stats["failed"] += len(traces)
+            return
+
+        # Entries that still fail to process or to write stay in the DLQ
+        rejected = {id(failure['raw_data']) for failure in failed}
+        rejected.update(id(trace) for trace in traces if trace.get('trace_id') in unwritten)
+        replayed = [entry_ids[id(trace)] for trace in traces if id(trace) not in rejected]
+        if replayed:
+            await asyncio.to_thread(self.client.xdel, TraceConsumer.DLQ_STREAM, *replayed)
+        self.stats["replayed"] += len(replayed)
+        self.stats["failed"] += len(rejected)
+
+    async def _report(self, done: bool = False):
+        """Log progress and publish it into the progress hash"""
+        stats = self.stats
+        elapsed = max(time.time() - stats["started_at"], 1e-6)
+        logger.info(
+            f"DLQ replay{' finished' if done else ''}: {stats['scanned']} scanned, {stats['matched']} matched, "
+            f"{stats['replayed']} replayed, {stats['failed']} failed ({stats['replayed'] / elapsed:.0f} entries/s)"
+        )
+        try:
+            await asyncio.to_thread(
+                self.client.hset,
+                PROGRESS_KEY,
+                mapping={
+                    **{name: stats[name] for name in ("scanned", "matched", "replayed", "failed")},
+                    "errors": json.dumps(stats["errors"]),
+                    "state": "done" if done else "running",
+                    "updated_at": time.time()
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Failed to publish replay progress: {str(e)}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Replay the DLQ as requested on the command line"""
+    replayer = DLQReplayer(page_size=args.page_size, concurrency=args.concurrency)
+    service = replayer.service
+    try:
+        if not args.dry_run:
+            await service.writer.connect()
+            if service.guardrails.enabled:
+                await service.violation_writer.connect()
+        return await replayer.replay(
+            error_pattern=args.error,
+            since=args.since,
+            until=args.until,
+            limit=args.limit,
+            dry_run=args.dry_run
+        )
+    finally:
+        await service.stop()
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reprocess entries of the traces:dead_letter stream")
+    parser.add_argument("--error", help="Regular expression the entry's error must match")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Dead-lettered at or after (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Dead-lettered at or before (ISO 8601)")
+    parser.add_argument("--limit", type=int, help="Stop after this many matching entries")
+    parser.add_argument("--page-size", type=int, default=1000, help="Entries per page (default: 1000)")
+    parser.add_argument("--concurrency", type=int, help="Pages written at once (default: WRITER_CONCURRENCY)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count matching entries by error class")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    stats = asyncio.run(run(parse_args()))
+    print(json.dumps({name: value for name, value in stats.items() if name != "started_at"}, indent=2))
+    sys.exit(0 if stats["failed"] == 0 else 1)
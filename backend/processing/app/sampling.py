@@ -0,0 +1,155 @@
+"""Per-workspace tail sampling of processed traces"""
+import hashlib
+import json
+import logging
+import time
+from collections import deque
+from typing import Optional
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+RULES_KEY = "traces:sampling:rules"  # Hash: workspace_id (or "default") -> JSON rule
+
+
+def sample_point(stage: str, trace_id: str) -> float:
+    """Deterministic position of a trace in [0, 1) for a sampling stage"""
+    digest = hashlib.blake2b(f"{stage}:{trace_id}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+class SamplingRule:
+    """
+    Sampling policy of one workspace
+
+    Errors, timeouts, traces carrying one of ``keep_tags`` and traces
+    costing at least ``min_cost_usd`` are always kept in full. Other traces
+    are kept with probability ``head_rate`` at ingestion and ``tail_rate``
+    at processing, where latency outliers above the workspace's
+    ``latency_percentile`` are kept as well. Keep in sync with
+    ingestion/app/sampling.py.
+    """
+
+    __slots__ = ("head_rate", "tail_rate", "latency_percentile", "keep_tags", "min_cost_usd")
+
+    def __init__(
+        self,
+        head_rate: float = 1.0,
+        tail_rate: float = 1.0,
+        latency_percentile: Optional[float] = None,
+        keep_tags: tuple = (),
+        min_cost_usd: Optional[float] = None
+    ):
+        self.head_rate = head_rate
+        self.tail_rate = tail_rate
+        self.latency_percentile = latency_percentile
+        self.keep_tags = frozenset(keep_tags)
+        self.min_cost_usd = min_cost_usd
+
+    @classmethod
+    def from_dict(cls, data: dict, default: Optional["SamplingRule"] = None) -> "SamplingRule":
+        """Build a rule from its JSON form, falling back to ``default`` for missing fields"""
+        base = {name: getattr(default, name) for name in cls.__slots__} if default else {}
+        base.update({name: data[name] for name in cls.__slots__ if name in data})
+        return cls(**base)
+
+    def always_keep(self, trace_data: dict) -> bool:
+        """Whether a trace must be kept regardless of the sample rate"""
+        if trace_data.get('status', 'success') != 'success':
+            return True
+        if self.keep_tags and self.keep_tags.intersection(trace_data.get('tags') or ()):
+            return True
+        cost = trace_data.get('cost_usd')
+        return self.min_cost_usd is not None and cost is not None and cost >= self.min_cost_usd
+
+
+class TailSampler:
+    """
+    Tail sampling at processing
+
+    Decides per processed trace whether it is stored in full or only
+    counted in the sampled-out rollup. Traces dropped by head sampling stay
+    dropped. Latency percentiles are estimated per workspace from the last
+    ``window`` latencies seen (including sampled-out traces). Rules are
+    reloaded from Redis every ``sampling_rules_refresh_s``.
+    """
+
+    def __init__(self, client, window: int = 2000):
+        """
+        Initialize sampler
+
+        Args:
+            client: Redis client holding the sampling rules
+            window: Recent latencies kept per workspace for percentiles
+        """
+        settings = get_settings()
+        self.client = client
+        self.window = window
+        self.refresh_interval = settings.sampling_rules_refresh_s
+        self.default = SamplingRule(
+            tail_rate=settings.sampling_tail_rate,
+            latency_percentile=settings.sampling_latency_percentile
+        )
+        self.rules: dict[str, SamplingRule] = {}
+        self._latencies: dict[str, deque] = {}
+        self._next_refresh = 0.0
+
+    def refresh(self):
+        """Load per-workspace rules from Redis"""
+        raw = self.client.hgetall(RULES_KEY)
+        rules = {
+            (k.decode('utf-8') if isinstance(k, bytes) else k): json.loads(v)
+            for k, v in raw.items()
+        }
+        settings = get_settings()
+        default = SamplingRule.from_dict(rules.pop("default", {}), SamplingRule(
+            tail_rate=settings.sampling_tail_rate,
+            latency_percentile=settings.sampling_latency_percentile
+        ))
+        self.default = default
+        self.rules = {workspace_id: SamplingRule.from_dict(rule, default) for workspace_id, rule in rules.items()}
+
+    def _maybe_refresh(self):
+        if time.monotonic() < self._next_refresh:
+            return
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Failed to refresh sampling rules: {str(e)}")
+
+    def decide(self, traces: list[dict]):
+        """
+        Set ``sampled`` on each processed trace of a batch
+
+        Args:
+            traces: Processed traces; ``sampled`` is False for head-dropped ones
+        """
+        self._maybe_refresh()
+
+        for trace in traces:
+            latencies = self._latencies.get(trace['workspace_id'])
+            if latencies is None:
+                latencies = self._latencies[trace['workspace_id']] = deque(maxlen=self.window)
+            latencies.append(trace['latency_ms'])
+
+        thresholds = {}
+        for trace in traces:
+            if trace.get('sampled') is False:
+                continue
+
+            workspace_id = trace['workspace_id']
+            rule = self.rules.get(str(workspace_id), self.default)
+            if rule.tail_rate >= 1 or rule.always_keep(trace):
+                trace['sampled'] = True
+                continue
+
+            if rule.latency_percentile is not None:
+                if workspace_id not in thresholds:
+                    ordered = sorted(self._latencies[workspace_id])
+                    thresholds[workspace_id] = ordered[min(int(rule.latency_percentile * len(ordered)), len(ordered) - 1)]
+                if trace['latency_ms'] >= thresholds[workspace_id]:
+                    trace['sampled'] = True
+                    continue
+
+            trace['sampled'] = sample_point("tail", trace['trace_id']) < rule.tail_rate
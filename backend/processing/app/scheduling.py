@@ -0,0 +1,162 @@
+"""Weighted fair scheduling of consumed traces across workspaces"""
+import logging
+import time
+from collections import deque
+from typing import Optional
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_KEY = "traces:scheduling:weights"  # Hash: workspace_id (or "default") -> weight
+
+
+class FairScheduler:
+    """
+    Deficit round-robin over per-workspace sub-queues
+
+    The consumer reads ahead of the batch being filled and pushes every
+    entry into the sub-queue of its workspace. Batches are then filled
+    round by round: each workspace with queued entries earns
+    ``quantum * weight`` entries per round and hands out what it has
+    earned, so a workspace with a large backlog gets its weighted share of
+    every batch instead of all of it. Entries of a workspace keep their
+    stream order. Weights are reloaded from Redis every
+    ``fair_weights_refresh_s``.
+    """
+
+    def __init__(self, client, quantum: Optional[int] = None, refresh_interval: Optional[float] = None):
+        """
+        Initialize scheduler
+
+        Args:
+            client: Redis client holding the workspace weights
+            quantum: Entries a workspace of weight 1 may take per round
+            refresh_interval: Seconds between weight reloads
+        """
+        settings = get_settings()
+        self.client = client
+        self.quantum = quantum or settings.fair_quantum
+        self.refresh_interval = settings.fair_weights_refresh_s if refresh_interval is None else refresh_interval
+        self.default_weight = 1.0
+        self.weights: dict[str, float] = {}
+        self._next_refresh = 0.0
+
+        self._queues: dict[str, deque] = {}
+        self._deficits: dict[str, float] = {}
+        self._active: deque = deque()  # Workspaces with queued entries, in round order
+        self._granted = False  # Whether the workspace at the head already earned its quantum this round
+        self._per_stream: dict[str, int] = {}
+        self._message_ids: set[tuple[str, str]] = set()
+
+    def refresh(self):
+        """Load per-workspace weights from Redis (non-positive weights are ignored)"""
+        weights = {}
+        for key, value in self.client.hgetall(WEIGHTS_KEY).items():
+            try:
+                weight = float(value)
+            except (TypeError, ValueError):
+                continue
+            if weight > 0:
+                weights[key.decode('utf-8') if isinstance(key, bytes) else key] = weight
+        self.default_weight = weights.pop("default", 1.0)
+        self.weights = weights
+
+    def _maybe_refresh(self):
+        if time.monotonic() < self._next_refresh:
+            return
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Failed to refresh workspace weights: {str(e)}")
+
+    def weight(self, workspace_id: str) -> float:
+        return self.weights.get(workspace_id, self.default_weight)
+
+    def __len__(self) -> int:
+        return len(self._message_ids)
+
+    def __contains__(self, message: tuple[str, str]) -> bool:
+        """Whether a (stream, message ID) entry is queued"""
+        return message in self._message_ids
+
+    def buffered(self, stream: str) -> int:
+        """Entries of a stream waiting in the sub-queues"""
+        return self._per_stream.get(stream, 0)
+
+    def push(self, traces: list[dict]):
+        """Queue consumed traces (with their ``_stream_name`` and ``_message_id``) by workspace"""
+        for trace in traces:
+            workspace_id = str(trace.get('workspace_id'))
+            queue = self._queues.get(workspace_id)
+            if queue is None:
+                queue = self._queues[workspace_id] = deque()
+                self._deficits[workspace_id] = 0.0
+                self._active.append(workspace_id)
+            queue.append(trace)
+            stream = trace['_stream_name']
+            self._per_stream[stream] = self._per_stream.get(stream, 0) + 1
+            self._message_ids.add((stream, trace['_message_id']))
+
+    def pop(self, count: int) -> list[dict]:
+        """
+        Take up to ``count`` traces, sharing them between workspaces by weight
+
+        A workspace interrupted by a full batch keeps its place and its
+        remaining deficit for the next call.
+        """
+        self._maybe_refresh()
+
+        batch = []
+        while len(batch) < count and self._active:
+            workspace_id = self._active[0]
+            queue = self._queues[workspace_id]
+            if not self._granted:
+                self._deficits[workspace_id] += self.quantum * self.weight(workspace_id)
+                self._granted = True
+
+            take = min(int(self._deficits[workspace_id]), len(queue), count - len(batch))
+            for _ in range(take):
+                batch.append(queue.popleft())
+            self._deficits[workspace_id] -= take
+
+            if not queue:
+                # An idle workspace does not bank its deficit
+                del self._queues[workspace_id]
+                del self._deficits[workspace_id]
+                self._active.popleft()
+                self._granted = False
+            elif self._deficits[workspace_id] < 1:
+                self._active.rotate(-1)
+                self._granted = False
+
+        for trace in batch:
+            self._forget(trace)
+        return batch
+
+    def discard(self, stream: str) -> int:
+        """Drop the queued entries of a stream (whose shard was lost); returns how many were dropped"""
+        dropped = 0
+        for workspace_id in list(self._active):
+            queue = self._queues[workspace_id]
+            kept = deque(trace for trace in queue if trace['_stream_name'] != stream)
+            dropped += len(queue) - len(kept)
+            if kept:
+                self._queues[workspace_id] = kept
+                continue
+            if self._active[0] == workspace_id:
+                self._granted = False
+            self._active.remove(workspace_id)
+            del self._queues[workspace_id]
+            del self._deficits[workspace_id]
+
+        self._per_stream.pop(stream, None)
+        self._message_ids = {message for message in self._message_ids if message[0] != stream}
+        return dropped
+
+    def _forget(self, trace: dict):
+        stream = trace['_stream_name']
+        self._per_stream[stream] -= 1
+        if not self._per_stream[stream]:
+            del self._per_stream[stream]
+        self._message_ids.discard((stream, trace['_message_id']))
@@ -0,0 +1,49 @@
+"""Workspace sharding of the traces:pending stream
+
+Traces are routed to ``traces:pending:{n}`` by a stable hash of their
+workspace_id, so every trace of a workspace lands on the same shard and
+keeps its order. With a single shard the original ``traces:pending`` key is
+used unchanged. Keep in sync with ingestion/app/sharding.py.
+"""
+import zlib
+from typing import Optional
+
+STREAM_BASE = "traces:pending"
+
+
+def shard_for(workspace_id: Optional[str], shards: int) -> int:
+    """Shard index for a workspace (CRC32 of its id modulo the shard count)"""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(str(workspace_id).encode('utf-8')) % shards
+
+
+def shard_stream(shard: int, shards: int, base: str = STREAM_BASE) -> str:
+    """Stream key of a shard"""
+    return base if shards <= 1 else f"{base}:{shard}"
+
+
+def all_streams(shards: int, base: str = STREAM_BASE) -> list[str]:
+    """Stream keys of every shard"""
+    return [shard_stream(shard, shards, base) for shard in range(max(shards, 1))]
+
+
+def assign_shards(consumer: str, consumers: list[str], shards: int) -> list[int]:
+    """
+    Shards a consumer should own among the live consumers
+
+    Uses rendezvous (highest random weight) hashing: each shard goes to the
+    consumer with the highest hash of (consumer, shard). Every consumer
+    computes the same assignment from the same membership, and a membership
+    change only moves the shards of the consumer that joined or left.
+    """
+    if consumer not in consumers:
+        consumers = consumers + [consumer]
+
+    def weight(member: str, shard: int) -> int:
+        return zlib.crc32(f"{member}:{shard}".encode('utf-8'))
+
+    return [
+        shard for shard in range(max(shards, 1))
+        if max(consumers, key=lambda member: (weight(member, shard), member)) == consumer
+    ]
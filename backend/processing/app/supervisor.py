@@ -0,0 +1,171 @@
+"""Processing Service supervisor - runs one processing worker per CPU core"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from typing import Optional
+import redis
+from .config import get_settings
+from .main import ProcessingService, main as run_service
+from .metrics import mark_process_dead, multiprocess_enabled, reset_multiprocess_dir, serve_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def run_worker(metrics_port: int = 0):
+    """Worker process entry point: one pipelined ProcessingService (stopped by SIGTERM)"""
+    try:
+        asyncio.run(run_service(metrics_port))
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerSupervisor:
+    """
+    Forks and supervises processing worker processes
+
+    Each worker is an independent consumer in the ``processors`` group
+    (named after its host and pid) running the full pipeline. Workers that
+    exit are restarted with exponential backoff. Every stats interval the
+    supervisor logs the throughput each worker reported into
+    ``traces:workers`` and removes the entries of workers that stopped
+    reporting. With ``PROMETHEUS_MULTIPROC_DIR`` set (as in the image) the
+    supervisor serves the metrics of all workers on ``metrics_port``;
+    otherwise worker ``n`` serves its own on ``metrics_port + n``.
+    """
+
+    MAX_BACKOFF_S = 60
+
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Initialize supervisor
+
+        Args:
+            workers: Number of worker processes (default: PROCESSING_WORKERS, else one per core)
+        """
+        settings = get_settings()
+        self.workers = workers or settings.processing_workers or os.cpu_count() or 1
+        self.stats_interval = settings.worker_stats_interval_s
+        self.metrics_port = settings.metrics_port
+        self.multiprocess_metrics = multiprocess_enabled()
+        self.client = redis.from_url(settings.redis_url, decode_responses=True)
+        self.context = multiprocessing.get_context("fork")
+        self.processes: list[Optional[multiprocessing.Process]] = [None] * self.workers
+        self.restarts = [0] * self.workers
+        self.next_start = [0.0] * self.workers
+        self.started_at = [0.0] * self.workers
+        self.running = False
+
+    def _spawn(self, slot: int):
+        metrics_port = self.metrics_port + slot if self.metrics_port and not self.multiprocess_metrics else 0
+        process = self.context.Process(target=run_worker, args=(metrics_port,), name=f"processing-worker-{slot}")
+        process.start()
+        self.processes[slot] = process
+        self.started_at[slot] = time.monotonic()
+        logger.info(f"Started worker {slot} (pid {process.pid})")
+
+    def check_workers(self):
+        """Restart workers that exited, backing off on repeated failures"""
+        now = time.monotonic()
+        for slot, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                continue
+
+            if process is not None:
+                process.join()
+                mark_process_dead(process.pid)
+                self.processes[slot] = None
+                # A worker that ran for a while starts over from the shortest backoff
+                if now - self.started_at[slot] > self.MAX_BACKOFF_S:
+                    self.restarts[slot] = 0
+                self.restarts[slot] += 1
+                backoff = min(2 ** (self.restarts[slot] - 1), self.MAX_BACKOFF_S)
+                self.next_start[slot] = now + backoff
+                logger.error(
+                    f"Worker {slot} (pid {process.pid}) exited with code {process.exitcode}, "
+                    f"restarting in {backoff}s"
+                )
+            elif now >= self.next_start[slot]:
+                self._spawn(slot)
+
+    def report(self):
+        """Log per-worker throughput and prune workers that stopped reporting"""
+        try:
+            workers = self.client.hgetall(ProcessingService.WORKERS_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to read worker stats: {str(e)}")
+            return
+
+        now = time.time()
+        total = 0.0
+        for name, raw in workers.items():
+            stats = json.loads(raw)
+            if now - stats["heartbeat"] > 3 * self.stats_interval:
+                self.client.hdel(ProcessingService.WORKERS_KEY, name)
+                continue
+            total += stats["traces_per_s"]
+            logger.info(
+                f"{name}: {stats['traces_per_s']} traces/s, {stats['processed']} processed, "
+                f"{stats['failed']} failed, {stats['queued']} batches queued"
+            )
+        logger.info(f"{len(self.alive())}/{self.workers} workers alive, {total:.1f} traces/s")
+
+    def alive(self) -> list[multiprocessing.Process]:
+        """Running worker processes"""
+        return [process for process in self.processes if process is not None and process.is_alive()]
+
+    def run(self):
+        """Start the workers and supervise them until SIGINT or SIGTERM"""
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
+
+        if self.multiprocess_metrics:
+            # Before forking: the workers write their samples there from the start
+            reset_multiprocess_dir()
+            if self.metrics_port:
+                serve_metrics(self.metrics_port)
+                logger.info(f"Serving the metrics of all workers on port {self.metrics_port}")
+
+        logger.info(f"Starting {self.workers} processing workers...")
+        self.running = True
+        next_report = time.monotonic() + self.stats_interval
+        while self.running:
+            self.check_workers()
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + self.stats_interval
+                self.report()
+            time.sleep(1)
+
+        self.stop()
+
+    def stop(self, timeout_s: float = 30):
+        """Stop workers gracefully (SIGTERM), killing those that do not exit in time"""
+        workers = self.alive()
+        for process in workers:
+            process.terminate()
+
+        deadline = time.monotonic() + timeout_s
+        for process in workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"Worker pid {process.pid} did not stop in time, killing it")
+                process.kill()
+                process.join()
+            mark_process_dead(process.pid)
+
+        self.client.close()
+        logger.info("All processing workers stopped")
+
+    def _signal_handler(self, sig, frame):
+        """Handle shutdown signals"""
+        logger.info(f"Received signal {sig}, stopping workers...")
+        self.running = False
+
+
+if __name__ == "__main__":
+    WorkerSupervisor().run()
+    sys.exit(0)
@@ -2,14 +2,169 @@
 import asyncpg
 import json
 import logging
+import math
 import os
+import time
+from collections import OrderedDict
 from typing import Optional
+from .batch import TRACE_COLUMNS, TraceBatch
+from .config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Errors caused by the rows themselves (bad values, constraint violations), which
+# bisection isolates. Anything else (lost connection, timeout, server restart)
+# fails the whole batch, so its entries stay pending for redelivery
+ROW_ERRORS = (
+    asyncpg.DataError,
+    asyncpg.IntegrityConstraintViolationError,
+    ValueError,  # Client-side encoding of a value (asyncpg's own DataError included)
+    TypeError
+)
+
+# Dimensions of traces_minutely; missing ones are stored as these placeholders
+NIL_UUID = "'00000000-0000-0000-0000-000000000000'::uuid"
+ROLLUP_DIMENSIONS = (
+    "time_bucket(INTERVAL '1 minute', timestamp)",
+    "workspace_id",
+    "agent_id",
+    "COALESCE(model, '')",
+    "COALESCE(model_provider, '')",
+    f"COALESCE(department_id, {NIL_UUID})",
+    f"COALESCE(environment_id, {NIL_UUID})",
+    "COALESCE(version, '')",
+    "COALESCE(status, 'success')"
+)
+
+# Columns of traces the rollup reads (from RETURNING or the sampled-out staging table)
+ROLLUP_SOURCE_COLUMNS = (
+    'timestamp', 'workspace_id', 'agent_id', 'model', 'model_provider',
+    'department_id', 'environment_id', 'version', 'status',
+    'latency_ms', 'tokens_input', 'tokens_output', 'tokens_total', 'cost_usd'
+)
+
+# Sampled-out traces are staged with these columns
+SAMPLED_COLUMNS = (
+    'trace_id', 'timestamp', 'workspace_id', 'agent_id', 'model', 'model_provider',
+    'status', 'latency_ms', 'tokens_input', 'tokens_output', 'tokens_total', 'cost_usd'
+)
+
+# Latency sketch (DDSketch, 1% relative accuracy): bin i counts latencies in
+# (gamma^(i-1), gamma^i]. Keep in sync with backend/query/app/sketch.py
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_LOG_GAMMA = math.log((1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY))
+LATENCY_SKETCH_SQL = f"""(
+        SELECT jsonb_object_agg(bin, n) FROM (
+            SELECT CEIL(LN(GREATEST(latency_ms, 1)) / {SKETCH_LOG_GAMMA!r})::int AS bin, COUNT(*) AS n
+            FROM unnest(array_agg(latency_ms)) AS sample(latency_ms)
+            WHERE latency_ms IS NOT NULL
+            GROUP BY 1
+        ) bins
+    )"""
+
+
+def rollup_upsert_sql(source: str, sampled_out: bool = False) -> str:
+    """
+    Add the traces selected by ``source`` to traces_minutely
+
+    Counts are additive and latency sketches merge by adding bin counts,
+    so a late trace lands in its own (older) minute; callers only pass
+    traces counted for the first time.
+    """
+    return f"""
+    INSERT INTO traces_minutely (
+        bucket, workspace_id, agent_id, model, model_provider,
+        department_id, environment_id, version, status,
+        request_count, sampled_out_count, latency_sum_ms,
+        tokens_input_sum, tokens_output_sum, tokens_total_sum, cost_usd_sum,
+        latency_sketch
+    )
+    SELECT
+        {', '.join(ROLLUP_DIMENSIONS)},
+        COUNT(*), {'COUNT(*)' if sampled_out else '0'}, SUM(latency_ms),
+        COALESCE(SUM(tokens_input), 0), COALESCE(SUM(tokens_output), 0),
+        COALESCE(SUM(tokens_total), 0), COALESCE(SUM(cost_usd), 0),
+        COALESCE({LATENCY_SKETCH_SQL}, '{{}}'::jsonb)
+    FROM {source}
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+    -- Concurrent writers lock rollup rows in the same order
+    ORDER BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+    ON CONFLICT (bucket, workspace_id, agent_id, model, model_provider, department_id, environment_id, version, status)
+    DO UPDATE SET
+        request_count = traces_minutely.request_count + EXCLUDED.request_count,
+        sampled_out_count = traces_minutely.sampled_out_count + EXCLUDED.sampled_out_count,
+        latency_sum_ms = traces_minutely.latency_sum_ms + EXCLUDED.latency_sum_ms,
+        tokens_input_sum = traces_minutely.tokens_input_sum + EXCLUDED.tokens_input_sum,
+        tokens_output_sum = traces_minutely.tokens_output_sum + EXCLUDED.tokens_output_sum,
+        tokens_total_sum = traces_minutely.tokens_total_sum + EXCLUDED.tokens_total_sum,
+        cost_usd_sum = traces_minutely.cost_usd_sum + EXCLUDED.cost_usd_sum,
+        latency_sketch = latency_sketch_merge(traces_minutely.latency_sketch, EXCLUDED.latency_sketch)
+    """
+
+
+def _placeholders(count: int) -> str:
+    return ', '.join(f'${i}' for i in range(1, count + 1))
+
+
+# Insert one trace; rolled up only if it was not already stored
+INSERT_TRACE_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO traces ({', '.join(TRACE_COLUMNS)})
+        VALUES ({_placeholders(len(TRACE_COLUMNS))})
+        ON CONFLICT (trace_id, timestamp) DO NOTHING
+        RETURNING {', '.join(ROLLUP_SOURCE_COLUMNS)}
+    )
+    {rollup_upsert_sql('inserted')}
+"""
+
+STAGE_TRACE_SQL = f"""
+    INSERT INTO traces_staging ({', '.join(TRACE_COLUMNS)})
+    VALUES ({_placeholders(len(TRACE_COLUMNS))})
+"""
+
+# Move staged traces into traces and roll up the ones actually inserted
+INSERT_STAGED_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO traces ({', '.join(TRACE_COLUMNS)})
+        SELECT {', '.join(TRACE_COLUMNS)} FROM traces_staging
+        ON CONFLICT (trace_id, timestamp) DO NOTHING
+        RETURNING {', '.join(ROLLUP_SOURCE_COLUMNS)}
+    )
+    {rollup_upsert_sql('inserted')}
+"""
+
+STAGE_SAMPLED_SQL = f"""
+    INSERT INTO traces_sampled_staging ({', '.join(SAMPLED_COLUMNS)})
+    VALUES ({_placeholders(len(SAMPLED_COLUMNS))})
+"""
+
+# Record staged sampled-out traces and roll up the ones not seen before
+COUNT_SAMPLED_SQL = f"""
+    WITH staged AS (
+        SELECT DISTINCT ON (trace_id, timestamp) * FROM traces_sampled_staging
+    ),
+    counted AS (
+        INSERT INTO traces_sampled_keys (trace_id, timestamp)
+        SELECT trace_id, timestamp FROM staged
+        ON CONFLICT (trace_id, timestamp) DO NOTHING
+        RETURNING trace_id, timestamp
+    )
+    {rollup_upsert_sql('staged JOIN counted USING (trace_id, timestamp)', sampled_out=True)}
+"""
+
 
 class TraceWriter:
-    """Writes processed traces to TimescaleDB"""
+    """
+    Writes processed traces to TimescaleDB
+
+    Writes go through a connection pool of ``writer_concurrency``
+    connections, so several batches can be in flight at once.
+
+    Every write also adds its traces to the traces_minutely rollup in the
+    same transaction. Only traces inserted for the first time are counted
+    (sampled-out traces are recorded in traces_sampled_keys for this), so
+    redelivered and reclaimed entries never inflate the rollup.
+    """
 
     def __init__(self, timescale_url: Optional[str] = None):
         """
@@ -19,23 +174,60 @@ class TraceWriter:
             timescale_url: TimescaleDB connection URL
         """
         self.timescale_url = timescale_url or os.getenv('TIMESCALE_URL')
-        self.conn: Optional[asyncpg.Connection] = None
+        self.pool: Optional[asyncpg.Pool] = None
+        self.pool_size = get_settings().writer_concurrency
+
+        # "copy" stages batches with COPY, "executemany" inserts them directly
+        self.write_mode = get_settings().write_mode
+
+        # Content hashes recently written to trace_payloads (LRU) -> monotonic time of the write
+        self._stored_payloads: OrderedDict[str, float] = OrderedDict()
+        self.payload_cache_size = get_settings().payload_cache_size
+        self.payload_cache_ttl_s = get_settings().payload_cache_ttl_s
 
     async def connect(self):
-        """Establish database connection"""
+        """Create the database connection pool"""
         try:
-            self.conn = await asyncpg.connect(self.timescale_url)
+            self.pool = await asyncpg.create_pool(
+                self.timescale_url,
+                min_size=1,
+                max_size=self.pool_size,
+                init=self._init_connection
+            )
             logger.info("Connected to TimescaleDB")
         except Exception as e:
             logger.error(f"Failed to connect to TimescaleDB: {str(e)}")
             raise
 
     async def disconnect(self):
-        """Close database connection"""
-        if self.conn:
-            await self.conn.close()
+        """Close the database connection pool"""
+        if self.pool:
+            await self.pool.close()
             logger.info("Disconnected from TimescaleDB")
 
+    async def _init_connection(self, conn: asyncpg.Connection):
+        """Create the session-local staging tables on each new pool connection"""
+        # Emptied at the end of every transaction; pool resets keep them
+        await conn.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS traces_staging ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(TRACE_COLUMNS)} FROM traces WITH NO DATA
+            """
+        )
+        await conn.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS traces_sampled_staging ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(ROLLUP_SOURCE_COLUMNS)}, trace_id FROM traces WITH NO DATA
+            """
+        )
+
+    async def _stage(self, conn: asyncpg.Connection, table: str, sql: str, columns: tuple, records: list[tuple]):
+        """Load records into a staging table with COPY or executemany"""
+        if self.write_mode == "copy":
+            await conn.copy_records_to_table(table, records=records, columns=columns)
+        else:
+            await conn.executemany(sql, records)
+
     async def write_trace(self, trace: dict) -> bool:
         """
         Write a single trace to database
@@ -46,38 +238,12 @@ class TraceWriter:
         Returns:
             bool: True if successful
         """
-        if not self.conn:
+        if not self.pool:
             await self.connect()
 
         try:
-            await self.conn.execute(
-                """
-                INSERT INTO traces (
-                    trace_id, workspace_id, agent_id, timestamp, latency_ms,
-                    input, output, error, status, model, model_provider,
-                    tokens_input, tokens_output, tokens_total, cost_usd,
-                    metadata, tags
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
-                ON CONFLICT (trace_id, timestamp) DO NOTHING
-                """,
-                trace['trace_id'],
-                trace['workspace_id'],
-                trace['agent_id'],
-                trace['timestamp'],
-                trace['latency_ms'],
-                trace['input'],
-                trace['output'],
-                trace['error'],
-                trace['status'],
-                trace['model'],
-                trace['model_provider'],
-                trace['tokens_input'],
-                trace['tokens_output'],
-                trace['tokens_total'],
-                trace['cost_usd'],
-                json.dumps(trace['metadata']),
-                trace['tags']
-            )
+            async with self.pool.acquire() as conn:
+                await conn.execute(INSERT_TRACE_SQL, *self._record(trace))
             logger.debug(f"Wrote trace {trace['trace_id']} to database")
             return True
 
@@ -85,84 +251,192 @@ class TraceWriter:
             logger.error(f"Failed to write trace {trace['trace_id']}: {str(e)}")
             return False
 
-    async def write_batch(self, traces: list[dict]) -> tuple[int, int]:
+    async def write_batch(self, traces) -> tuple[int, dict[str, str]]:
         """
         Write multiple traces to database in a batch
 
+        A batch rejected for its data is bisected until the traces that
+        cannot be written are isolated, so one bad row costs O(log n) extra
+        round-trips instead of one INSERT per trace.
+
         Args:
-            traces: List of processed trace dictionaries
+            traces: TraceBatch, or list of processed trace dictionaries
 
         Returns:
-            tuple: (successful_count, failed_count)
+            tuple: (successful_count, database error by rejected trace ID)
+
+        Raises:
+            Exception: Any error other than ``ROW_ERRORS``; nothing of the
+                batch is committed then, and it must not be acknowledged
         """
-        if not self.conn:
+        if not self.pool:
             await self.connect()
 
-        if not traces:
-            return 0, 0
+        if not len(traces):
+            return 0, {}
+
+        if isinstance(traces, TraceBatch):
+            records = traces.records()
+        else:
+            records = [self._record(trace) for trace in traces]
+        async with self.pool.acquire() as conn:
+            successful, rejected = await self._write_isolated(conn, records)
+        if successful:
+            logger.info(f"Successfully wrote {successful} traces to database")
+        return successful, rejected
 
-        successful = 0
-        failed = 0
+    @staticmethod
+    def _record(trace: dict) -> tuple:
+        """Row of a trace, in TRACE_COLUMNS order"""
+        return (
+            trace['trace_id'],
+            trace['workspace_id'],
+            trace['agent_id'],
+            trace['timestamp'],
+            trace['latency_ms'],
+            trace['input'],
+            trace['output'],
+            trace['error'],
+            trace['status'],
+            trace['model'],
+            trace['model_provider'],
+            trace['tokens_input'],
+            trace['tokens_output'],
+            trace['tokens_total'],
+            trace['cost_usd'],
+            json.dumps(trace['metadata']),
+            trace['tags'],
+            trace.get('input_hash'),
+            trace.get('output_hash')
+        )
 
+    async def _write_isolated(self, conn: asyncpg.Connection, records: list[tuple]) -> tuple[int, dict[str, str]]:
+        """Write records, bisecting on row errors; returns (successful, error by rejected trace ID)"""
         try:
-            # Prepare data for executemany
-            values = []
-            for trace in traces:
-                values.append((
-                    trace['trace_id'],
-                    trace['workspace_id'],
-                    trace['agent_id'],
-                    trace['timestamp'],
-                    trace['latency_ms'],
-                    trace['input'],
-                    trace['output'],
-                    trace['error'],
-                    trace['status'],
-                    trace['model'],
-                    trace['model_provider'],
-                    trace['tokens_input'],
-                    trace['tokens_output'],
-                    trace['tokens_total'],
-                    trace['cost_usd'],
-                    json.dumps(trace['metadata']),
-                    trace['tags']
-                ))
-
-            # Batch insert
-            await self.conn.executemany(
-                """
-                INSERT INTO traces (
-                    trace_id, workspace_id, agent_id, timestamp, latency_ms,
-                    input, output, error, status, model, model_provider,
-                    tokens_input, tokens_output, tokens_total, cost_usd,
-                    metadata, tags
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
-                ON CONFLICT (trace_id, timestamp) DO NOTHING
-                """,
-                values
-            )
+            await self._insert(conn, records)
+            return len(records), {}
+        except ROW_ERRORS as e:
+            if len(records) == 1:
+                logger.error(f"Failed to write trace {records[0][0]}: {str(e)}")
+                return 0, {records[0][0]: str(e)}
+            logger.warning(f"Failed to write {len(records)} traces, bisecting: {str(e)}")
 
-            successful = len(traces)
-            logger.info(f"Successfully wrote {successful} traces to database")
+        mid = len(records) // 2
+        left_written, left_rejected = await self._write_isolated(conn, records[:mid])
+        right_written, right_rejected = await self._write_isolated(conn, records[mid:])
+        return left_written + right_written, {**left_rejected, **right_rejected}
 
+    async def _insert(self, conn: asyncpg.Connection, records: list[tuple]):
+        """Stage records, then insert and roll them up in one set-based statement"""
+        async with conn.transaction():
+            await self._stage(conn, 'traces_staging', STAGE_TRACE_SQL, TRACE_COLUMNS, records)
+            await conn.execute(INSERT_STAGED_SQL)
+
+    async def write_sampled_out(self, traces) -> int:
+        """
+        Count traces that were sampled out in the per-minute rollup
+
+        Sampled-out traces are not stored, but their counts, latency, tokens
+        and cost are added to traces_minutely so totals stay exact. Their
+        keys are kept in traces_sampled_keys so each is counted once.
+
+        Args:
+            traces: TraceBatch or processed traces with ``sampled`` False
+
+        Returns:
+            int: Number of traces counted (or already counted)
+
+        Raises:
+            Exception: If the write fails; the batch must be redelivered, and
+                traces_sampled_keys keeps the retry from counting twice
+        """
+        if not len(traces):
+            return 0
+        if not self.pool:
+            await self.connect()
+
+        records = [tuple(trace[name] for name in SAMPLED_COLUMNS) for trace in traces]
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await self._stage(conn, 'traces_sampled_staging', STAGE_SAMPLED_SQL, SAMPLED_COLUMNS, records)
+                    await conn.execute(COUNT_SAMPLED_SQL)
         except Exception as e:
-            logger.error(f"Failed to write batch: {str(e)}")
-            # Fallback to individual inserts
-            for trace in traces:
-                if await self.write_trace(trace):
-                    successful += 1
-                else:
-                    failed += 1
+            logger.error(f"Failed to count {len(traces)} sampled-out traces: {str(e)}")
+            raise
+
+        return len(traces)
+
+    def payloads_to_store(self, content_hashes: set[str]) -> list[str]:
+        """
+        Content hashes not yet known to be stored in trace_payloads
+
+        Recently stored hashes are remembered (up to ``payload_cache_size``)
+        so repeated bodies such as prompt templates are neither fetched from
+        Redis nor written again. A hash is only remembered for
+        ``payload_cache_ttl_s`` after its write: hot bodies are then upserted
+        again, which keeps their ``last_seen_at`` ahead of the purge job.
+        """
+        fresh_after = time.monotonic() - self.payload_cache_ttl_s
+        missing = []
+        for content_hash in content_hashes:
+            stored_at = self._stored_payloads.get(content_hash)
+            if stored_at is not None and stored_at > fresh_after:
+                self._stored_payloads.move_to_end(content_hash)
+            else:
+                missing.append(content_hash)
+        return missing
+
+    async def write_payloads(self, bodies: dict[str, str]) -> int:
+        """
+        Store offloaded input/output bodies, once per content hash
+
+        Args:
+            bodies: Body text by SHA-256 content hash
+
+        Returns:
+            int: Number of bodies written (or already present)
+
+        Raises:
+            Exception: If the write fails; the traces referencing the bodies
+                must not be written (and their entries not acknowledged)
+        """
+        if not bodies:
+            return 0
+        if not self.pool:
+            await self.connect()
+
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.executemany(
+                    """
+                    INSERT INTO trace_payloads (content_hash, body, size_bytes)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (content_hash) DO UPDATE SET last_seen_at = NOW()
+                    WHERE trace_payloads.last_seen_at < NOW() - INTERVAL '1 day'
+                    """,
+                    [(content_hash, body, len(body.encode('utf-8'))) for content_hash, body in bodies.items()]
+                )
+        except Exception as e:
+            logger.error(f"Failed to write {len(bodies)} trace payloads: {str(e)}")
+            raise
 
-        return successful, failed
+        now = time.monotonic()
+        for content_hash in bodies:
+            self._stored_payloads.pop(content_hash, None)
+            self._stored_payloads[content_hash] = now
+        while len(self._stored_payloads) > self.payload_cache_size:
+            self._stored_payloads.popitem(last=False)
+        return len(bodies)
 
     async def get_trace_count(self) -> int:
         """Get total count of traces in database"""
-        if not self.conn:
+        if not self.pool:
             await self.connect()
 
         try:
-            count = await self.conn.fetchval("SELECT COUNT(*) FROM traces")
+            async with self.pool.acquire() as conn:
+                count = await conn.fetchval("SELECT COUNT(*) FROM traces")
             return count
         except Exception as e:
             logger.error(f"Failed to get trace count: {str(e)}")
@@ -0,0 +1,42 @@
+"""Tests for adaptive batch sizing"""
+from app.adaptive import AdaptiveBatcher, entry_time_ms
+
+
+class TestAdaptiveBatcher:
+    """Test batch size and flush deadline decisions"""
+
+    def test_batch_size_follows_lag(self):
+        """Small batches when caught up, the writers' share of the backlog when behind"""
+        batcher = AdaptiveBatcher(writers=4)
+
+        batcher.observe_lag(0)
+        assert batcher.batch_size == batcher.min_size
+
+        batcher.observe_lag(8000)
+        assert batcher.batch_size == 2000
+
+        batcher.observe_lag(500000)
+        assert batcher.batch_size == batcher.max_size
+
+    def test_slow_writes_shrink_the_cap(self):
+        """The cap shrinks while writes are slow and recovers once they are fast"""
+        batcher = AdaptiveBatcher()
+        batcher.observe_lag(500000)
+
+        for _ in range(5):
+            batcher.observe_write(2.0)
+        shrunk = batcher.batch_size
+        assert shrunk < batcher.max_size
+
+        for _ in range(30):
+            batcher.observe_write(0.01)
+        assert batcher.batch_size > shrunk
+
+    def test_flush_deadline_includes_write_time(self):
+        """A batch is due when its oldest entry plus the write time reaches the max delay"""
+        batcher = AdaptiveBatcher()
+        batcher.observe_write(0.5)
+        oldest = entry_time_ms("1700000000000-3")
+
+        assert batcher.flush_in_ms(oldest, now_ms=1700000000000 + 1000) == batcher.max_delay_ms - 500 - 1000
+        assert batcher.flush_in_ms(oldest, now_ms=1700000000000 + batcher.max_delay_ms) < 0
@@ -0,0 +1,129 @@
+"""Tests for the historical backfill"""
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.backfill import Backfill, chunk_ranges, read_traces
+
+DAY = timedelta(days=1)
+
+
+def trace(trace_id: str, timestamp: str) -> dict:
+    return {
+        "trace_id": trace_id, "workspace_id": "ws", "agent_id": "agent", "timestamp": timestamp,
+        "latency_ms": 100, "model": "gpt-4", "model_provider": "openai"
+    }
+
+
+@pytest.fixture
+def writer():
+    """Writer whose pool reports one paused policy and two continuous aggregates"""
+    writer = MagicMock()
+    writer.write_batch = AsyncMock(side_effect=lambda batch: (len(batch), {}))
+    conn = MagicMock()
+    conn.fetch = AsyncMock(side_effect=lambda sql: (
+        [{"job_id": 1000, "view_name": "traces_hourly"}] if "jobs" in sql
+        else [{"view_name": "traces_hourly"}, {"view_name": "traces_daily"}]
+    ))
+    conn.execute = AsyncMock()
+    writer.pool.acquire.return_value.__aenter__ = AsyncMock(return_value=conn)
+    writer.pool.acquire.return_value.__aexit__ = AsyncMock(return_value=False)
+    writer.conn = conn
+    return writer
+
+
+class TestBackfill:
+    """Test chunked loading with deferred aggregate refresh"""
+
+    @pytest.mark.asyncio
+    async def test_writes_one_chunk_at_a_time(self, writer):
+        """Each write holds the traces of a single day chunk"""
+        traces = [
+            trace("t1", "2024-01-01T01:00:00Z"),
+            trace("t2", "2024-01-02T01:00:00Z"),
+            trace("t3", "2024-01-01T23:00:00Z"),
+            trace("t4", "2024-01-02T05:00:00Z"),
+            trace("t5", "2024-01-02T06:00:00Z")
+        ]
+
+        stats = await Backfill(writer, concurrency=2, batch_size=2).run(traces)
+
+        batches = sorted(call.args[0]["trace_id"] for call in writer.write_batch.call_args_list)
+        assert batches == [["t1", "t3"], ["t2", "t4"], ["t5"]]
+        assert stats["written"] == 5
+        assert stats["chunks"] == 2
+
+    @pytest.mark.asyncio
+    async def test_input_is_streamed_with_bounded_buffering(self, writer):
+        """Traces are pulled a batch at a time, and the fullest chunk is written once too much is buffered"""
+        pulled = []
+
+        def traces():
+            for i in range(6):
+                pulled.append(i)
+                yield trace(f"t{i}", f"2024-01-0{i % 3 + 1}T01:00:00Z")
+
+        backfill = Backfill(writer, concurrency=1, batch_size=4, max_buffered=2)
+        stats = await backfill.run(traces(), refresh=False)
+
+        first_write = writer.write_batch.call_args_list[0].args[0]
+        assert len(first_write) <= 2
+        assert stats["read"] == stats["written"] == 6
+        assert stats["chunks"] == 3
+        assert pulled == list(range(6))
+
+    @pytest.mark.asyncio
+    async def test_pauses_policies_and_refreshes_touched_ranges(self, writer):
+        """Policies are paused during the load, then aggregates are refreshed over the loaded days"""
+        traces = [trace("t1", "2024-01-01T01:00:00Z"), trace("t2", "2024-01-05T01:00:00Z")]
+
+        await Backfill(writer).run(traces)
+
+        statements = [call.args[0] for call in writer.conn.execute.call_args_list]
+        assert "scheduled => false" in statements[0]
+        assert "scheduled => true" in statements[-1]
+        refreshes = [sql for sql in statements if "refresh_continuous_aggregate" in sql]
+        assert len(refreshes) == 4
+        assert "'traces_daily', '2024-01-05T00:00:00+00:00', '2024-01-06T00:00:00+00:00'" in refreshes[-1]
+
+    @pytest.mark.asyncio
+    async def test_policies_resume_when_the_load_fails(self, writer):
+        """Paused policies are rescheduled even if a write raises"""
+        writer.write_batch = AsyncMock(side_effect=RuntimeError("connection lost"))
+
+        with pytest.raises(RuntimeError):
+            await Backfill(writer).run([trace("t1", "2024-01-01T01:00:00Z")])
+
+        assert "scheduled => true" in writer.conn.execute.call_args_list[-1].args[0]
+
+    @pytest.mark.asyncio
+    async def test_no_refresh_leaves_policies_alone(self, writer):
+        """Without refresh only the traces are written"""
+        await Backfill(writer).run([trace("t1", "2024-01-01T01:00:00Z")], refresh=False)
+
+        writer.conn.execute.assert_not_called()
+
+
+@pytest.mark.parametrize("content", [
+    json.dumps([trace(f"t{i}", "2024-01-01T01:00:00Z") for i in range(50)], indent=2),
+    "\n".join(json.dumps(trace(f"t{i}", "2024-01-01T01:00:00Z")) for i in range(50)) + "\n"
+])
+def test_read_traces_streams_arrays_and_json_lines(tmp_path, content):
+    """Both file formats are decoded element by element, across read boundaries"""
+    path = tmp_path / "traces.json"
+    path.write_text(content)
+
+    with patch("app.backfill.READ_SIZE", 64):
+        traces = read_traces([str(path)])
+        assert next(traces)["trace_id"] == "t0"
+        assert [t["trace_id"] for t in traces] == [f"t{i}" for i in range(1, 50)]
+
+
+def test_chunk_ranges_merge_contiguous_days():
+    """Adjacent chunks merge into one refresh window"""
+    day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    assert chunk_ranges([day + 2 * DAY, day, day + DAY, day + 5 * DAY]) == [
+        (day, day + 3 * DAY),
+        (day + 5 * DAY, day + 6 * DAY)
+    ]
@@ -1,7 +1,9 @@
 """Tests for Redis Streams consumer"""
+import msgpack
 import pytest
 from unittest.mock import Mock, patch
 from app.consumer import TraceConsumer
+from app.sharding import assign_shards
 
 
 @pytest.fixture
@@ -52,6 +54,74 @@ class TestTraceConsumer:
         assert traces[1]['trace_id'] == 'trace_2'
         assert '_message_id' in traces[0]
 
+    def test_consume_batch_decodes_msgpack_envelope(self, mock_redis):
+        """msgpack entries and legacy JSON entries decode side by side"""
+        mock_redis.xreadgroup.return_value = [
+            (
+                b'traces:pending',
+                [
+                    (
+                        b'1234567890-0',
+                        {b'enc': b'msgpack/1', b'data': msgpack.packb({"trace_id": "trace_1", "latency_ms": 100})}
+                    ),
+                    (
+                        b'1234567891-0',
+                        {b'data': b'{"trace_id": "trace_2"}'}
+                    )
+                ]
+            )
+        ]
+
+        consumer = TraceConsumer()
+        traces = consumer.consume_batch(batch_size=10, block_ms=1000)
+
+        assert [t['trace_id'] for t in traces] == ['trace_1', 'trace_2']
+        assert traces[0]['latency_ms'] == 100
+
+    def test_unknown_encoding_moves_to_dlq(self, mock_redis):
+        """Undecodable entries are copied verbatim to the dead letter queue"""
+        fields = {b'enc': b'avro/1', b'data': b'\x00\x01'}
+        mock_redis.xreadgroup.return_value = [(b'traces:pending', [(b'1234567890-0', fields)])]
+
+        consumer = TraceConsumer()
+        traces = consumer.consume_batch(batch_size=10, block_ms=1000)
+
+        assert traces == []
+        dlq_name, dlq_fields = mock_redis.xadd.call_args[0]
+        assert dlq_name == "traces:dead_letter"
+        assert dlq_fields[b'enc'] == b'avro/1'
+        assert dlq_fields[b'data'] == b'\x00\x01'
+        assert "avro/1" in dlq_fields["error"]
+
+    def test_rejected_entries_are_read_back_into_the_dlq(self, mock_redis):
+        """Entries the database rejected are copied from their stream to the DLQ and acknowledged"""
+        fields = {b'enc': b'msgpack/1', b'data': b'\x81'}
+        mock_redis.xrange.side_effect = [[(b'1-0', fields)], []]
+
+        consumer = TraceConsumer()
+        consumer.dead_letter([
+            ('traces:pending', '1-0', 'value too long'),
+            ('traces:pending', '2-0', 'value too long')
+        ], "rejected")
+
+        dlq_name, dlq_fields = mock_redis.xadd.call_args[0]
+        assert mock_redis.xadd.call_count == 1
+        assert dlq_name == "traces:dead_letter"
+        assert dlq_fields[b'data'] == b'\x81'
+        assert dlq_fields["error"] == 'value too long'
+        # The trimmed entry has nothing left to keep, so it is only acknowledged
+        assert [call[0][2] for call in mock_redis.xack.call_args_list] == ['1-0', '2-0']
+
+    def test_fetch_payloads_skips_expired(self, mock_redis):
+        """Staged bodies are read in one MGET; expired ones are left out"""
+        mock_redis.mget.return_value = [b'template body', None]
+
+        consumer = TraceConsumer()
+        bodies = consumer.fetch_payloads(['aa', 'bb'])
+
+        assert bodies == {'aa': 'template body'}
+        mock_redis.mget.assert_called_once_with(['traces:payload:aa', 'traces:payload:bb'])
+
     def test_acknowledge_batch(self, mock_redis):
         """Test acknowledging processed messages"""
         consumer = TraceConsumer()
@@ -65,3 +135,106 @@ class TestTraceConsumer:
             consumer.consumer_group,
             *message_ids
         )
+
+
+    def test_reclaim_batch_claims_idle_entries(self, mock_redis):
+        """Idle entries are claimed and decoded; over-delivered ones go to the DLQ"""
+        consumer = TraceConsumer()
+        mock_redis.xautoclaim.return_value = [
+            b'5-0',
+            [
+                (b'1-0', {b'data': b'{"trace_id": "trace_1"}'}),
+                (b'2-0', None),
+                (b'3-0', {b'data': b'{"trace_id": "trace_3"}'})
+            ],
+            []
+        ]
+        mock_redis.xpending_range.return_value = [
+            {'message_id': b'1-0', 'times_delivered': 2},
+            {'message_id': b'3-0', 'times_delivered': 6}
+        ]
+
+        traces = consumer.reclaim_batch(min_idle_ms=60000, max_deliveries=5)
+
+        assert [t['trace_id'] for t in traces] == ["trace_1"]
+        assert traces[0]['_message_id'] == "1-0"
+        assert mock_redis.xadd.call_args[0][0] == "traces:dead_letter"
+        assert consumer._reclaim_cursors["traces:pending"] == b'5-0'
+
+        consumer.reclaim_batch()
+        assert mock_redis.xautoclaim.call_args[1]['start_id'] == b'5-0'
+
+    def test_prune_consumers_keeps_busy_ones(self, mock_redis):
+        """Only idle consumers without pending entries are removed"""
+        consumer = TraceConsumer()
+        mock_redis.xinfo_consumers.return_value = [
+            {'name': b'processor_old_1', 'pending': 0, 'idle': 900000},
+            {'name': b'processor_old_2', 'pending': 3, 'idle': 900000},
+            {'name': consumer.consumer_name.encode(), 'pending': 0, 'idle': 900000}
+        ]
+
+        consumer.prune_consumers(600000)
+
+        mock_redis.xgroup_delconsumer.assert_called_once_with("traces:pending", "processors", "processor_old_1")
+
+
+class TestShardedConsumer:
+    """Test shard assignment and claiming"""
+
+    def test_assignment_partitions_shards(self):
+        """Every shard has exactly one owner and a leaving consumer only frees its own"""
+        consumers = [f"processor_host_{i}" for i in range(3)]
+        owned = {c: set(assign_shards(c, consumers, 16)) for c in consumers}
+
+        assert sorted(s for shards in owned.values() for s in shards) == list(range(16))
+
+        remaining = consumers[:2]
+        for consumer in remaining:
+            assert owned[consumer] <= set(assign_shards(consumer, remaining, 16))
+
+    def test_sharded_consumer_reads_leased_shards(self, mock_redis):
+        """Only shards whose lease was acquired are read, and acks go to their stream"""
+        consumer = TraceConsumer(stream_shards=4)
+        mock_redis.zrangebyscore.return_value = [consumer.consumer_name.encode()]
+        consumer._acquire_lease = Mock(side_effect=lambda keys, args: keys[0] != "traces:pending:2:lease")
+        consumer._release_lease = Mock()
+        mock_redis.xreadgroup.return_value = [
+            (b'traces:pending:1', [(b'1-0', {b'data': b'{"trace_id": "trace_1"}'})])
+        ]
+
+        traces = consumer.consume_batch()
+
+        streams = mock_redis.xreadgroup.call_args[0][2]
+        assert list(streams) == ["traces:pending:0", "traces:pending:1", "traces:pending:3"]
+        assert traces[0]['_stream_name'] == "traces:pending:1"
+
+        consumer.acknowledge_messages([("traces:pending:1", "1-0"), ("traces:pending:3", "2-0")])
+        assert mock_redis.xack.call_count == 2
+        mock_redis.xack.assert_any_call("traces:pending:1", "processors", "1-0")
+
+    def test_fair_consumer_reads_ahead_and_interleaves_workspaces(self, mock_redis):
+        """With fair scheduling a backlogged workspace shares the batch with the others"""
+        settings = Mock(
+            redis_url="redis://", stream_shards=1, shard_lease_ttl_s=30, fair_scheduling_enabled=True,
+            fair_read_ahead=100, fair_quantum=2, fair_weights_refresh_s=30
+        )
+        with patch('app.consumer.get_settings', return_value=settings), \
+                patch('app.scheduling.get_settings', return_value=settings):
+            consumer = TraceConsumer()
+        mock_redis.hgetall.return_value = {}
+        entries = [
+            (f'{i}-0'.encode(), {b'data': f'{{"trace_id": "big_{i}", "workspace_id": "big"}}'.encode()})
+            for i in range(20)
+        ] + [(b'20-0', {b'data': b'{"trace_id": "small_0", "workspace_id": "small"}'})]
+        mock_redis.xreadgroup.return_value = [(b'traces:pending', entries)]
+
+        traces = consumer.consume_batch(batch_size=4, block_ms=1000)
+
+        assert mock_redis.xreadgroup.call_args.kwargs['count'] == 100
+        assert [trace['trace_id'] for trace in traces] == ["big_0", "big_1", "small_0", "big_2"]
+        assert len(consumer.scheduler) == 17
+
+        # Entries already queued: no blocking read
+        mock_redis.xreadgroup.return_value = []
+        consumer.consume_batch(batch_size=4, block_ms=1000)
+        assert mock_redis.xreadgroup.call_args.kwargs['block'] is None
@@ -0,0 +1,213 @@
+"""Tests for the consume -> process -> write pipeline"""
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from app.batch import TraceBatch
+from app.main import ProcessingService
+from app.metrics import DB_POOL_CONNECTIONS, QUEUED_BATCHES
+
+
+@pytest.fixture
+def service():
+    """Processing service with mocked Redis, processor and database"""
+    with patch('app.main.TraceConsumer'), patch('app.main.TraceWriter'), \
+            patch('app.main.TraceProcessor'), patch('app.main.TailSampler'):
+        service = ProcessingService()
+
+    batches = [
+        [{"trace_id": "t1", "_stream_name": "traces:pending", "_message_id": "1-0"}],
+        [{"trace_id": "t2", "_stream_name": "traces:pending", "_message_id": "2-0"}]
+    ]
+
+    def consume_batch(batch_size, block_ms):
+        if batches:
+            return batches.pop(0)
+        service.running = False
+        return []
+
+    service.consumer.consume_batch.side_effect = consume_batch
+    service.consumer.get_lag.return_value = 0
+    service.consumer.get_pending_count.return_value = 0
+    service.processor.process_columns.side_effect = lambda traces: (
+        TraceBatch({
+            "trace_id": [trace["trace_id"] for trace in traces],
+            "sampled": [True] * len(traces),
+            "input_hash": [None] * len(traces),
+            "output_hash": [None] * len(traces)
+        }), []
+    )
+    service.writer.payloads_to_store.return_value = []
+    service.writer.write_batch = AsyncMock(return_value=(1, {}))
+    service.running = True
+    return service
+
+
+async def run_pipeline(service):
+    await asyncio.wait_for(asyncio.gather(
+        service.read_loop(),
+        service.process_loop(),
+        *(service.write_loop() for _ in range(service.writer_concurrency))
+    ), timeout=5)
+
+
+class TestPipeline:
+    """Test pipelined processing"""
+
+    @pytest.mark.asyncio
+    async def test_batches_are_written_then_acknowledged(self, service):
+        """Every batch is written and acknowledged once the reader stops"""
+        await run_pipeline(service)
+
+        assert service.writer.write_batch.await_count == 2
+        acked = sorted(call[0][0][0] for call in service.consumer.acknowledge_messages.call_args_list)
+        assert acked == [("traces:pending", "1-0"), ("traces:pending", "2-0")]
+        assert service.total_processed == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_write_is_not_acknowledged(self, service):
+        """Entries of a batch whose write raised stay pending"""
+        service.writer.write_batch = AsyncMock(side_effect=[Exception("pool closed"), (1, {})])
+
+        await run_pipeline(service)
+
+        acked = [call[0][0] for call in service.consumer.acknowledge_messages.call_args_list]
+        assert len(acked) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_sampled_out_count_is_not_acknowledged(self, service):
+        """Sampled-out traces whose rollup write failed stay pending for redelivery"""
+        service.processor.process_columns.side_effect = lambda traces: (
+            TraceBatch({
+                "trace_id": [trace["trace_id"] for trace in traces],
+                "sampled": [False] * len(traces),
+                "input_hash": [None] * len(traces),
+                "output_hash": [None] * len(traces)
+            }), []
+        )
+        service.writer.write_sampled_out = AsyncMock(side_effect=[Exception("connection lost"), 1])
+
+        await run_pipeline(service)
+
+        acked = [call[0][0] for call in service.consumer.acknowledge_messages.call_args_list]
+        assert acked == [[("traces:pending", "2-0")]]
+        assert service.total_failed == 0
+
+    @pytest.mark.asyncio
+    async def test_rejected_rows_are_dead_lettered(self, service):
+        """Rows the database rejected go to the DLQ; the rest of the batch is acknowledged"""
+        service.writer.write_batch = AsyncMock(side_effect=[(0, {"t1": "value too long"}), (1, {})])
+
+        await run_pipeline(service)
+
+        service.consumer.dead_letter.assert_called_once_with(
+            [("traces:pending", "1-0", "value too long")], "rejected"
+        )
+        acked = [call[0][0] for call in service.consumer.acknowledge_messages.call_args_list]
+        assert sorted(acked) == [[], [("traces:pending", "2-0")]]
+
+    @pytest.mark.asyncio
+    async def test_guardrail_violations_are_written_with_their_batch(self, service):
+        """Scanned batches carry their violations to the writer"""
+        service.guardrails = Mock(enabled=True, redact=False, scan=AsyncMock(return_value=[("violation",)]))
+        service.violation_writer = Mock(write=AsyncMock(return_value=1))
+
+        await run_pipeline(service)
+
+        assert service.guardrails.scan.await_count == 2
+        assert service.violation_writer.write.await_count == 2
+        assert service.violation_writer.write.call_args[0][0] == [("violation",)]
+
+    @pytest.mark.asyncio
+    async def test_redaction_scans_and_stores_fetched_bodies(self, service):
+        """With redaction, offloaded bodies are fetched for the scan and written from it, not fetched again"""
+        service.guardrails = Mock(enabled=True, redact=True, scan=AsyncMock(return_value=[]))
+        service.consumer.fetch_payloads.return_value = {"h1": "full body"}
+        service.writer.payloads_to_store.side_effect = lambda hashes: sorted(hashes)
+        service.writer.write_payloads = AsyncMock(return_value=1)
+        batch = TraceBatch({"trace_id": ["t1"], "sampled": [True], "input_hash": ["h1"], "output_hash": [None]})
+
+        violations, bodies = await service.scan_batch(batch)
+        await service.write_batch(batch, violations, bodies)
+
+        service.consumer.fetch_payloads.assert_called_once_with(["h1"])
+        assert service.guardrails.scan.await_args[0][1] == {"h1": "full body"}
+        service.writer.write_payloads.assert_awaited_once_with({"h1": "full body"})
+
+    @pytest.mark.asyncio
+    async def test_failed_scan_is_not_written(self, service):
+        """Batches that could not be scanned stay pending instead of being stored unscanned"""
+        service.guardrails = Mock(enabled=True, redact=False, scan=AsyncMock(side_effect=Exception("scanner died")))
+
+        await run_pipeline(service)
+
+        assert not service.writer.write_batch.called
+        assert not service.consumer.acknowledge_messages.called
+
+    @pytest.mark.asyncio
+    async def test_shrunk_batch_size_flushes_the_buffer(self, service):
+        """A batch size shrinking below the buffered entries flushes them instead of reading COUNT <= 0"""
+        now_ms = int(time.time() * 1000)
+        size = {"value": 10}
+        reads = [[
+            {"trace_id": f"t{i}", "_stream_name": "traces:pending", "_message_id": f"{now_ms}-{i}"}
+            for i in range(3)
+        ]]
+
+        def consume_batch(batch_size, block_ms):
+            assert batch_size > 0
+            if reads:
+                return reads.pop(0)
+            service.running = False
+            return []
+
+        def get_lag():
+            if service.consumer.get_lag.call_count == 2:
+                size["value"] = 2  # Shrinks while the entries are buffered
+            return 0
+
+        service.lag_sample_interval = 0
+        service.consumer.get_lag.side_effect = get_lag
+        service.consumer.consume_batch.side_effect = consume_batch
+
+        with patch.object(type(service.batcher), 'batch_size', property(lambda self: size["value"])):
+            await run_pipeline(service)
+
+        assert len(service.writer.write_batch.await_args_list[0][0][0]) == 3
+
+    @pytest.mark.asyncio
+    async def test_fresh_entries_are_buffered_into_one_batch(self, service):
+        """Entries well within the freshness deadline are written together"""
+        now_ms = int(time.time() * 1000)
+        reads = [
+            [{"trace_id": "t1", "_stream_name": "traces:pending", "_message_id": f"{now_ms}-0"}],
+            [{"trace_id": "t2", "_stream_name": "traces:pending", "_message_id": f"{now_ms}-1"}]
+        ]
+
+        def consume_batch(batch_size, block_ms):
+            assert block_ms <= service.batcher.max_delay_ms
+            if reads:
+                return reads.pop(0)
+            service.running = False
+            return []
+
+        service.consumer.consume_batch.side_effect = consume_batch
+
+        await run_pipeline(service)
+
+        assert service.writer.write_batch.await_count == 1
+        assert len(service.writer.write_batch.await_args[0][0]) == 2
+
+    def test_queue_and_pool_gauges_are_sampled(self, service):
+        """Queue depths and pool use are set explicitly, not read through callbacks"""
+        service.read_queue.put_nowait(object())
+        service.writer.pool.get_size.return_value = 8
+        service.writer.pool.get_idle_size.return_value = 3
+        service.writer.pool.get_max_size.return_value = 20
+
+        service._sample_gauges()
+
+        assert QUEUED_BATCHES.labels(queue="read")._value.get() == 1
+        assert QUEUED_BATCHES.labels(queue="write")._value.get() == 0
+        assert DB_POOL_CONNECTIONS.labels(state="in_use")._value.get() == 5
+        assert DB_POOL_CONNECTIONS.labels(state="max")._value.get() == 20
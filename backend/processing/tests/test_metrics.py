@@ -0,0 +1,85 @@
+"""Tests for the Prometheus metrics"""
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+import pytest
+from prometheus_client import REGISTRY, generate_latest
+from app.metrics import DEAD_LETTERED, STAGE_SECONDS, monitor_event_loop
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics:
+    """Test the metric families of the processing service"""
+
+    def test_stage_timing_is_observed_per_stage(self):
+        """Timed blocks land in the histogram of their stage"""
+        before = sample("processing_stage_seconds_count", stage="write")
+
+        with STAGE_SECONDS.labels(stage="write").time():
+            pass
+
+        assert sample("processing_stage_seconds_count", stage="write") == before + 1
+        assert sample("processing_stage_seconds_bucket", stage="write", le="+Inf") >= 1
+
+    def test_exposition_includes_the_service_metrics(self):
+        """Counters are exposed with a _total suffix next to the other families"""
+        DEAD_LETTERED.labels(reason="undecodable").inc()
+
+        text = generate_latest(REGISTRY).decode()
+
+        assert 'processing_dead_letter_total{reason="undecodable"}' in text
+        assert "# TYPE processing_stage_seconds histogram" in text
+        assert "# TYPE processing_consumer_lag gauge" in text
+
+    @pytest.mark.asyncio
+    async def test_event_loop_lag_is_sampled(self):
+        """The monitor observes one lag sample per interval"""
+        before = sample("processing_event_loop_lag_seconds_count")
+
+        task = asyncio.create_task(monitor_event_loop(interval_s=0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert sample("processing_event_loop_lag_seconds_count") > before
+
+    def test_forked_workers_are_served_from_one_registry(self, tmp_path):
+        """In multiprocess mode the samples of every forked worker are collected together"""
+        # The value backend is chosen when prometheus_client is imported, hence the subprocess
+        script = textwrap.dedent("""
+            import os
+            from prometheus_client import CollectorRegistry, multiprocess
+            from app.metrics import QUEUED_BATCHES, TRACES, reset_multiprocess_dir
+
+            reset_multiprocess_dir()
+            pids = []
+            for depth in (2, 3):
+                pid = os.fork()
+                if pid == 0:
+                    TRACES.labels(result="processed").inc(depth)
+                    QUEUED_BATCHES.labels(queue="write").set(depth)
+                    os._exit(0)
+                os.waitpid(pid, 0)
+                pids.append(pid)
+
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            print(registry.get_sample_value("processing_traces_total", {"result": "processed"}))
+            print(registry.get_sample_value("processing_queued_batches", {"queue": "write"}))
+            multiprocess.mark_process_dead(pids[0])
+            print(registry.get_sample_value("processing_queued_batches", {"queue": "write"}))
+        """)
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+
+        result = subprocess.run(
+            [sys.executable, "-c", script], env=env, cwd=Path(__file__).parent.parent,
+            capture_output=True, text=True, timeout=60
+        )
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.split() == ["5.0", "5.0", "3.0"]
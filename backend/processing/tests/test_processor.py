@@ -1,6 +1,7 @@
 """Tests for trace processor"""
 import pytest
 from datetime import datetime
+from unittest.mock import Mock
 from app.processor import TraceProcessor
 
 
@@ -110,3 +111,36 @@ class TestTraceProcessor:
         assert processed is not None
         assert processed['status'] == 'error'
         assert processed['error'] == "API timeout"
+
+    def test_process_columns_builds_batch(self, processor, valid_trace_data):
+        """Columns are filled, defaulted and normalised for the whole batch"""
+        traces = [
+            valid_trace_data,
+            dict(valid_trace_data, trace_id="trace_124", status="unknown", tokens_total=7),
+            dict(valid_trace_data, trace_id="trace_125", latency_ms="slow"),
+            {"trace_id": "trace_126"}
+        ]
+
+        batch, failed = processor.process_columns(traces)
+
+        assert batch['trace_id'] == ["trace_123", "trace_124"]
+        assert batch['tokens_total'] == [150, 7]
+        assert batch['status'] == ["success", "success"]
+        assert batch['timestamp'][0] == datetime.fromisoformat("2024-01-01T12:00:00+00:00")
+        assert batch['timestamp'][0] is batch['timestamp'][1]
+        assert batch['input'] == ["", ""]
+        assert batch['sampled'] == [True, True]
+        assert [f['trace_id'] for f in failed] == ["trace_126", "trace_125"]
+        assert failed[0]['error'] == "Missing required field: 'workspace_id'"
+
+    def test_process_columns_applies_tail_sampling(self, valid_trace_data):
+        """The sampler decides over row views and writes the sampled column"""
+        sampler = Mock()
+        sampler.decide.side_effect = lambda batch: [row.__setitem__('sampled', row['status'] == 'error') for row in batch]
+        processor = TraceProcessor(sampler)
+
+        batch, _ = processor.process_columns([valid_trace_data, dict(valid_trace_data, status="error")])
+
+        assert batch['sampled'] == [False, True]
+        assert processor.process_batch([valid_trace_data])[0][0]['sampled'] is False
+
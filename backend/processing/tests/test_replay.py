@@ -0,0 +1,142 @@
+"""Tests for the DLQ replay"""
+import json
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, Mock
+from app.batch import TraceBatch
+from app.consumer import TraceConsumer
+from app.replay import DLQReplayer, error_class, stream_id
+
+
+def dlq_entry(entry_id: str, trace_id: str, error: str = "Invalid JSON payload: Expecting value") -> tuple:
+    return entry_id.encode(), {
+        b"data": json.dumps({"trace_id": trace_id}).encode(),
+        b"original_message_id": b"1-0",
+        b"error": error.encode()
+    }
+
+
+@pytest.fixture
+def service():
+    """Processing service stand-in that writes whatever it is given"""
+    service = Mock()
+    service.writer_concurrency = 2
+    service.guardrails.enabled = False
+    service.processor.process_columns.side_effect = lambda traces: (
+        TraceBatch({"trace_id": [trace["trace_id"] for trace in traces]}), []
+    )
+    service.write_batch = AsyncMock(side_effect=lambda batch, violations, bodies: (len(batch), {}))
+    return service
+
+
+def paged(entries: list[tuple]):
+    """XRANGE over ``entries``, honouring exclusive starts and the count"""
+    def xrange(stream, min, max, count):
+        assert stream == TraceConsumer.DLQ_STREAM
+        start = 0
+        if min.startswith('('):
+            start = [entry_id.decode() for entry_id, _ in entries].index(min[1:]) + 1
+        return entries[start:start + count]
+    return xrange
+
+
+class TestReplay:
+    """Test DLQ replay"""
+
+    @pytest.mark.asyncio
+    async def test_replays_every_page_and_trims_the_dlq(self, service):
+        """All entries are reprocessed, written and deleted from the DLQ"""
+        entries = [dlq_entry(f"{i}-0", f"t{i}") for i in range(5)]
+        service.consumer.client.xrange.side_effect = paged(entries)
+
+        stats = await DLQReplayer(service, page_size=2).replay()
+
+        assert stats["scanned"] == 5
+        assert stats["replayed"] == 5
+        assert stats["failed"] == 0
+        assert stats["errors"] == {"Invalid JSON payload": 5}
+        deleted = [entry_id for call in service.consumer.client.xdel.call_args_list for entry_id in call.args[1:]]
+        assert sorted(deleted) == sorted(entry_id for entry_id, _ in entries)
+        service.consumer.client.hset.assert_called()
+
+    @pytest.mark.asyncio
+    async def test_filters_by_error_and_limit(self, service):
+        """Only entries whose error matches are replayed, up to the limit"""
+        entries = [
+            dlq_entry("1-0", "t1", "Exceeded 5 deliveries"),
+            dlq_entry("2-0", "t2"),
+            dlq_entry("3-0", "t3", "Exceeded 5 deliveries"),
+            dlq_entry("4-0", "t4", "Exceeded 5 deliveries")
+        ]
+        service.consumer.client.xrange.side_effect = paged(entries)
+
+        stats = await DLQReplayer(service).replay(error_pattern="^Exceeded", limit=2)
+
+        assert stats["matched"] == 2
+        written = service.write_batch.call_args.args[0]
+        assert written["trace_id"] == ["t1", "t3"]
+        service.consumer.client.xdel.assert_called_once_with(TraceConsumer.DLQ_STREAM, b"1-0", b"3-0")
+
+    @pytest.mark.asyncio
+    async def test_failed_entries_stay_in_the_dlq(self, service):
+        """Entries that still fail to decode or process are not deleted"""
+        undecodable = (b"2-0", {b"error": b"Stream entry has no data field"})
+        entries = [dlq_entry("1-0", "t1"), undecodable, dlq_entry("3-0", "t3")]
+        service.consumer.client.xrange.side_effect = paged(entries)
+
+        def process_columns(traces):
+            rejected = [trace for trace in traces if trace["trace_id"] == "t3"]
+            kept = [trace for trace in traces if trace["trace_id"] != "t3"]
+            return TraceBatch({"trace_id": [trace["trace_id"] for trace in kept]}), [
+                {"trace_id": "t3", "error": "Missing required field", "raw_data": trace} for trace in rejected
+            ]
+        service.processor.process_columns.side_effect = process_columns
+
+        stats = await DLQReplayer(service).replay()
+
+        assert stats["replayed"] == 1
+        assert stats["failed"] == 2
+        service.consumer.client.xdel.assert_called_once_with(TraceConsumer.DLQ_STREAM, b"1-0")
+
+    @pytest.mark.asyncio
+    async def test_page_is_kept_when_the_write_fails(self, service):
+        """A page whose write raised stays in the DLQ"""
+        service.consumer.client.xrange.side_effect = paged([dlq_entry("1-0", "t1"), dlq_entry("2-0", "t2")])
+        service.write_batch = AsyncMock(side_effect=ConnectionError("connection lost"))
+
+        stats = await DLQReplayer(service).replay()
+
+        assert stats["replayed"] == 0
+        assert stats["failed"] == 2
+        service.consumer.client.xdel.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_rejected_rows_stay_in_the_dlq(self, service):
+        """Only the entries whose rows the database rejected are kept"""
+        service.consumer.client.xrange.side_effect = paged([dlq_entry("1-0", "t1"), dlq_entry("2-0", "t2")])
+        service.write_batch = AsyncMock(return_value=(1, {"t2": "value too long"}))
+
+        stats = await DLQReplayer(service).replay()
+
+        assert stats["replayed"] == 1
+        assert stats["failed"] == 1
+        service.consumer.client.xdel.assert_called_once_with(TraceConsumer.DLQ_STREAM, b"1-0")
+
+    @pytest.mark.asyncio
+    async def test_dry_run_only_counts(self, service):
+        """A dry run reports error classes without writing or deleting"""
+        service.consumer.client.xrange.side_effect = paged([dlq_entry("1-0", "t1"), dlq_entry("2-0", "t2")])
+
+        stats = await DLQReplayer(service).replay(dry_run=True)
+
+        assert stats["matched"] == 2
+        service.write_batch.assert_not_called()
+        service.consumer.client.xdel.assert_not_called()
+
+
+def test_error_class_and_stream_bounds():
+    """Errors group by their prefix; time bounds become stream IDs"""
+    assert error_class("Invalid msgpack payload: unpack(b) received extra data") == "Invalid msgpack payload"
+    assert error_class("") == "unknown"
+    assert stream_id(None, '-') == '-'
+    assert stream_id(datetime(2024, 1, 1, tzinfo=timezone.utc), '+') == "1704067200000"
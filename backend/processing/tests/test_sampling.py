@@ -0,0 +1,84 @@
+"""Tests for tail sampling"""
+import json
+from unittest.mock import Mock
+from app.sampling import RULES_KEY, SamplingRule, TailSampler
+
+WORKSPACE_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+def make_trace(i: int, **overrides) -> dict:
+    trace = {
+        "trace_id": f"trace_{i}",
+        "workspace_id": WORKSPACE_ID,
+        "latency_ms": 100,
+        "status": "success",
+        "cost_usd": 0.001,
+        "tags": [],
+        "sampled": True
+    }
+    trace.update(overrides)
+    return trace
+
+
+def make_sampler(rules: dict) -> TailSampler:
+    client = Mock()
+    client.hgetall.return_value = {k.encode(): json.dumps(v).encode() for k, v in rules.items()}
+    return TailSampler(client)
+
+
+class TestTailSampler:
+    """Test tail sampling decisions"""
+
+    def test_head_dropped_traces_stay_dropped(self):
+        """Traces dropped at ingestion are never kept at processing"""
+        sampler = make_sampler({})
+        traces = [make_trace(0, sampled=False, status="error")]
+
+        sampler.decide(traces)
+
+        assert traces[0]["sampled"] is False
+        sampler.client.hgetall.assert_called_once_with(RULES_KEY)
+
+    def test_errors_and_keep_tags_are_always_kept(self):
+        """Errors and tagged traces are kept at a zero sample rate"""
+        sampler = make_sampler({WORKSPACE_ID: {"tail_rate": 0.0, "keep_tags": ["vip"]}})
+        traces = [
+            make_trace(0, status="error"),
+            make_trace(1, tags=["vip"]),
+            make_trace(2)
+        ]
+
+        sampler.decide(traces)
+
+        assert [t["sampled"] for t in traces] == [True, True, False]
+
+    def test_latency_outliers_are_kept(self):
+        """Traces above the workspace percentile are kept"""
+        sampler = make_sampler({"default": {"tail_rate": 0.0, "latency_percentile": 0.9}})
+        traces = [make_trace(i, latency_ms=100 + i) for i in range(100)]
+
+        sampler.decide(traces)
+
+        kept = [t["latency_ms"] for t in traces if t["sampled"]]
+        assert kept == list(range(190, 200))
+
+    def test_rate_is_deterministic_per_trace(self):
+        """The same trace gets the same decision; the kept fraction follows the rate"""
+        sampler = make_sampler({"default": {"tail_rate": 0.25}})
+        traces = [make_trace(i) for i in range(2000)]
+        again = [make_trace(i) for i in range(2000)]
+
+        sampler.decide(traces)
+        sampler.decide(again)
+
+        assert [t["sampled"] for t in traces] == [t["sampled"] for t in again]
+        assert 400 < sum(t["sampled"] for t in traces) < 600
+
+    def test_rule_falls_back_to_default(self):
+        """Workspace rules inherit missing fields from the default rule"""
+        default = SamplingRule(tail_rate=0.5, min_cost_usd=1.0)
+        rule = SamplingRule.from_dict({"tail_rate": 0.1}, default)
+
+        assert rule.tail_rate == 0.1
+        assert rule.min_cost_usd == 1.0
+        assert rule.always_keep({"status": "success", "cost_usd": 2.0})
@@ -0,0 +1,79 @@
+"""Tests for weighted fair scheduling across workspaces"""
+from unittest.mock import Mock
+from app.scheduling import FairScheduler
+
+
+def traces(workspace_id: str, count: int, stream: str = "traces:pending", start: int = 0) -> list[dict]:
+    return [
+        {"workspace_id": workspace_id, "trace_id": f"{workspace_id}-{i}",
+         "_stream_name": stream, "_message_id": f"{workspace_id}-{i}"}
+        for i in range(start, start + count)
+    ]
+
+
+def scheduler(weights: dict = None, quantum: int = 10) -> FairScheduler:
+    client = Mock()
+    client.hgetall.return_value = {key.encode(): str(value).encode() for key, value in (weights or {}).items()}
+    return FairScheduler(client, quantum=quantum, refresh_interval=30)
+
+
+class TestFairScheduler:
+    """Test deficit round-robin across workspaces"""
+
+    def test_backlog_does_not_starve_small_workspaces(self):
+        """A small workspace queued behind a large backlog is served in the first batch"""
+        fair = scheduler()
+        fair.push(traces("big", 1000))
+        fair.push(traces("small", 5))
+
+        batch = fair.pop(50)
+
+        assert [t["trace_id"] for t in batch if t["workspace_id"] == "small"] == [f"small-{i}" for i in range(5)]
+        assert len(batch) == 50
+
+    def test_weights_share_batches(self):
+        """Backlogged workspaces share batches in proportion to their weights"""
+        fair = scheduler({"a": 3, "default": 1})
+        fair.push(traces("a", 1000))
+        fair.push(traces("b", 1000))
+
+        batch = fair.pop(400)
+
+        assert sum(t["workspace_id"] == "a" for t in batch) == 300
+        assert sum(t["workspace_id"] == "b" for t in batch) == 100
+
+    def test_order_is_kept_within_a_workspace(self):
+        """Entries of a workspace come out in stream order across calls"""
+        fair = scheduler(quantum=3)
+        fair.push(traces("a", 10))
+        fair.push(traces("b", 10))
+
+        taken = fair.pop(7) + fair.pop(7) + fair.pop(100)
+
+        assert [t["trace_id"] for t in taken if t["workspace_id"] == "a"] == [f"a-{i}" for i in range(10)]
+        assert len(taken) == 20
+        assert len(fair) == 0
+
+    def test_interrupted_workspace_keeps_its_turn(self):
+        """A workspace cut off by a full batch continues before the next workspace"""
+        fair = scheduler(quantum=10)
+        fair.push(traces("a", 100))
+        fair.push(traces("b", 100))
+
+        assert {t["workspace_id"] for t in fair.pop(4)} == {"a"}
+        assert [t["workspace_id"] for t in fair.pop(10)] == ["a"] * 6 + ["b"] * 4
+
+    def test_tracks_buffered_entries_per_stream(self):
+        """Per-stream counts and membership follow pushes, pops and discards"""
+        fair = scheduler()
+        fair.push(traces("a", 5, stream="traces:pending:0"))
+        fair.push(traces("b", 5, stream="traces:pending:1"))
+
+        assert fair.buffered("traces:pending:0") == 5
+        assert ("traces:pending:1", "b-0") in fair
+
+        assert fair.discard("traces:pending:1") == 5
+        assert fair.buffered("traces:pending:1") == 0
+        assert ("traces:pending:1", "b-0") not in fair
+        assert [t["workspace_id"] for t in fair.pop(100)] == ["a"] * 5
+        assert fair.buffered("traces:pending:0") == 0
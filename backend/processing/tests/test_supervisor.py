@@ -0,0 +1,92 @@
+"""Tests for the processing worker supervisor"""
+import json
+import time
+import pytest
+from unittest.mock import Mock, patch
+from app.supervisor import WorkerSupervisor
+
+
+@pytest.fixture
+def supervisor():
+    """Supervisor of two workers with mocked processes and Redis"""
+    with patch('app.supervisor.redis'):
+        supervisor = WorkerSupervisor(workers=2)
+    supervisor.context = Mock()
+    supervisor.context.Process.side_effect = lambda **kwargs: Mock(pid=100, exitcode=None)
+    return supervisor
+
+
+class TestWorkerSupervisor:
+    """Test worker supervision"""
+
+    def test_defaults_to_one_worker_per_core(self):
+        """Without PROCESSING_WORKERS the pool is sized to the cores"""
+        with patch('app.supervisor.redis'), patch('app.supervisor.os.cpu_count', return_value=6):
+            assert WorkerSupervisor().workers == 6
+
+    def test_exited_worker_is_restarted_with_backoff(self, supervisor):
+        """A dead worker is replaced, but only after its backoff"""
+        supervisor.check_workers()
+        assert supervisor.context.Process.call_count == 2
+
+        crashed = supervisor.processes[0]
+        crashed.is_alive.return_value = False
+        crashed.exitcode = 1
+        supervisor.check_workers()
+
+        assert supervisor.processes[0] is None
+        assert supervisor.restarts[0] == 1
+
+        supervisor.next_start[0] = time.monotonic()
+        supervisor.check_workers()
+        assert supervisor.context.Process.call_count == 3
+
+    def test_workers_serve_their_own_metrics_without_multiprocess_dir(self, supervisor):
+        """Worker n listens on metrics_port + n when samples are not shared"""
+        supervisor.metrics_port, supervisor.multiprocess_metrics = 9102, False
+
+        supervisor.check_workers()
+
+        ports = [call.kwargs["args"] for call in supervisor.context.Process.call_args_list]
+        assert ports == [(9102,), (9103,)]
+
+    def test_supervisor_serves_all_metrics_in_multiprocess_mode(self, supervisor):
+        """With a multiprocess dir the workers serve nothing and the supervisor one endpoint"""
+        supervisor.metrics_port, supervisor.multiprocess_metrics = 9102, True
+        supervisor.stop = Mock()
+        # Stop after the first supervision round
+        supervisor.report = Mock()
+        supervisor.stats_interval = 0
+
+        with patch('app.supervisor.signal'), patch('app.supervisor.time.sleep',
+                                                    side_effect=lambda _: setattr(supervisor, "running", False)), \
+                patch('app.supervisor.reset_multiprocess_dir') as reset, \
+                patch('app.supervisor.serve_metrics') as serve:
+            supervisor.run()
+
+        reset.assert_called_once()
+        serve.assert_called_once_with(9102)
+        ports = [call.kwargs["args"] for call in supervisor.context.Process.call_args_list]
+        assert ports == [(0,), (0,)]
+
+    def test_exited_worker_is_marked_dead_for_metrics(self, supervisor):
+        """The live gauges of an exited worker stop being served"""
+        supervisor.check_workers()
+        supervisor.processes[1].is_alive.return_value = False
+
+        with patch('app.supervisor.mark_process_dead') as mark_dead:
+            supervisor.check_workers()
+
+        mark_dead.assert_called_once_with(100)
+
+    def test_report_prunes_silent_workers(self, supervisor):
+        """Workers whose heartbeat is stale are removed from traces:workers"""
+        now = time.time()
+        supervisor.client.hgetall.return_value = {
+            "processor_a": json.dumps({"heartbeat": now, "traces_per_s": 50.0, "processed": 500, "failed": 0, "queued": 1}),
+            "processor_b": json.dumps({"heartbeat": now - 600, "traces_per_s": 0.0, "processed": 9, "failed": 0, "queued": 0})
+        }
+
+        supervisor.report()
+
+        supervisor.client.hdel.assert_called_once_with("traces:workers", "processor_b")
@@ -1,8 +1,12 @@
 """Tests for TimescaleDB writer"""
+import asyncpg
+import importlib.util
 import pytest
 from datetime import datetime
-from unittest.mock import AsyncMock, Mock, patch
-from app.writer import TraceWriter
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from app.batch import BATCH_COLUMNS, TRACE_COLUMNS, TraceBatch
+from app.writer import TraceWriter, rollup_upsert_sql
 
 
 @pytest.fixture
@@ -14,6 +18,16 @@ def mock_asyncpg():
         yield mock_conn
 
 
+def pooled(conn):
+    """Connection pool mock handing out ``conn``"""
+    pool = Mock()
+    acquired = MagicMock()
+    acquired.__aenter__.return_value = conn
+    pool.acquire.return_value = acquired
+    conn.transaction = MagicMock()
+    return pool
+
+
 @pytest.fixture
 def valid_trace():
     """Valid processed trace for writing"""
@@ -45,42 +59,228 @@ class TestTraceWriter:
     async def test_write_trace_success(self, mock_asyncpg, valid_trace):
         """Test writing a single trace successfully"""
         writer = TraceWriter()
-        writer.conn = mock_asyncpg
+        writer.pool = pooled(mock_asyncpg)
         mock_asyncpg.execute.return_value = None
 
         result = await writer.write_trace(valid_trace)
 
         assert result is True
         assert mock_asyncpg.execute.called
+        assert "INSERT INTO traces_minutely" in mock_asyncpg.execute.call_args[0][0]
 
     @pytest.mark.asyncio
     async def test_write_batch_success(self, mock_asyncpg, valid_trace):
         """Test writing multiple traces in batch"""
         writer = TraceWriter()
-        writer.conn = mock_asyncpg
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "executemany"
         mock_asyncpg.executemany.return_value = None
 
         traces = [valid_trace, valid_trace.copy()]
         successful, failed = await writer.write_batch(traces)
 
         assert successful == 2
-        assert failed == 0
+        assert failed == {}
         assert mock_asyncpg.executemany.called
 
     @pytest.mark.asyncio
     async def test_write_batch_handles_failures(self, mock_asyncpg, valid_trace):
-        """Test batch write falls back to individual writes on failure"""
+        """Test batch write falls back to individual writes when rows are rejected"""
         writer = TraceWriter()
-        writer.conn = mock_asyncpg
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "executemany"
 
-        # Mock executemany to fail, but individual execute to succeed
-        mock_asyncpg.executemany.side_effect = Exception("Batch insert failed")
+        # Mock executemany to reject every row
+        mock_asyncpg.executemany.side_effect = asyncpg.DataError("Batch insert failed")
         mock_asyncpg.execute.return_value = None
 
-        traces = [valid_trace, valid_trace.copy()]
+        traces = [valid_trace, dict(valid_trace, trace_id="trace_124")]
         successful, failed = await writer.write_batch(traces)
 
         # Should fall back to individual inserts
-        assert successful >= 0
-        assert failed >= 0
-        assert successful + failed == 2
+        assert successful == 0
+        assert failed == {"trace_123": "Batch insert failed", "trace_124": "Batch insert failed"}
+
+    @pytest.mark.asyncio
+    async def test_connection_errors_fail_the_batch(self, mock_asyncpg, valid_trace):
+        """Errors not caused by the rows are raised without bisecting, so nothing is acknowledged"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "copy"
+        mock_asyncpg.copy_records_to_table.side_effect = asyncpg.ConnectionDoesNotExistError("connection lost")
+
+        traces = [dict(valid_trace, trace_id=f"trace_{i}") for i in range(4)]
+        with pytest.raises(asyncpg.ConnectionDoesNotExistError):
+            await writer.write_batch(traces)
+
+        assert mock_asyncpg.copy_records_to_table.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_copy_batch_through_staging_table(self, mock_asyncpg, valid_trace):
+        """Copy mode stages the batch and inserts it with one statement"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "copy"
+
+        successful, failed = await writer.write_batch([valid_trace, dict(valid_trace, trace_id="trace_124")])
+        await writer.write_batch([valid_trace])
+
+        assert (successful, failed) == (2, {})
+        records = mock_asyncpg.copy_records_to_table.call_args_list[0][1]["records"]
+        assert [r[0] for r in records] == ["trace_123", "trace_124"]
+        statements = [call[0][0] for call in mock_asyncpg.execute.call_args_list]
+        assert sum("FROM traces_staging" in sql for sql in statements) == 2
+        assert not mock_asyncpg.executemany.called
+
+    @pytest.mark.asyncio
+    async def test_columnar_batch_feeds_copy(self, mock_asyncpg, valid_trace):
+        """A TraceBatch is copied row by row in column order without per-trace dicts"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "copy"
+        batch = TraceBatch({name: [valid_trace.get(name)] for name in BATCH_COLUMNS})
+
+        assert await writer.write_batch(batch) == (1, {})
+
+        kwargs = mock_asyncpg.copy_records_to_table.call_args[1]
+        assert kwargs['columns'] == TRACE_COLUMNS
+        assert kwargs['records'] == [writer._record(valid_trace)]
+
+    @pytest.mark.asyncio
+    async def test_pool_connections_create_staging_table(self, mock_asyncpg):
+        """Each new pool connection gets its own staging tables"""
+        writer = TraceWriter()
+        writer.write_mode = "copy"
+
+        await writer._init_connection(mock_asyncpg)
+
+        statements = [call[0][0] for call in mock_asyncpg.execute.call_args_list]
+        assert any("CREATE TEMP TABLE IF NOT EXISTS traces_staging" in sql for sql in statements)
+        assert any("CREATE TEMP TABLE IF NOT EXISTS traces_sampled_staging" in sql for sql in statements)
+
+    @pytest.mark.asyncio
+    async def test_copy_failure_is_bisected(self, mock_asyncpg, valid_trace):
+        """Only the bad trace fails; the rest of the batch is written"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "copy"
+
+        async def copy(table, records, columns):
+            if any(r[0] == "bad" for r in records):
+                raise asyncpg.DataError("invalid input syntax")
+        mock_asyncpg.copy_records_to_table.side_effect = copy
+
+        traces = [dict(valid_trace, trace_id=f"trace_{i}") for i in range(8)]
+        traces[5]["trace_id"] = "bad"
+        successful, failed = await writer.write_batch(traces)
+
+        assert (successful, failed) == (7, {"bad": "invalid input syntax"})
+        # 1 full batch + 2 halves + 2 quarters + 2 pairs of singles
+        assert mock_asyncpg.copy_records_to_table.call_count == 7
+
+    @pytest.mark.asyncio
+    async def test_payloads_are_stored_once(self, mock_asyncpg):
+        """Stored content hashes are not fetched or written again"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+
+        assert sorted(writer.payloads_to_store({"aa", "bb"})) == ["aa", "bb"]
+        written = await writer.write_payloads({"aa": "template body", "bb": "other body"})
+
+        assert written == 2
+        rows = mock_asyncpg.executemany.call_args[0][1]
+        assert ("aa", "template body", 13) in rows
+        assert writer.payloads_to_store({"aa", "bb", "cc"}) == ["cc"]
+
+    @pytest.mark.asyncio
+    async def test_remembered_payloads_are_upserted_again(self, mock_asyncpg):
+        """Hashes are written again once their write is older than the TTL, to refresh last_seen_at"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.payload_cache_ttl_s = 3600
+
+        with patch("app.writer.time.monotonic", return_value=1000.0):
+            await writer.write_payloads({"aa": "body"})
+        with patch("app.writer.time.monotonic", return_value=4000.0):
+            assert writer.payloads_to_store({"aa"}) == []
+        with patch("app.writer.time.monotonic", return_value=5000.0):
+            assert writer.payloads_to_store({"aa"}) == ["aa"]
+
+    @pytest.mark.asyncio
+    async def test_failed_payload_write_is_retried(self, mock_asyncpg):
+        """A failed write raises and its hashes are not remembered"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        mock_asyncpg.executemany.side_effect = Exception("connection lost")
+
+        with pytest.raises(Exception, match="connection lost"):
+            await writer.write_payloads({"aa": "body"})
+        assert writer.payloads_to_store({"aa"}) == ["aa"]
+
+    @pytest.mark.asyncio
+    async def test_write_sampled_out_is_counted_once(self, mock_asyncpg, valid_trace):
+        """Sampled-out traces are staged and rolled up only if their key is new"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "copy"
+        traces = [
+            dict(valid_trace, sampled=False),
+            dict(valid_trace, trace_id="trace_124", sampled=False, status="error")
+        ]
+
+        result = await writer.write_sampled_out(traces)
+
+        assert result == 2
+        kwargs = mock_asyncpg.copy_records_to_table.call_args[1]
+        assert mock_asyncpg.copy_records_to_table.call_args[0][0] == "traces_sampled_staging"
+        assert [r[0] for r in kwargs['records']] == ["trace_123", "trace_124"]
+        sql = mock_asyncpg.execute.call_args[0][0]
+        assert "INSERT INTO traces_sampled_keys" in sql
+        assert "staged JOIN counted" in sql
+        assert "INSERT INTO traces_minutely" in sql
+
+    @pytest.mark.asyncio
+    async def test_failed_sampled_out_count_raises(self, mock_asyncpg, valid_trace):
+        """A failed rollup write raises, so the batch is redelivered instead of losing its counts"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "copy"
+        mock_asyncpg.execute.side_effect = Exception("connection lost")
+
+        with pytest.raises(Exception, match="connection lost"):
+            await writer.write_sampled_out([dict(valid_trace, sampled=False)])
+
+    @pytest.mark.asyncio
+    async def test_stored_traces_are_rolled_up_from_inserted_rows(self, mock_asyncpg, valid_trace):
+        """The rollup reads RETURNING rows, so conflicting (redelivered) traces are not counted"""
+        writer = TraceWriter()
+        writer.pool = pooled(mock_asyncpg)
+        writer.write_mode = "executemany"
+
+        await writer.write_batch([valid_trace])
+
+        assert "INSERT INTO traces_staging" in mock_asyncpg.executemany.call_args[0][0]
+        sql = mock_asyncpg.execute.call_args[0][0]
+        assert "ON CONFLICT (trace_id, timestamp) DO NOTHING" in sql
+        assert "RETURNING" in sql
+        assert "FROM inserted" in sql
+
+    def test_rollup_merges_latency_sketches(self):
+        """Rollup rows carry a latency sketch merged on conflict"""
+        sql = rollup_upsert_sql('inserted')
+
+        assert "unnest(array_agg(latency_ms))" in sql
+        assert "latency_sketch = latency_sketch_merge(traces_minutely.latency_sketch, EXCLUDED.latency_sketch)" in sql
+
+
+def test_synthetic_loader_rolls_up_like_the_writer():
+    """The synthetic data loader adds its traces to traces_minutely with the writer's upsert"""
+    pytest.importorskip("dotenv")
+    path = Path(__file__).parents[2] / "synthetic_data" / "load_data.py"
+    if not path.exists():
+        pytest.skip("synthetic_data is not part of this checkout")
+    spec = importlib.util.spec_from_file_location("load_data", path)
+    load_data = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(load_data)
+
+    assert load_data.ROLLUP_INSERTED_SQL.split() == rollup_upsert_sql('inserted').split()
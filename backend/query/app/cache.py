@@ -1,25 +1,266 @@
 """Redis caching layer for Query Service"""
-import redis
+import redis.asyncio as redis
+import asyncio
+import fnmatch
 import json
 import logging
-from typing import Optional, Any
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional, Any
 from functools import wraps
 from .config import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Global Redis client
-redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+# Global asyncio Redis client; connections are pooled and opened on first use
+redis_pool = redis.ConnectionPool.from_url(
+    settings.redis_url,
+    decode_responses=True,
+    max_connections=settings.cache_max_connections,
+    socket_timeout=settings.cache_timeout_s,
+    socket_connect_timeout=settings.cache_timeout_s
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
 
+# Release a key's compute lock only if this worker still holds it
+LOCK_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
-def get_cache(key: str) -> Optional[Any]:
+
+class LocalCache:
+    """
+    Bounded in-process LRU tier in front of Redis
+
+    Values are kept as their JSON text, so every hit returns a fresh copy
+    and the tier is bounded by ``max_bytes`` of text rather than by entry
+    count: one large trace list does not count the same as a KPI.
+    Least recently used entries are evicted first; expired entries are
+    dropped when next read.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()  # key -> (expires at, JSON text)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, text: str, ttl: float):
+        self.delete(key)
+        if ttl <= 0 or len(text) > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + ttl, text)
+        self.size += len(text)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def delete_matching(self, pattern: str):
+        """Delete keys matching a Redis glob pattern"""
+        for key in [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]:
+            self.delete(key)
+
+
+local_cache = LocalCache(settings.cache_local_max_bytes)
+
+# Keys being computed by a request of this process -> future of their JSON text (None if abandoned)
+_inflight: dict[str, asyncio.Future] = {}
+# Keys whose cluster-wide compute lock this process holds -> lock token
+_locks: dict[str, str] = {}
+
+
+def local_ttl(key: str) -> int:
+    """Local tier TTL of a key: the setting of its longest matching family prefix"""
+    family = max((prefix for prefix in settings.cache_local_ttls if key.startswith(prefix)), key=len, default=None)
+    return settings.cache_local_ttl_s if family is None else settings.cache_local_ttls[family]
+
+
+def _lock_key(key: str) -> str:
+    return f"lock:{key}"
+
+
+async def _read_through(key: str) -> tuple[Optional[str], bool]:
+    """
+    Read a key from Redis into the local tier
+
+    Redis keeps entries ``cache_stale_ttl_s`` past their TTL; the remaining
+    PTTL tells whether the value is still fresh. Only fresh values enter
+    the local tier, and for no longer than they stay fresh.
+
+    Returns:
+        tuple: (JSON text or None, whether it is past its TTL)
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        pipe.pttl(key)
+        text, pttl = await pipe.execute()
+    if not text:
+        return None, False
+    if pttl is None or pttl < 0:
+        # No expiry (written without a TTL)
+        local_cache.set(key, text, local_ttl(key))
+        return text, False
+    fresh_for = pttl / 1000 - settings.cache_stale_ttl_s
+    if fresh_for <= 0:
+        return text, True
+    local_cache.set(key, text, min(local_ttl(key), fresh_for))
+    return text, False
+
+
+def _claim(key: str, task: Optional[asyncio.Task] = None):
+    """Make a request (the current task by default) the one computing ``key``"""
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    task = task or asyncio.current_task()
+    if task is not None:
+        # A request that ends without storing the value (e.g. it raised) releases the waiters
+        task.add_done_callback(lambda _: _settle(key, None, future))
+
+
+def _settle(key: str, text: Optional[str], future: Optional[asyncio.Future] = None):
+    """Hand the computed value (or None when abandoned) to the requests waiting for ``key``"""
+    current = _inflight.get(key)
+    if future is None:
+        future = current
+    if future is None or future.done():
+        return
+    future.set_result(text)
+    if current is not future:
+        return  # superseded: the lock now belongs to the newer claimer
+    del _inflight[key]
+    token = _locks.pop(key, None)
+    if token is not None:
+        asyncio.ensure_future(_release_lock(key, token))
+
+
+async def _release_lock(key: str, token: str):
+    try:
+        await redis_client.eval(LOCK_RELEASE_SCRIPT, 1, _lock_key(key), token)
+    except Exception as e:
+        logger.error(f"Cache lock release error: {str(e)}")
+
+
+async def _acquire_lock(key: str) -> bool:
+    """Take the cluster-wide compute lock of ``key`` if it is free"""
+    token = uuid.uuid4().hex
+    if await redis_client.set(_lock_key(key), token, nx=True, px=int(settings.cache_coalesce_timeout_s * 1000)):
+        _locks[key] = token
+        return True
+    return False
+
+
+async def _wait_for_cluster(key: str) -> Optional[str]:
+    """
+    Take the cluster-wide compute lock of ``key``, or wait for its holder's value
+
+    Returns:
+        Optional[str]: The value computed by another worker, or None if this
+            worker should compute it
+    """
+    deadline = time.monotonic() + settings.cache_coalesce_timeout_s
+    while True:
+        if await _acquire_lock(key):
+            return None
+        await asyncio.sleep(0.05)
+        text, _ = await _read_through(key)
+        if text:
+            return text
+        if time.monotonic() >= deadline:
+            return None
+
+
+async def _try_lock(key: str) -> bool:
+    """Take the cluster-wide compute lock of ``key`` without waiting (always True without ``cache_cluster_lock``)"""
+    if not settings.cache_cluster_lock:
+        return True
+    try:
+        return await _acquire_lock(key)
+    except Exception as e:
+        logger.error(f"Cache lock error: {str(e)}")
+        return False
+
+
+async def _lookup(key: str) -> tuple[Optional[str], bool]:
+    """
+    JSON text of a key from the local tier, then Redis
+
+    On a miss the current request is made responsible for computing the
+    key: concurrent lookups of the same key in this process wait for its
+    ``set_cache`` (up to ``cache_coalesce_timeout_s``) instead of missing
+    too, and with ``cache_cluster_lock`` so do the other workers. Values
+    past their TTL are returned as stale rather than waited for.
+
+    Returns:
+        tuple: (JSON text or None, whether it is past its TTL)
+    """
+    text = local_cache.get(key)
+    if text is not None:
+        return text, False
+
+    try:
+        text, stale = await _read_through(key)
+        if text:
+            return text, stale
+    except Exception as e:
+        # Redis down: the local tier and single-flight still spare the database
+        logger.error(f"Cache read error: {str(e)}")
+
+    flight = _inflight.get(key)
+    if flight is not None:
+        try:
+            text = await asyncio.wait_for(asyncio.shield(flight), settings.cache_coalesce_timeout_s)
+        except asyncio.TimeoutError:
+            return None, False
+        if text is not None:
+            return text, False
+
+    if key not in _inflight:
+        _claim(key)
+        if settings.cache_cluster_lock:
+            try:
+                text = await _wait_for_cluster(key)
+            except Exception as e:
+                logger.error(f"Cache lock error: {str(e)}")
+            if text:
+                _settle(key, text)
+                return text, False
+    return None, False
+
+
+async def get_cache(key: str) -> Optional[Any]:
     """Get value from cache"""
     try:
-        value = redis_client.get(key)
-        if value:
+        text, stale = await _lookup(key)
+        if stale and key not in _inflight and await _try_lock(key):
+            # Past its TTL: this request recomputes the value while the others are served the stale one
+            _claim(key)
+            logger.debug(f"Cache STALE: {key}")
+            return None
+        if text:
             logger.debug(f"Cache HIT: {key}")
-            return json.loads(value)
+            return json.loads(text)
         logger.debug(f"Cache MISS: {key}")
         return None
     except Exception as e:
@@ -27,30 +268,196 @@ def get_cache(key: str) -> Optional[Any]:
         return None
 
 
-def set_cache(key: str, value: Any, ttl: int):
-    """Set value in cache with TTL"""
+async def get_cache_many(keys: list[str]) -> list[Optional[Any]]:
+    """Get several values in one round-trip (MGET); misses and errors are None"""
+    texts = {key: local_cache.get(key) for key in keys}
+    missing = [key for key, text in texts.items() if text is None]
+    if missing:
+        try:
+            # Stale values included: MGET does not tell their age
+            for key, text in zip(missing, await redis_client.mget(missing)):
+                texts[key] = text
+        except Exception as e:
+            logger.error(f"Cache read error: {str(e)}")
+    return [json.loads(texts[key]) if texts[key] else None for key in keys]
+
+
+async def set_cache(key: str, value: Any, ttl: int):
+    """Set value in cache with TTL (a TTL of 0 deletes the key)"""
+    if ttl <= 0:
+        local_cache.delete(key)
+        try:
+            await redis_client.delete(key)
+            logger.debug(f"Cache DELETE: {key}")
+        except Exception as e:
+            logger.error(f"Cache write error: {str(e)}")
+        return
+
+    text = json.dumps(value, default=str)
+    local_cache.set(key, text, min(local_ttl(key), ttl))
+    _settle(key, text)
     try:
-        redis_client.setex(key, ttl, json.dumps(value, default=str))
+        await redis_client.setex(key, ttl + settings.cache_stale_ttl_s, text)
         logger.debug(f"Cache SET: {key} (TTL: {ttl}s)")
     except Exception as e:
         logger.error(f"Cache write error: {str(e)}")
 
 
-def invalidate_cache(pattern: str):
-    """Invalidate cache keys matching pattern"""
+async def set_cache_many(values: dict[str, Any], ttl: int):
+    """Set several values with the same TTL in one pipelined round-trip"""
+    if not values:
+        return
+    texts = {key: json.dumps(value, default=str) for key, value in values.items()}
+    for key, text in texts.items():
+        local_cache.set(key, text, min(local_ttl(key), ttl))
+        _settle(key, text)
     try:
-        keys = redis_client.keys(pattern)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, text in texts.items():
+                pipe.setex(key, ttl + settings.cache_stale_ttl_s, text)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Cache write error: {str(e)}")
+
+
+class HotKey:
+    """How to recompute a get_or_compute key, and its recent hits"""
+
+    __slots__ = ("compute", "ttl", "hits")
+
+    def __init__(self, compute: Callable[[], Awaitable[Any]], ttl: int):
+        self.compute = compute
+        self.ttl = ttl
+        self.hits: deque = deque(maxlen=max(settings.cache_hot_min_hits, 1))
+
+    def hit(self):
+        self.hits.append(time.monotonic())
+
+    def is_hot(self, now: float) -> bool:
+        """At least ``cache_hot_min_hits`` hits within the last ``cache_hot_window_s``"""
+        return len(self.hits) == self.hits.maxlen and now - self.hits[0] <= settings.cache_hot_window_s
+
+
+# get_or_compute keys accessed within the hot window -> their HotKey
+hot_keys: dict[str, HotKey] = {}
+
+
+def _refresh_in_background(key: str, compute: Callable[[], Awaitable[Any]], ttl: int):
+    """Recompute a key in a background task, unless it is already being computed"""
+    if key in _inflight:
+        return
+
+    async def refresh():
+        if not await _try_lock(key):
+            # Another worker is refreshing it
+            _settle(key, None)
+            return
+        try:
+            await set_cache(key, await compute(), ttl)
+            logger.debug(f"Cache REFRESHED: {key}")
+        except Exception as e:
+            logger.error(f"Cache refresh of {key} failed: {str(e)}")
+
+    # Claimed before the task runs, so concurrent stale hits start a single refresh
+    task = asyncio.get_running_loop().create_task(refresh())
+    _claim(key, task)
+
+
+async def get_or_compute(key: str, compute: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+    """
+    Cached value of a key, computing and storing it on a miss
+
+    Only one request per key computes at a time (per process, and across
+    workers with ``cache_cluster_lock``); the others get its result. A
+    value past its TTL (but within ``cache_stale_ttl_s``) is returned
+    immediately while one background task recomputes it, and keys hit
+    often enough are recomputed by ``refresh_hot_keys`` before they expire.
+
+    Args:
+        key: Cache key
+        compute: Coroutine function producing the value
+        ttl: Time to live in seconds
+    """
+    entry = hot_keys.get(key)
+    if entry is None:
+        entry = hot_keys[key] = HotKey(compute, ttl)
+    entry.compute, entry.ttl = compute, ttl
+    entry.hit()
+
+    try:
+        text, stale = await _lookup(key)
+    except Exception as e:
+        logger.error(f"Cache read error: {str(e)}")
+        text, stale = None, False
+    if text:
+        if stale:
+            _refresh_in_background(key, compute, ttl)
+        return json.loads(text)
+
+    try:
+        value = await compute()
+    except BaseException:
+        _settle(key, None)
+        raise
+    await set_cache(key, value, ttl)
+    return value
+
+
+async def refresh_hot_keys():
+    """
+    Recompute hot get_or_compute keys shortly before their TTL runs out, until cancelled
+
+    Every ``cache_refresh_interval_s`` the remaining TTL of the hot keys
+    is read in one pipeline; keys with less than ``cache_refresh_ahead_s``
+    left are refreshed in the background, so their readers never see a
+    miss or a stale value. Keys not hit within the hot window are forgotten.
+    """
+    while True:
+        await asyncio.sleep(settings.cache_refresh_interval_s)
+        try:
+            now = time.monotonic()
+            for key in [key for key, entry in hot_keys.items() if now - entry.hits[-1] > settings.cache_hot_window_s]:
+                del hot_keys[key]
+
+            due = [key for key, entry in hot_keys.items() if entry.is_hot(now) and key not in _inflight]
+            if not due:
+                continue
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in due:
+                    pipe.pttl(key)
+                pttls = await pipe.execute()
+
+            for key, pttl in zip(due, pttls):
+                entry = hot_keys.get(key)
+                # Missing keys (-2) are left to the next request; keys without expiry (-1) never need it
+                if entry is not None and pttl >= 0 and pttl / 1000 - settings.cache_stale_ttl_s < settings.cache_refresh_ahead_s:
+                    _refresh_in_background(key, entry.compute, entry.ttl)
+        except Exception as e:
+            logger.error(f"Hot key refresh error: {str(e)}")
+
+
+async def invalidate_cache(pattern: str):
+    """Invalidate cache keys matching pattern (other workers' local tiers expire within their local TTL)"""
+    local_cache.delete_matching(pattern)
+    try:
+        # SCAN rather than KEYS, which blocks Redis on large keyspaces
+        keys = [key async for key in redis_client.scan_iter(match=pattern, count=1000)]
         if keys:
-            redis_client.delete(*keys)
+            await redis_client.delete(*keys)
             logger.info(f"Invalidated {len(keys)} cache keys: {pattern}")
     except Exception as e:
         logger.error(f"Cache invalidation error: {str(e)}")
 
 
+async def close_cache():
+    """Close the pooled Redis connections"""
+    await redis_client.aclose()
+
+
 def cached(ttl: int, key_prefix: str = ""):
     """
     Decorator to cache function results
-    
+
     Args:
         ttl: Time to live in seconds
         key_prefix: Prefix for cache key
@@ -60,7 +467,7 @@ def cached(ttl: int, key_prefix: str = ""):
         async def wrapper(*args, **kwargs):
             # Build cache key from function name and arguments
             cache_key = f"{key_prefix}:{func.__name__}"
-            
+
             # Add relevant kwargs to cache key
             if 'workspace_id' in kwargs:
                 cache_key += f":{kwargs['workspace_id']}"
@@ -68,18 +475,7 @@ def cached(ttl: int, key_prefix: str = ""):
                 cache_key += f":{kwargs['range']}"
             if 'limit' in kwargs:
                 cache_key += f":{kwargs['limit']}"
-            
-            # Try to get from cache
-            cached_value = get_cache(cache_key)
-            if cached_value is not None:
-                return cached_value
-            
-            # Execute function
-            result = await func(*args, **kwargs)
-            
-            # Store in cache
-            set_cache(cache_key, result, ttl)
-            
-            return result
+
+            return await get_or_compute(cache_key, lambda: func(*args, **kwargs), ttl)
         return wrapper
     return decorator
@@ -20,6 +20,26 @@ class Settings(BaseSettings):
     cache_ttl_alerts: int = 60  # 1 minute
     cache_ttl_activity: int = 30  # 30 seconds
     cache_ttl_traces: int = 120  # 2 minutes
+    cache_max_connections: int = 50  # Redis connection pool size per worker
+    cache_timeout_s: float = 1.0  # Redis socket timeout; a slow cache counts as a miss
+
+    # In-process LRU tier in front of Redis (per worker)
+    cache_local_max_bytes: int = 64 * 1024 * 1024  # Serialized size of the values kept
+    cache_local_ttl_s: int = 30  # Longest a worker serves a value invalidated elsewhere
+    cache_local_ttls: dict[str, int] = {}  # Per key family (prefix), e.g. {"cost_": 60, "trace:": 0}; 0 skips the tier
+
+    # Single-flight: concurrent misses of a key wait for the first request's result
+    cache_coalesce_timeout_s: float = 30.0  # Longest a request waits for another to compute
+    cache_cluster_lock: bool = False  # Coalesce across workers too, with a Redis lock per key
+
+    # Stale-while-revalidate: entries outlive their TTL by this much, served stale while one request refreshes them
+    cache_stale_ttl_s: int = 300
+
+    # Refresh-ahead of hot get_or_compute keys, before their TTL runs out
+    cache_hot_min_hits: int = 5  # Hits within cache_hot_window_s that make a key hot
+    cache_hot_window_s: int = 60
+    cache_refresh_ahead_s: int = 30  # Hot keys are refreshed when less than this is left of their TTL
+    cache_refresh_interval_s: float = 5.0
 
     # Query limits
     max_page_size: int = 100
@@ -1,9 +1,11 @@
 """Query Service - Main FastAPI Application"""
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import logging
 from .config import get_settings
 from .database import db_manager
+from .cache import close_cache, refresh_hot_keys
 from .routes import home, alerts, activity, traces, usage, cost, performance, filters, analytics, quality, actions, impact
 
 # Configure logging
@@ -58,13 +60,17 @@ async def startup():
     except Exception as e:
         logger.error(f"Failed to connect to databases: {str(e)}")
         raise
+    # Refresh-ahead of hot cached dashboard keys
+    app.state.cache_refresher = asyncio.create_task(refresh_hot_keys())
 
 
 @app.on_event("shutdown")
 async def shutdown():
     """Close database connections on shutdown"""
     logger.info("Shutting down Query Service...")
+    app.state.cache_refresher.cancel()
     await db_manager.close()
+    await close_cache()
     logger.info("Database connections closed")
 
 
@@ -93,33 +93,29 @@ async def get_home_kpis(
 
     filter_clause, filter_params = build_filter_clause()
 
-    # Query traces metrics from TimescaleDB
-    traces_query = f"""
-    WITH current_period AS (
+    def period_totals(window: str) -> str:
+        """Totals of one period from the per-minute rollup (stored and sampled-out traces)"""
+        return f"""
         SELECT
-            COUNT(DISTINCT id) as total_requests,
-            AVG(latency_ms) as avg_latency,
-            SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END)::float /
-                NULLIF(COUNT(DISTINCT id), 0) * 100 as error_rate,
-            SUM(COALESCE(cost_usd, 0)) as total_cost
-        FROM traces
+            SUM(request_count) as total_requests,
+            SUM(latency_sum_ms)::float / NULLIF(SUM(request_count), 0) as avg_latency,
+            SUM(request_count) FILTER (WHERE status = 'error')::float /
+                NULLIF(SUM(request_count), 0) * 100 as error_rate,
+            SUM(cost_usd_sum) as total_cost
+        FROM traces_minutely
         WHERE workspace_id = $1
-          AND timestamp >= NOW() - INTERVAL '1 hour' * $2
+          {window}
           {filter_clause}
-    ),
-    previous_period AS (
-        SELECT
-            COUNT(DISTINCT id) as total_requests,
-            AVG(latency_ms) as avg_latency,
-            SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END)::float /
-                NULLIF(COUNT(DISTINCT id), 0) * 100 as error_rate,
-            SUM(COALESCE(cost_usd, 0)) as total_cost
-        FROM traces
-        WHERE workspace_id = $1
-          AND timestamp >= NOW() - INTERVAL '1 hour' * ($2 * 2)
-          AND timestamp < NOW() - INTERVAL '1 hour' * $2
-          {filter_clause}
-    )
+        """
+
+    # Query traces metrics from the per-minute rollup
+    traces_query = f"""
+    WITH current_period AS ({period_totals(
+        "AND bucket >= NOW() - INTERVAL '1 hour' * $2"
+    )}),
+    previous_period AS ({period_totals(
+        "AND bucket >= NOW() - INTERVAL '1 hour' * ($2 * 2) AND bucket < NOW() - INTERVAL '1 hour' * $2"
+    )})
     SELECT
         COALESCE(c.total_requests, 0) as curr_requests,
         COALESCE(p.total_requests, 0) as prev_requests,
@@ -364,6 +360,10 @@ async def get_trace_detail(
 ) -> Optional[Dict[str, Any]]:
     """
     Get full trace details including input/output.
+
+    Offloaded bodies (traces carrying input_hash/output_hash keep only a
+    preview inline) are resolved from trace_payloads here, so only the
+    detail view pays for reading them.
     """
     query = """
     SELECT
@@ -383,7 +383,9 @@ async def get_trace_detail(
         input,
         output,
         error,
-        metadata
+        metadata,
+        input_hash,
+        output_hash
     FROM traces
     WHERE trace_id = $1 AND workspace_id = $2
     """
@@ -391,7 +393,26 @@ async def get_trace_detail(
     try:
         async with pool.acquire() as conn:
             row = await conn.fetchrow(query, trace_id, workspace_id)
-            return dict(row) if row else None
+            if not row:
+                return None
+
+            trace = dict(row)
+            hashes = {
+                field: trace.pop(f"{field}_hash") for field in ('input', 'output')
+            }
+            wanted = [h for h in hashes.values() if h]
+            if wanted:
+                bodies = {
+                    r['content_hash']: r['body']
+                    for r in await conn.fetch(
+                        "SELECT content_hash, body FROM trace_payloads WHERE content_hash = ANY($1)",
+                        wanted
+                    )
+                }
+                for field, content_hash in hashes.items():
+                    if content_hash in bodies:
+                        trace[field] = bodies[content_hash]
+            return trace
     except Exception as e:
         logger.error(f"Error fetching trace detail: {str(e)}")
         raise
@@ -35,7 +35,7 @@ async def get_activity_stream_endpoint(
 
     # Try cache first
     cache_key = f"activity:stream:{x_workspace_id}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -50,7 +50,7 @@ async def get_activity_stream_endpoint(
 
         # Cache result
         try:
-            set_cache(cache_key, result, settings.cache_ttl_activity)
+            await set_cache(cache_key, result, settings.cache_ttl_activity)
         except Exception:
             pass
 
@@ -45,7 +45,7 @@ async def get_recent_alerts_endpoint(
 
     # Try cache first
     cache_key = f"alerts:recent:{x_workspace_id}:{limit}:{severity or 'all'}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -60,7 +60,7 @@ async def get_recent_alerts_endpoint(
 
         # Cache result
         try:
-            set_cache(cache_key, result, settings.cache_ttl_alerts)
+            await set_cache(cache_key, result, settings.cache_ttl_alerts)
         except Exception:
             pass
 
@@ -6,6 +6,7 @@ import asyncpg
 from ..database import get_timescale_pool
 from ..cache import get_cache, set_cache
 from ..queries import parse_time_range
+from ..sketch import LatencySketch, merged_sketches_sql
 from ..config import get_settings
 
 router = APIRouter(prefix="/api/v1/analytics", tags=["analytics"])
@@ -84,12 +85,12 @@ async def get_latency_trends(
         filter_parts.append(f"ver:{version}")
 
     cache_key = f"latency_trends:{x_workspace_id}:{':'.join(filter_parts)}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
-    # Build WHERE clause
-    where_clauses = ["workspace_id = $1", "timestamp >= NOW() - INTERVAL '1 hour' * $2"]
+    # Build WHERE clause (over the per-minute rollup)
+    where_clauses = ["workspace_id = $1", "bucket >= NOW() - INTERVAL '1 hour' * $2"]
     params = [x_workspace_id, range_hours]
     param_idx = 3
 
@@ -116,35 +117,38 @@ async def get_latency_trends(
 
     where_clause = " AND ".join(where_clauses)
 
+    # Percentiles come from the latency sketches merged per bucket
+    bucket_expr = f"time_bucket(INTERVAL '{granularity_map[granularity]}', bucket)"
     query = f"""
-    SELECT
-        time_bucket(INTERVAL '{granularity_map[granularity]}', timestamp) AS bucket,
-        percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) AS p50_latency_ms,
-        percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) AS p95_latency_ms,
-        percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) AS p99_latency_ms,
-        AVG(latency_ms) AS avg_latency_ms,
-        COUNT(*) AS request_count
-    FROM traces
-    WHERE {where_clause}
-    GROUP BY bucket
-    ORDER BY bucket ASC
+    SELECT t.bucket, t.avg_latency_ms, t.request_count, s.latency_sketch
+    FROM (
+        SELECT
+            {bucket_expr} AS bucket,
+            SUM(latency_sum_ms)::float / NULLIF(SUM(request_count), 0) AS avg_latency_ms,
+            SUM(request_count)::bigint AS request_count
+        FROM traces_minutely
+        WHERE {where_clause}
+        GROUP BY 1
+    ) t
+    LEFT JOIN ({merged_sketches_sql({'bucket': bucket_expr}, where_clause)}) s USING (bucket)
+    ORDER BY t.bucket ASC
     """
 
     try:
         async with timescale_pool.acquire() as conn:
             rows = await conn.fetch(query, *params)
 
-            data_points = [
-                {
+            data_points = []
+            for row in rows:
+                sketch = LatencySketch.from_json(row['latency_sketch'])
+                data_points.append({
                     "timestamp": row['bucket'].isoformat(),
-                    "p50_latency_ms": float(row['p50_latency_ms']),
-                    "p95_latency_ms": float(row['p95_latency_ms']),
-                    "p99_latency_ms": float(row['p99_latency_ms']),
-                    "avg_latency_ms": float(row['avg_latency_ms']),
+                    "p50_latency_ms": sketch.quantile(0.5) or 0.0,
+                    "p95_latency_ms": sketch.quantile(0.95) or 0.0,
+                    "p99_latency_ms": sketch.quantile(0.99) or 0.0,
+                    "avg_latency_ms": float(row['avg_latency_ms'] or 0),
                     "request_count": int(row['request_count'])
-                }
-                for row in rows
-            ]
+                })
 
             result = {
                 "data": data_points,
@@ -161,7 +165,7 @@ async def get_latency_trends(
             }
 
             # Cache for 5 minutes
-            set_cache(cache_key, result, ttl=300)
+            await set_cache(cache_key, result, ttl=300)
 
             return result
 
@@ -235,7 +239,7 @@ async def get_cost_breakdown(
         filter_parts.append(f"ver:{version}")
 
     cache_key = f"cost_breakdown:{x_workspace_id}:{':'.join(filter_parts)}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -343,7 +347,7 @@ async def get_cost_breakdown(
             }
 
             # Cache for 5 minutes
-            set_cache(cache_key, result, ttl=300)
+            await set_cache(cache_key, result, ttl=300)
 
             return result
 
@@ -415,7 +419,7 @@ async def get_error_analysis(
         filter_parts.append(f"ver:{version}")
 
     cache_key = f"error_analysis:{x_workspace_id}:{':'.join(filter_parts)}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -522,7 +526,7 @@ async def get_error_analysis(
             }
 
             # Cache for 5 minutes
-            set_cache(cache_key, result, ttl=300)
+            await set_cache(cache_key, result, ttl=300)
 
             return result
 
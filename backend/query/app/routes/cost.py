@@ -10,8 +10,9 @@ from ..models import (
     Budget, BudgetUpdate
 )
 from ..database import get_timescale_pool, get_postgres_pool
-from ..cache import get_cache, set_cache
+from ..cache import get_cache, get_or_compute, set_cache
 from ..config import get_settings
+from ..sketch import LatencySketch, merged_sketches_sql
 import logging
 from uuid import UUID
 
@@ -55,12 +56,9 @@ async def get_cost_overview(
     and projected monthly spend based on current usage.
     """
     cache_key = f"cost_overview:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
-    if cached:
-        logger.info(f"Cache hit for {cache_key}")
-        return CostOverview(**cached)
-    
-    try:
+
+    # Served stale past the TTL while one background refresh runs
+    async def compute():
         workspace_uuid = UUID(x_workspace_id)
         hours = parse_time_range(range)
 
@@ -147,12 +145,13 @@ async def get_cost_overview(
             projected_monthly_spend_usd=round(projected_monthly, 2),
             change_from_previous=change_from_previous
         )
-        
-        # Cache for 5 minutes
-        set_cache(cache_key, result.model_dump(), ttl=300)
         logger.info(f"Cost overview fetched for workspace {x_workspace_id}, range {range}")
 
-        return result
+        return result.model_dump()
+
+    try:
+        # Cache for 5 minutes
+        return CostOverview(**await get_or_compute(cache_key, compute, ttl=300))
 
     except ValueError as e:
         raise HTTPException(
@@ -182,7 +181,7 @@ async def get_cost_trend(
     Useful for visualizing cost trends in stacked area charts.
     """
     cache_key = f"cost_trend:{x_workspace_id}:{range}:{granularity}:{model or 'all'}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return CostTrend(**cached)
@@ -235,7 +234,7 @@ async def get_cost_trend(
         )
         
         # Cache for 2 minutes
-        set_cache(cache_key, result.model_dump(), ttl=120)
+        await set_cache(cache_key, result.model_dump(), ttl=120)
         logger.info(f"Cost trend fetched: {len(data)} buckets")
 
         return result
@@ -266,7 +265,7 @@ async def get_cost_by_model(
     Useful for identifying most expensive models.
     """
     cache_key = f"cost_by_model:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return CostByModel(**cached)
@@ -327,7 +326,7 @@ async def get_cost_by_model(
         )
         
         # Cache for 5 minutes
-        set_cache(cache_key, result.model_dump(), ttl=300)
+        await set_cache(cache_key, result.model_dump(), ttl=300)
         logger.info(f"Cost by model fetched: {len(data)} models")
 
         return result
@@ -357,7 +356,7 @@ async def get_budget(
     Returns budget limit, alert threshold, and current month's spend.
     """
     cache_key = f"budget:{x_workspace_id}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return Budget(**cached)
@@ -413,7 +412,7 @@ async def get_budget(
             )
         
         # Cache for 1 minute (budget changes should be reflected quickly)
-        set_cache(cache_key, result.model_dump(), ttl=60)
+        await set_cache(cache_key, result.model_dump(), ttl=60)
         logger.info(f"Budget fetched for workspace {x_workspace_id}")
         
         return result
@@ -521,7 +520,7 @@ async def update_budget(
 
         # Invalidate cache
         cache_key = f"budget:{x_workspace_id}"
-        set_cache(cache_key, None, ttl=0)  # Delete cache
+        await set_cache(cache_key, None, ttl=0)  # Delete cache
 
         logger.info(f"Budget updated for workspace {x_workspace_id}")
 
@@ -553,7 +552,7 @@ async def get_cost_by_department(
     This serves as a department proxy until Phase 1 schema is implemented.
     """
     cache_key = f"cost_by_department:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -650,7 +649,7 @@ async def get_cost_by_department(
         }
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Cost by department fetched: {len(data)} providers")
 
         return result
@@ -686,7 +685,7 @@ async def get_provider_comparison(
     - Cost per successful request
     """
     cache_key = f"cost_provider_comparison:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -695,24 +694,28 @@ async def get_provider_comparison(
         workspace_uuid = UUID(x_workspace_id)
         hours = parse_time_range(range)
 
-        query = """
-            SELECT
-                model_provider,
-                COALESCE(SUM(cost_usd), 0) as total_cost,
-                COUNT(*)::int as request_count,
-                COUNT(*) FILTER (WHERE status = 'success')::int as success_count,
-                COUNT(*) FILTER (WHERE status = 'error')::int as error_count,
-                percentile_cont(0.50) WITHIN GROUP (ORDER BY latency_ms) as p50_latency,
-                percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) as p95_latency,
-                percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) as p99_latency,
-                AVG(latency_ms) as avg_latency
-            FROM traces
-            WHERE workspace_id = $1
-                AND timestamp >= NOW() - INTERVAL '1 hour' * $2
-                AND cost_usd IS NOT NULL
-                AND model_provider IS NOT NULL
-            GROUP BY model_provider
-            ORDER BY total_cost DESC
+        # Read from the per-minute rollup; percentiles come from its latency sketches
+        window = """
+            workspace_id = $1
+                AND bucket >= NOW() - INTERVAL '1 hour' * $2
+                AND model_provider <> ''
+        """
+        query = f"""
+            SELECT t.*, s.latency_sketch
+            FROM (
+                SELECT
+                    model_provider,
+                    COALESCE(SUM(cost_usd_sum), 0) as total_cost,
+                    SUM(request_count)::int as request_count,
+                    COALESCE(SUM(request_count) FILTER (WHERE status = 'success'), 0)::int as success_count,
+                    COALESCE(SUM(request_count) FILTER (WHERE status = 'error'), 0)::int as error_count,
+                    SUM(latency_sum_ms)::float / NULLIF(SUM(request_count), 0) as avg_latency
+                FROM traces_minutely
+                WHERE {window}
+                GROUP BY model_provider
+            ) t
+            LEFT JOIN ({merged_sketches_sql({'model_provider': 'model_provider'}, window)}) s USING (model_provider)
+            ORDER BY t.total_cost DESC
         """
 
         rows = await pool.fetch(query, workspace_uuid, hours)
@@ -723,6 +726,7 @@ async def get_provider_comparison(
             request_count = row['request_count']
             success_count = row['success_count']
             error_count = row['error_count']
+            latency = LatencySketch.from_json(row['latency_sketch']).percentiles(50, 95, 99)
 
             error_rate = (error_count / max(request_count, 1)) * 100
             cost_per_request = total_cost / max(request_count, 1)
@@ -735,9 +739,9 @@ async def get_provider_comparison(
                 'success_count': success_count,
                 'error_count': error_count,
                 'error_rate': round(error_rate, 2),
-                'p50_latency_ms': round(float(row['p50_latency'] or 0), 2),
-                'p95_latency_ms': round(float(row['p95_latency'] or 0), 2),
-                'p99_latency_ms': round(float(row['p99_latency'] or 0), 2),
+                'p50_latency_ms': latency['p50'],
+                'p95_latency_ms': latency['p95'],
+                'p99_latency_ms': latency['p99'],
                 'avg_latency_ms': round(float(row['avg_latency'] or 0), 2),
                 'cost_per_request_usd': round(cost_per_request, 6),
                 'cost_per_success_usd': round(cost_per_success, 6)
@@ -754,7 +758,7 @@ async def get_provider_comparison(
         }
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Provider comparison fetched: {len(data)} providers")
 
         return result
@@ -784,7 +788,7 @@ async def get_department_budgets(
     Includes traffic light status (green/yellow/red) based on consumption.
     """
     cache_key = f"department_budgets:{x_workspace_id}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -859,7 +863,7 @@ async def get_department_budgets(
         }
 
         # Cache for 1 minute
-        set_cache(cache_key, result, ttl=60)
+        await set_cache(cache_key, result, ttl=60)
         logger.info(f"Department budgets fetched: {len(data)} budgets")
 
         return result
@@ -887,7 +891,7 @@ async def get_top_agents(
     Includes agent ID, total cost, request count, cost per request.
     """
     cache_key = f"top_agents:{x_workspace_id}:{range}:{limit}:{sort_by}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -965,7 +969,7 @@ async def get_top_agents(
         }
 
         # Cache for 3 minutes
-        set_cache(cache_key, result, ttl=180)
+        await set_cache(cache_key, result, ttl=180)
         logger.info(f"Top agents fetched: {len(data)} agents")
 
         return result
@@ -998,7 +1002,7 @@ async def get_optimization_opportunities(
     Includes implementation effort, risk assessment, and projected savings.
     """
     cache_key = f"optimization_opportunities:{x_workspace_id}:{status_filter}:{sort_by}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -1103,7 +1107,7 @@ async def get_optimization_opportunities(
         result['meta']['opportunities_by_type'] = dict(type_counts)
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Optimization opportunities fetched: {len(data)} opportunities")
 
         return result
@@ -1134,7 +1138,7 @@ async def get_cost_attribution(
     PRD Tab 3: Chart 3.1 - Cost Attribution Sunburst (P0)
     """
     cache_key = f"cost_attribution:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
     
@@ -1235,7 +1239,7 @@ async def get_cost_attribution(
             } if top_contributor else None
         }
         
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         return result
         
     except Exception as e:
@@ -1260,7 +1264,7 @@ async def get_token_waterfall(
     PRD Tab 3: Chart 3.2 - Token Usage Waterfall (P1)
     """
     cache_key = f"token_waterfall:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
     
@@ -1321,7 +1325,7 @@ async def get_token_waterfall(
             'savings_from_cache': savings
         }
         
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         return result
         
     except Exception as e:
@@ -1346,7 +1350,7 @@ async def get_cost_forecast(
     PRD Tab 3: Chart 3.3 - Cost Forecast Chart (P1)
     """
     cache_key = f"cost_forecast:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
     
@@ -1439,7 +1443,7 @@ async def get_cost_forecast(
             'confidence_level': min(95, max(50, 100 - (len(rows) * 2)))  # Higher confidence with more data
         }
         
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         return result
         
     except Exception as e:
@@ -1464,7 +1468,7 @@ async def get_provider_matrix(
     PRD Tab 3: Chart 3.4 - Provider Cost/Performance Matrix (P1)
     """
     cache_key = f"provider_matrix:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
     
@@ -1532,7 +1536,7 @@ async def get_provider_matrix(
             'best_value_provider': best_value['provider'] if best_value else None
         }
         
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         return result
         
     except Exception as e:
@@ -1557,7 +1561,7 @@ async def get_caching_roi(
     PRD Tab 3: Chart 3.5 - Caching ROI Calculator (P1)
     """
     cache_key = f"caching_roi:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
     
@@ -1608,7 +1612,7 @@ async def get_caching_roi(
             'avg_response_time_uncached_ms': avg_uncached_ms
         }
         
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         return result
         
     except Exception as e:
@@ -1633,7 +1637,7 @@ async def get_cost_anomalies(
     PRD Tab 3: Chart 3.6 - Cost Anomaly Timeline (P1)
     """
     cache_key = f"cost_anomalies:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
     
@@ -1708,7 +1712,7 @@ async def get_cost_anomalies(
             'critical_anomalies': sum(1 for a in anomalies if a['severity'] == 'critical')
         }
 
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         return result
 
     except Exception as e:
@@ -1741,7 +1745,7 @@ async def get_agent_cost_overview(
     """
     try:
         cache_key = f"agent_cost_overview:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -1800,7 +1804,7 @@ async def get_agent_cost_overview(
                 )
 
             result = dict(row)
-            set_cache(cache_key, result, ttl=60)
+            await set_cache(cache_key, result, ttl=60)
             return result
 
     except HTTPException:
@@ -1829,7 +1833,7 @@ async def get_agent_cost_trend(
     """
     try:
         cache_key = f"agent_cost_trend:{x_workspace_id}:{agent_id}:{range}:{granularity}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -1854,7 +1858,7 @@ async def get_agent_cost_trend(
             rows = await conn.fetch(query, x_workspace_id, agent_id, hours)
 
             result = {'data': [dict(row) for row in rows]}
-            set_cache(cache_key, result, ttl=60)
+            await set_cache(cache_key, result, ttl=60)
             return result
 
     except Exception as e:
@@ -1882,7 +1886,7 @@ async def get_agent_model_breakdown(
     """
     try:
         cache_key = f"agent_model_breakdown:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -1915,7 +1919,7 @@ async def get_agent_model_breakdown(
             rows = await conn.fetch(query, x_workspace_id, agent_id, hours)
 
             result = {'data': [dict(row) for row in rows]}
-            set_cache(cache_key, result, ttl=60)
+            await set_cache(cache_key, result, ttl=60)
             return result
 
     except Exception as e:
@@ -1944,7 +1948,7 @@ async def get_agent_cost_comparison(
     """
     try:
         cache_key = f"agent_cost_comparison:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -2029,7 +2033,7 @@ async def get_agent_cost_comparison(
                 'percentile_rank': float(percentile)
             }
 
-            set_cache(cache_key, result, ttl=60)
+            await set_cache(cache_key, result, ttl=60)
             return result
 
     except HTTPException:
@@ -2059,7 +2063,7 @@ async def get_agent_token_efficiency(
     """
     try:
         cache_key = f"agent_token_efficiency:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -2120,7 +2124,7 @@ async def get_agent_token_efficiency(
                 'trend_data': [dict(r) for r in trend_rows]
             }
 
-            set_cache(cache_key, result, ttl=60)
+            await set_cache(cache_key, result, ttl=60)
             return result
 
     except HTTPException:
@@ -2150,7 +2154,7 @@ async def get_agent_cost_by_department(
     """
     try:
         cache_key = f"agent_cost_by_department:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -2182,7 +2186,7 @@ async def get_agent_cost_by_department(
             rows = await conn.fetch(query, x_workspace_id, agent_id, hours)
 
             result = {'data': [dict(row) for row in rows]}
-            set_cache(cache_key, result, ttl=60)
+            await set_cache(cache_key, result, ttl=60)
             return result
 
     except Exception as e:
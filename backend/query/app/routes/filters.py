@@ -38,7 +38,7 @@ async def get_available_departments(
     Useful for populating filter dropdowns.
     """
     cache_key = f"filters:departments:{x_workspace_id}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return FilterOptionsResponse(**cached)
 
@@ -80,7 +80,7 @@ async def get_available_departments(
             )
 
             # Cache for 5 minutes (warm data)
-            set_cache(cache_key, result.model_dump(), ttl=300)
+            await set_cache(cache_key, result.model_dump(), ttl=300)
 
             return result
 
@@ -107,7 +107,7 @@ async def get_available_environments(
     Returns list of environments (production, staging, development) with counts.
     """
     cache_key = f"filters:environments:{x_workspace_id}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return FilterOptionsResponse(**cached)
 
@@ -152,7 +152,7 @@ async def get_available_environments(
             )
 
             # Cache for 5 minutes
-            set_cache(cache_key, result.model_dump(), ttl=300)
+            await set_cache(cache_key, result.model_dump(), ttl=300)
 
             return result
 
@@ -194,7 +194,7 @@ async def get_available_versions(
         cache_parts.append(f"env:{environment}")
 
     cache_key = f"filters:versions:{':'.join(cache_parts)}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return FilterOptionsResponse(**cached)
 
@@ -267,7 +267,7 @@ async def get_available_versions(
             )
 
             # Cache for 5 minutes
-            set_cache(cache_key, result.model_dump(), ttl=300)
+            await set_cache(cache_key, result.model_dump(), ttl=300)
 
             return result
 
@@ -308,7 +308,7 @@ async def get_available_agents(
         cache_parts.append(f"ver:{version}")
 
     cache_key = f"filters:agents:{':'.join(cache_parts)}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return FilterOptionsResponse(**cached)
 
@@ -388,7 +388,7 @@ async def get_available_agents(
             )
 
             # Cache for 5 minutes
-            set_cache(cache_key, result.model_dump(), ttl=300)
+            await set_cache(cache_key, result.model_dump(), ttl=300)
 
             return result
 
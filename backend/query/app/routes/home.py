@@ -5,7 +5,7 @@ import asyncpg
 from ..models import HomeKPIs, KPIMetric
 from ..database import get_timescale_pool, get_postgres_pool
 from ..queries import get_home_kpis, parse_time_range
-from ..cache import get_cache, set_cache
+from ..cache import get_cache, get_or_compute, set_cache
 from ..config import get_settings
 
 router = APIRouter(prefix="/api/v1/metrics", tags=["metrics"])
@@ -56,12 +56,8 @@ async def get_home_dashboard_kpis(
         filter_parts.append(f"agent:{agent_id}")
 
     cache_key = f"home_kpis:{x_workspace_id}:{':'.join(filter_parts)}"
-    cached = get_cache(cache_key)
-    if cached:
-        return HomeKPIs(**cached)
-
-    # Query database
-    try:
+    # Query database (served stale past the TTL while one background refresh runs)
+    async def compute():
         kpi_data = await get_home_kpis(
             timescale_pool,
             postgres_pool,
@@ -122,14 +118,10 @@ async def get_home_dashboard_kpis(
             )
         )
 
-        # Cache result
-        try:
-            set_cache(cache_key, result.model_dump(), settings.cache_ttl_home_kpis)
-        except Exception as cache_error:
-            # Log but don't fail request on cache errors
-            pass
+        return result.model_dump()
 
-        return result
+    try:
+        return HomeKPIs(**await get_or_compute(cache_key, compute, settings.cache_ttl_home_kpis))
 
     except Exception as e:
         raise HTTPException(
@@ -178,7 +170,7 @@ async def get_department_breakdown(
         filter_parts.append(f"ver:{version}")
 
     cache_key = f"dept_breakdown:{x_workspace_id}:{':'.join(filter_parts)}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -250,7 +242,7 @@ async def get_department_breakdown(
             }
 
             # Cache for 5 minutes
-            set_cache(cache_key, result, ttl=300)
+            await set_cache(cache_key, result, ttl=300)
 
             return result
 
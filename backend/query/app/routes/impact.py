@@ -47,7 +47,7 @@ async def get_impact_overview(
     """
     try:
         cache_key = f"impact_overview:{x_workspace_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -143,7 +143,7 @@ async def get_impact_overview(
                 'period_end': datetime.utcnow().isoformat()
             }
 
-            set_cache(cache_key, result, ttl=1800)  # 30 min TTL
+            await set_cache(cache_key, result, ttl=1800)  # 30 min TTL
             return result
 
     except Exception as e:
@@ -174,7 +174,7 @@ async def get_business_goals(
     """
     try:
         cache_key = f"business_goals:{x_workspace_id}:{status_filter}:{department_id}:{goal_type}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -274,7 +274,7 @@ async def get_business_goals(
                 }
             }
 
-            set_cache(cache_key, result, ttl=600)  # 10 min TTL
+            await set_cache(cache_key, result, ttl=600)  # 10 min TTL
             return result
 
     except Exception as e:
@@ -367,7 +367,7 @@ async def get_impact_attribution(
     """
     try:
         cache_key = f"impact_attribution:{x_workspace_id}:{range}:{limit}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -418,7 +418,7 @@ async def get_impact_attribution(
                 'period_start': period_start.isoformat()
             }
 
-            set_cache(cache_key, result, ttl=1800)  # 30 min TTL
+            await set_cache(cache_key, result, ttl=1800)  # 30 min TTL
             return result
 
     except Exception as e:
@@ -449,7 +449,7 @@ async def get_customer_impact_timeline(
     """
     try:
         cache_key = f"customer_timeline:{x_workspace_id}:{range}:{agent_id}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -514,7 +514,7 @@ async def get_customer_impact_timeline(
                 'agent_id': agent_id
             }
 
-            set_cache(cache_key, result, ttl=900)  # 15 min TTL
+            await set_cache(cache_key, result, ttl=900)  # 15 min TTL
             return result
 
     except Exception as e:
@@ -543,7 +543,7 @@ async def get_savings_waterfall(
     """
     try:
         cache_key = f"savings_waterfall:{x_workspace_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -645,7 +645,7 @@ async def get_savings_waterfall(
                 'period': range
             }
 
-            set_cache(cache_key, result, ttl=1800)  # 30 min TTL
+            await set_cache(cache_key, result, ttl=1800)  # 30 min TTL
             return result
 
     except Exception as e:
@@ -674,7 +674,7 @@ async def get_productivity_gains(
     """
     try:
         cache_key = f"productivity:{x_workspace_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -737,7 +737,7 @@ async def get_productivity_gains(
                 'period_days': round(days_in_period, 1)
             }
 
-            set_cache(cache_key, result, ttl=900)  # 15 min TTL
+            await set_cache(cache_key, result, ttl=900)  # 15 min TTL
             return result
 
     except Exception as e:
@@ -768,7 +768,7 @@ async def get_agent_business_value(
     """
     try:
         cache_key = f"agent_value:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -844,7 +844,7 @@ async def get_agent_business_value(
                 'period': range
             }
 
-            set_cache(cache_key, result, ttl=600)  # 10 min TTL
+            await set_cache(cache_key, result, ttl=600)  # 10 min TTL
             return result
 
     except Exception as e:
@@ -933,7 +933,7 @@ async def get_agent_customer_impact(
     """
     try:
         cache_key = f"agent_customer:{x_workspace_id}:{agent_id}:{range}"
-        cached = get_cache(cache_key)
+        cached = await get_cache(cache_key)
         if cached:
             return cached
 
@@ -994,7 +994,7 @@ async def get_agent_customer_impact(
                 'period': range
             }
 
-            set_cache(cache_key, result, ttl=600)  # 10 min TTL
+            await set_cache(cache_key, result, ttl=600)  # 10 min TTL
             return result
 
     except Exception as e:
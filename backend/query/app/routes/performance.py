@@ -13,6 +13,7 @@ from ..models import (
 from ..database import get_timescale_pool
 from ..cache import get_cache, set_cache
 from ..config import get_settings
+from ..sketch import LatencySketch, merged_sketches_sql
 import logging
 
 logger = logging.getLogger(__name__)
@@ -65,7 +66,7 @@ async def get_performance_overview(
     and requests per second for the specified time range.
     """
     cache_key = f"performance_overview:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return PerformanceOverview(**cached)
@@ -114,7 +115,7 @@ async def get_performance_overview(
         )
         
         # Cache for 5 minutes
-        set_cache(cache_key, response.model_dump(), ttl=300)
+        await set_cache(cache_key, response.model_dump(), ttl=300)
         logger.info(f"Performance overview fetched for workspace {x_workspace_id}, range {range}")
         
         return response
@@ -142,7 +143,7 @@ async def get_latency_percentiles(
     Useful for multi-line charts showing latency trends.
     """
     cache_key = f"performance_latency:{x_workspace_id}:{range}:{granularity}:{agent_id or 'all'}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return LatencyPercentiles(**cached)
@@ -191,7 +192,7 @@ async def get_latency_percentiles(
         )
         
         # Cache for 2 minutes
-        set_cache(cache_key, result.model_dump(), ttl=120)
+        await set_cache(cache_key, result.model_dump(), ttl=120)
         logger.info(f"Latency percentiles fetched: {len(data)} buckets")
         
         return result
@@ -219,7 +220,7 @@ async def get_throughput(
     for each time bucket. Useful for stacked area charts.
     """
     cache_key = f"performance_throughput:{x_workspace_id}:{range}:{granularity}:{agent_id or 'all'}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return Throughput(**cached)
@@ -277,7 +278,7 @@ async def get_throughput(
         )
         
         # Cache for 2 minutes
-        set_cache(cache_key, result.model_dump(), ttl=120)
+        await set_cache(cache_key, result.model_dump(), ttl=120)
         logger.info(f"Throughput fetched: {len(data)} buckets")
         
         return result
@@ -305,7 +306,7 @@ async def get_error_analysis(
     counts, and sample error messages. Useful for debugging and monitoring.
     """
     cache_key = f"performance_errors:{x_workspace_id}:{range}:{agent_id or 'all'}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return ErrorAnalysis(**cached)
@@ -398,7 +399,7 @@ async def get_error_analysis(
         )
 
         # Cache for 2 minutes
-        set_cache(cache_key, result.model_dump(), ttl=120)
+        await set_cache(cache_key, result.model_dump(), ttl=120)
         logger.info(f"Error analysis fetched: {len(data)} error types")
 
         return result
@@ -425,7 +426,7 @@ async def get_environment_parity(
     Includes latency percentiles, error rates, request counts, and parity scores.
     """
     cache_key = f"environment_parity:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -519,7 +520,7 @@ async def get_environment_parity(
         }
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Environment parity fetched: {len(data)} environments")
 
         return result
@@ -546,7 +547,7 @@ async def get_version_comparison(
     Includes latency percentiles, error rates, request counts, and trend indicators.
     """
     cache_key = f"version_comparison:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -659,7 +660,7 @@ async def get_version_comparison(
         }
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Version comparison fetched: {len(data)} versions")
 
         return result
@@ -688,7 +689,7 @@ async def get_slo_compliance(
     with color-coded status (green >99%, yellow 95-99%, red <95%)
     """
     cache_key = f"performance_slo_compliance:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -696,20 +697,18 @@ async def get_slo_compliance(
     try:
         hours = parse_time_range(range)
         
-        query = """
+        # Latency percentiles come from the rollup's latency sketches, merged per agent
+        window = "workspace_id = $1 AND bucket >= NOW() - INTERVAL '1 hour' * $2"
+        query = f"""
             WITH agent_metrics AS (
                 SELECT
-                    t.agent_id,
-                    percentile_cont(0.50) WITHIN GROUP (ORDER BY t.latency_ms) as actual_p50,
-                    percentile_cont(0.90) WITHIN GROUP (ORDER BY t.latency_ms) as actual_p90,
-                    percentile_cont(0.95) WITHIN GROUP (ORDER BY t.latency_ms) as actual_p95,
-                    percentile_cont(0.99) WITHIN GROUP (ORDER BY t.latency_ms) as actual_p99,
-                    (COUNT(*) FILTER (WHERE t.status = 'error')::DECIMAL / NULLIF(COUNT(*), 0) * 100) as actual_error_rate,
-                    COUNT(*) as request_count
-                FROM traces t
-                WHERE t.workspace_id = $1 
-                    AND t.timestamp >= NOW() - INTERVAL '1 hour' * $2
-                GROUP BY t.agent_id
+                    agent_id,
+                    (COALESCE(SUM(request_count) FILTER (WHERE status = 'error'), 0)::DECIMAL
+                        / NULLIF(SUM(request_count), 0) * 100) as actual_error_rate,
+                    SUM(request_count)::bigint as request_count
+                FROM traces_minutely
+                WHERE {window}
+                GROUP BY agent_id
             )
             SELECT
                 am.agent_id,
@@ -718,19 +717,13 @@ async def get_slo_compliance(
                 sc.p95_latency_target_ms,
                 sc.p99_latency_target_ms,
                 sc.error_rate_target_pct,
-                am.actual_p50,
-                am.actual_p90,
-                am.actual_p95,
-                am.actual_p99,
                 am.actual_error_rate,
                 am.request_count,
-                (am.actual_p50 <= sc.p50_latency_target_ms) as p50_compliant,
-                (am.actual_p90 <= sc.p90_latency_target_ms) as p90_compliant,
-                (am.actual_p95 <= sc.p95_latency_target_ms) as p95_compliant,
-                (am.actual_p99 <= sc.p99_latency_target_ms) as p99_compliant,
+                s.latency_sketch,
                 (am.actual_error_rate <= sc.error_rate_target_pct) as error_rate_compliant
             FROM agent_metrics am
             LEFT JOIN slo_configs sc ON sc.agent_id = am.agent_id AND sc.workspace_id = $1 AND sc.is_active = true
+            LEFT JOIN ({merged_sketches_sql({'agent_id': 'agent_id'}, window)}) s ON s.agent_id = am.agent_id
             WHERE sc.id IS NOT NULL
             ORDER BY am.agent_id
         """
@@ -739,14 +732,14 @@ async def get_slo_compliance(
         
         data = []
         for row in rows:
+            actual = LatencySketch.from_json(row['latency_sketch']).percentiles(50, 90, 95, 99)
+            compliance = {
+                p: row[f'{p}_latency_target_ms'] is not None and actual[p] <= row[f'{p}_latency_target_ms']
+                for p in actual
+            }
+
             # Calculate overall compliance (percentage of SLOs met)
-            compliant_count = sum([
-                row['p50_compliant'],
-                row['p90_compliant'],
-                row['p95_compliant'],
-                row['p99_compliant'],
-                row['error_rate_compliant']
-            ])
+            compliant_count = sum(compliance.values()) + bool(row['error_rate_compliant'])
             overall_compliance_pct = (compliant_count / 5.0) * 100
             
             # Determine status
@@ -769,17 +762,17 @@ async def get_slo_compliance(
                     'error_rate_pct': float(row['error_rate_target_pct'])
                 },
                 'actual_metrics': {
-                    'p50_ms': round(float(row['actual_p50']), 2),
-                    'p90_ms': round(float(row['actual_p90']), 2),
-                    'p95_ms': round(float(row['actual_p95']), 2),
-                    'p99_ms': round(float(row['actual_p99']), 2),
+                    'p50_ms': actual['p50'],
+                    'p90_ms': actual['p90'],
+                    'p95_ms': actual['p95'],
+                    'p99_ms': actual['p99'],
                     'error_rate_pct': round(float(row['actual_error_rate'] or 0), 2)
                 },
                 'compliance': {
-                    'p50': row['p50_compliant'],
-                    'p90': row['p90_compliant'],
-                    'p95': row['p95_compliant'],
-                    'p99': row['p99_compliant'],
+                    'p50': compliance['p50'],
+                    'p90': compliance['p90'],
+                    'p95': compliance['p95'],
+                    'p99': compliance['p99'],
                     'error_rate': row['error_rate_compliant'],
                     'overall_pct': round(overall_compliance_pct, 2)
                 },
@@ -797,7 +790,7 @@ async def get_slo_compliance(
         }
         
         # Cache for 3 minutes
-        set_cache(cache_key, result, ttl=180)
+        await set_cache(cache_key, result, ttl=180)
         logger.info(f"SLO compliance fetched: {len(data)} agents")
         
         return result
@@ -824,7 +817,7 @@ async def get_latency_heatmap(
     and time buckets as columns. Color intensity indicates latency severity.
     """
     cache_key = f"performance_latency_heatmap:{x_workspace_id}:{range}:{granularity}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -833,20 +826,21 @@ async def get_latency_heatmap(
         hours = parse_time_range(range)
         interval = parse_granularity(granularity)
         
+        # Percentiles come from the rollup's latency sketches, merged per time bucket
+        window = "workspace_id = $1 AND bucket >= NOW() - INTERVAL '1 hour' * $2"
+        bucket_expr = f"time_bucket(INTERVAL '{interval}', bucket)"
         query = f"""
-            SELECT
-                time_bucket(INTERVAL '{interval}', timestamp) as bucket,
-                percentile_cont(0.50) WITHIN GROUP (ORDER BY latency_ms) as p50,
-                percentile_cont(0.75) WITHIN GROUP (ORDER BY latency_ms) as p75,
-                percentile_cont(0.90) WITHIN GROUP (ORDER BY latency_ms) as p90,
-                percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) as p95,
-                percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) as p99,
-                COUNT(*) as request_count
-            FROM traces
-            WHERE workspace_id = $1 
-                AND timestamp >= NOW() - INTERVAL '1 hour' * $2
-            GROUP BY bucket
-            ORDER BY bucket
+            SELECT t.bucket, t.request_count, s.latency_sketch
+            FROM (
+                SELECT
+                    {bucket_expr} as bucket,
+                    SUM(request_count)::bigint as request_count
+                FROM traces_minutely
+                WHERE {window}
+                GROUP BY 1
+            ) t
+            LEFT JOIN ({merged_sketches_sql({'bucket': bucket_expr}, window)}) s USING (bucket)
+            ORDER BY t.bucket
         """
         
         rows = await pool.fetch(query, x_workspace_id, hours)
@@ -855,13 +849,7 @@ async def get_latency_heatmap(
         for row in rows:
             data.append({
                 'timestamp': row['bucket'].isoformat(),
-                'percentiles': {
-                    'p50': round(float(row['p50']), 2),
-                    'p75': round(float(row['p75']), 2),
-                    'p90': round(float(row['p90']), 2),
-                    'p95': round(float(row['p95']), 2),
-                    'p99': round(float(row['p99']), 2)
-                },
+                'percentiles': LatencySketch.from_json(row['latency_sketch']).percentiles(50, 75, 90, 95, 99),
                 'request_count': row['request_count']
             })
         
@@ -875,7 +863,7 @@ async def get_latency_heatmap(
         }
         
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Latency heatmap fetched: {len(data)} time buckets")
         
         return result
@@ -902,7 +890,7 @@ async def get_dependency_breakdown(
     postprocessing, and tool use. Identifies bottlenecks in execution pipeline.
     """
     cache_key = f"performance_dependency_breakdown:{x_workspace_id}:{range}:{agent_id or 'all'}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -961,7 +949,7 @@ async def get_dependency_breakdown(
         }
         
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Dependency breakdown fetched for {agent_id or 'all agents'}")
         
         return result
@@ -85,7 +85,7 @@ async def get_quality_overview(
     drift indicator, and at-risk agents count.
     """
     cache_key = f"quality_overview:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return QualityOverview(**cached)
@@ -171,7 +171,7 @@ async def get_quality_overview(
             range=range
         )
 
-        set_cache(cache_key, result.dict(), ttl=600)  # 10 min cache
+        await set_cache(cache_key, result.dict(), ttl=600)  # 10 min cache
         return result
 
     except Exception as e:
@@ -196,7 +196,7 @@ async def get_quality_distribution(
     with average cost per range.
     """
     cache_key = f"quality_distribution:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return QualityDistribution(**cached)
@@ -243,7 +243,7 @@ async def get_quality_distribution(
             total_evaluations=total
         )
 
-        set_cache(cache_key, result.dict(), ttl=300)  # 5 min cache
+        await set_cache(cache_key, result.dict(), ttl=300)  # 5 min cache
         return result
 
     except Exception as e:
@@ -269,7 +269,7 @@ async def get_top_failing_agents(
     trends, and cost impact.
     """
     cache_key = f"quality_agents:{x_workspace_id}:{range}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return TopFailingAgents(**cached)
@@ -346,7 +346,7 @@ async def get_top_failing_agents(
             total_failing_agents=total_row['total'] or 0
         )
 
-        set_cache(cache_key, result.dict(), ttl=300)  # 5 min cache
+        await set_cache(cache_key, result.dict(), ttl=300)  # 5 min cache
         return result
 
     except Exception as e:
@@ -371,7 +371,7 @@ async def get_quality_cost_tradeoff(
     categorized into quadrants for optimization insights.
     """
     cache_key = f"quality_cost_tradeoff:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return QualityCostTradeoff(**cached)
@@ -460,7 +460,7 @@ async def get_quality_cost_tradeoff(
             avg_cost=avg_cost
         )
 
-        set_cache(cache_key, result.dict(), ttl=600)  # 10 min cache
+        await set_cache(cache_key, result.dict(), ttl=600)  # 10 min cache
         return result
 
     except Exception as e:
@@ -486,7 +486,7 @@ async def get_rubric_heatmap(
     relevance, helpfulness, and coherence criteria.
     """
     cache_key = f"quality_rubric_heatmap:{x_workspace_id}:{range}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return RubricHeatmap(**cached)
@@ -544,7 +544,7 @@ async def get_rubric_heatmap(
             criteria_averages=criteria_averages
         )
 
-        set_cache(cache_key, result.dict(), ttl=600)  # 10 min cache
+        await set_cache(cache_key, result.dict(), ttl=600)  # 10 min cache
         return result
 
     except Exception as e:
@@ -571,7 +571,7 @@ async def get_drift_timeline(
     with drift alerts when quality degrades beyond threshold.
     """
     cache_key = f"quality_drift:{x_workspace_id}:{range}:{granularity}:{drift_threshold}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return DriftTimeline(**cached)
@@ -655,7 +655,7 @@ async def get_drift_timeline(
             range=range
         )
 
-        set_cache(cache_key, result.dict(), ttl=180)  # 3 min cache
+        await set_cache(cache_key, result.dict(), ttl=180)  # 3 min cache
         return result
 
     except Exception as e:
@@ -682,7 +682,7 @@ async def get_agent_quality(
     and recent evaluations scoped to the specified agent.
     """
     cache_key = f"agent_quality:{x_workspace_id}:{agent_id}:{range}:{granularity}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return AgentQualityDetails(**cached)
@@ -850,7 +850,7 @@ async def get_agent_quality(
             range=range
         )
 
-        set_cache(cache_key, result.dict(), ttl=300)  # 5 min cache
+        await set_cache(cache_key, result.dict(), ttl=300)  # 5 min cache
         return result
 
     except Exception as e:
@@ -78,7 +78,7 @@ async def list_traces(
     cache_key = f"traces:list:{x_workspace_id}:{filters_hash}"
 
     # Try cache first
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -109,7 +109,7 @@ async def list_traces(
 
         # Cache result
         try:
-            set_cache(cache_key, result, settings.cache_ttl_traces)
+            await set_cache(cache_key, result, settings.cache_ttl_traces)
         except Exception:
             pass
 
@@ -139,7 +139,7 @@ async def get_trace_by_id(
     """
     # Try cache first
     cache_key = f"trace:detail:{trace_id}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         return cached
 
@@ -155,7 +155,7 @@ async def get_trace_by_id(
 
         # Cache result (longer TTL since traces don't change)
         try:
-            set_cache(cache_key, trace, 600)  # 10 minutes
+            await set_cache(cache_key, trace, 600)  # 10 minutes
         except Exception:
             pass
 
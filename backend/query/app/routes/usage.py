@@ -53,7 +53,7 @@ async def get_usage_overview(
     with percentage changes from the previous period.
     """
     cache_key = f"usage_overview:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return UsageOverview(**cached)
@@ -109,7 +109,7 @@ async def get_usage_overview(
         )
         
         # Cache for 5 minutes
-        set_cache(cache_key, result.model_dump(), ttl=300)
+        await set_cache(cache_key, result.model_dump(), ttl=300)
         logger.info(f"Usage overview fetched for workspace {x_workspace_id}, range {range}")
         
         return result
@@ -137,7 +137,7 @@ async def get_calls_over_time(
     grouped by the specified granularity.
     """
     cache_key = f"usage_calls_over_time:{x_workspace_id}:{range}:{granularity}:{agent_id or 'all'}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return CallsOverTime(**cached)
@@ -150,18 +150,19 @@ async def get_calls_over_time(
         agent_filter = "AND agent_id = $3" if agent_id else ""
         params = [x_workspace_id, hours] + ([agent_id] if agent_id else [])
         
+        # Pre-summed per-minute rollup (includes sampled-out traces)
         query = f"""
             SELECT
-                time_bucket(INTERVAL '{interval}', timestamp) as bucket,
+                time_bucket(INTERVAL '{interval}', bucket) as bucket,
                 agent_id,
-                COUNT(*)::int as call_count,
-                ROUND(AVG(latency_ms)::numeric, 2) as avg_latency_ms,
-                ROUND(COALESCE(SUM(cost_usd), 0)::numeric, 4) as total_cost_usd
-            FROM traces
+                SUM(request_count)::int as call_count,
+                ROUND(SUM(latency_sum_ms)::numeric / NULLIF(SUM(request_count), 0), 2) as avg_latency_ms,
+                ROUND(SUM(cost_usd_sum)::numeric, 4) as total_cost_usd
+            FROM traces_minutely
             WHERE workspace_id = $1 
-                AND timestamp >= NOW() - INTERVAL '1 hour' * $2
+                AND bucket >= NOW() - INTERVAL '1 hour' * $2
                 {agent_filter}
-            GROUP BY bucket, agent_id
+            GROUP BY 1, 2  -- the time_bucket output, not the per-minute bucket column
             ORDER BY bucket DESC
             LIMIT 1000
         """
@@ -186,7 +187,7 @@ async def get_calls_over_time(
         )
         
         # Cache for 2 minutes
-        set_cache(cache_key, result.model_dump(), ttl=120)
+        await set_cache(cache_key, result.model_dump(), ttl=120)
         logger.info(f"Calls over time fetched: {len(data)} buckets")
         
         return result
@@ -211,7 +212,7 @@ async def get_agent_distribution(
     Returns percentage breakdown, average latency, and error rate for each agent.
     """
     cache_key = f"usage_agent_distribution:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return AgentDistribution(**cached)
@@ -223,12 +224,12 @@ async def get_agent_distribution(
             WITH agent_stats AS (
                 SELECT
                     agent_id,
-                    COUNT(*)::int as call_count,
-                    ROUND(AVG(latency_ms)::numeric, 2) as avg_latency_ms,
-                    COUNT(*) FILTER (WHERE status = 'error')::int as error_count
-                FROM traces
+                    SUM(request_count)::int as call_count,
+                    ROUND(SUM(latency_sum_ms)::numeric / NULLIF(SUM(request_count), 0), 2) as avg_latency_ms,
+                    COALESCE(SUM(request_count) FILTER (WHERE status = 'error'), 0)::int as error_count
+                FROM traces_minutely
                 WHERE workspace_id = $1 
-                    AND timestamp >= NOW() - INTERVAL '1 hour' * $2
+                    AND bucket >= NOW() - INTERVAL '1 hour' * $2
                 GROUP BY agent_id
             ),
             total_calls AS (
@@ -266,7 +267,7 @@ async def get_agent_distribution(
         )
         
         # Cache for 5 minutes
-        set_cache(cache_key, result.model_dump(), ttl=300)
+        await set_cache(cache_key, result.model_dump(), ttl=300)
         logger.info(f"Agent distribution fetched: {len(data)} agents")
         
         return result
@@ -293,7 +294,7 @@ async def get_top_users(
     and trend compared to previous period.
     """
     cache_key = f"usage_top_users:{x_workspace_id}:{range}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return TopUsers(**cached)
@@ -387,7 +388,7 @@ async def get_top_users(
         )
         
         # Cache for 5 minutes
-        set_cache(cache_key, result.model_dump(), ttl=300)
+        await set_cache(cache_key, result.model_dump(), ttl=300)
         logger.info(f"Top users fetched: {len(data)} users")
         
         return result
@@ -418,7 +419,7 @@ async def get_user_segments(
     PRD Tab 2: User Segmentation (P0)
     """
     cache_key = f"user_segments:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -528,7 +529,7 @@ async def get_user_segments(
         }
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"User segments fetched: {len(data)} segments")
 
         return result
@@ -556,7 +557,7 @@ async def get_intent_distribution(
     PRD Tab 2: Chart 2.8 - Intent Distribution Matrix (P0)
     """
     cache_key = f"intent_distribution:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -624,7 +625,7 @@ async def get_intent_distribution(
         }
 
         # Cache for 5 minutes
-        set_cache(cache_key, result, ttl=300)
+        await set_cache(cache_key, result, ttl=300)
         logger.info(f"Intent distribution fetched: {len(cells)} cells, {len(departments)} depts, {len(intent_categories)} intents")
 
         return result
@@ -652,7 +653,7 @@ async def get_retention_cohorts(
     PRD Tab 2: Chart 2.9 - Retention Cohort Analysis (P0)
     """
     cache_key = f"retention_cohorts:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -732,7 +733,7 @@ async def get_retention_cohorts(
         }
 
         # Cache for 1 hour (cohort data changes slowly)
-        set_cache(cache_key, result, ttl=3600)
+        await set_cache(cache_key, result, ttl=3600)
         logger.info(f"Retention cohorts fetched: {len(cohorts)} cells, {len(cohort_months)} cohorts")
 
         return result
@@ -761,7 +762,7 @@ async def get_agent_adoption(
     PRD Tab 2: Chart 2.10 - Agent Adoption Curve (P1)
     """
     cache_key = f"agent_adoption:{x_workspace_id}:{range}:{limit}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -873,7 +874,7 @@ async def get_agent_adoption(
         }
 
         # Cache for 10 minutes
-        set_cache(cache_key, result, ttl=600)
+        await set_cache(cache_key, result, ttl=600)
         logger.info(f"Agent adoption fetched: {len(agents)} agents")
 
         return result
@@ -901,7 +902,7 @@ async def get_time_of_day_heatmap(
     PRD Tab 2: Chart 2.16 - Time-of-Day Usage Heatmap (P1)
     """
     cache_key = f"time_of_day_heatmap:{x_workspace_id}:{range}"
-    cached = get_cache(cache_key)
+    cached = await get_cache(cache_key)
     if cached:
         logger.info(f"Cache hit for {cache_key}")
         return cached
@@ -970,7 +971,7 @@ async def get_time_of_day_heatmap(
         }
 
         # Cache for 10 minutes
-        set_cache(cache_key, result, ttl=600)
+        await set_cache(cache_key, result, ttl=600)
         logger.info(f"Time-of-day heatmap fetched: {len(cells)} cells")
 
         return result
@@ -0,0 +1,115 @@
+"""Mergeable latency sketches stored per traces_minutely row"""
+import json
+import math
+from typing import Iterable, Optional, Union
+
+# DDSketch with 1% relative accuracy: bin i counts latencies in (gamma^(i-1), gamma^i].
+# Keep in sync with the rollup in backend/processing/app/writer.py
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+
+class LatencySketch:
+    """
+    Latency distribution as DDSketch bin counts
+
+    The processing writer stores one sketch per traces_minutely row
+    (``latency_sketch``, a JSONB object of bin index -> count). Sketches
+    merge by adding counts, so percentiles over any set of buckets and
+    dimensions come from the rollup rows - without reading raw traces -
+    and stay within ``RELATIVE_ACCURACY`` of the exact value.
+    """
+
+    __slots__ = ("bins",)
+
+    def __init__(self, bins: Optional[dict[int, int]] = None):
+        self.bins: dict[int, int] = bins or {}
+
+    @classmethod
+    def from_json(cls, value: Union[str, dict, None]) -> "LatencySketch":
+        """Sketch from a latency_sketch column value (asyncpg returns JSONB as text)"""
+        if value is None:
+            return cls()
+        if isinstance(value, str):
+            value = json.loads(value)
+        return cls({int(index): int(count) for index, count in value.items()})
+
+    def add(self, latency_ms: float, count: int = 1):
+        """Count a latency (values below 1 ms are counted as 1 ms)"""
+        index = math.ceil(math.log(max(latency_ms, 1)) / LOG_GAMMA)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        """Add another sketch's counts to this one"""
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        return self
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile
+
+        Args:
+            q: Quantile between 0 and 1 (0.95 for P95)
+
+        Returns:
+            Optional[float]: Latency in ms, or None for an empty sketch
+        """
+        total = self.count
+        if total == 0:
+            return None
+
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                break
+        # Midpoint of the bin in relative terms
+        return 2 * GAMMA ** index / (GAMMA + 1)
+
+    def percentiles(self, *percentiles: int) -> dict[str, float]:
+        """Named percentiles, e.g. ``percentiles(50, 95)`` -> ``{'p50': ..., 'p95': ...}`` (0 when empty)"""
+        return {f"p{p}": round(self.quantile(p / 100) or 0.0, 2) for p in percentiles}
+
+
+def merge_sketches(values: Iterable[Union[str, dict, None]]) -> LatencySketch:
+    """Merge latency_sketch column values into one sketch"""
+    sketch = LatencySketch()
+    for value in values:
+        sketch.merge(LatencySketch.from_json(value))
+    return sketch
+
+
+def merged_sketches_sql(keys: dict[str, str], where: str) -> str:
+    """
+    Subquery merging traces_minutely sketches per group inside the database
+
+    Only the merged bins are returned - one sketch per group - so the
+    query reads O(rollup rows) and transfers O(groups) sketches.
+
+    Args:
+        keys: Output column name -> grouping expression over traces_minutely
+        where: Filter on traces_minutely
+
+    Returns:
+        str: SELECT yielding the ``keys`` columns and ``latency_sketch``
+    """
+    select = ', '.join(f"{expression} AS {name}" for name, expression in keys.items())
+    names = ', '.join(keys)
+    positions = ', '.join(str(i) for i in range(1, len(keys) + 2))
+    return f"""
+        SELECT {names}, jsonb_object_agg(bin, n) AS latency_sketch
+        FROM (
+            SELECT {select}, entry.key AS bin, SUM(entry.value::bigint) AS n
+            FROM traces_minutely, jsonb_each_text(traces_minutely.latency_sketch) AS entry
+            WHERE {where}
+            GROUP BY {positions}
+        ) bins
+        GROUP BY {names}
+    """
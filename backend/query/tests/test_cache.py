@@ -1,56 +1,345 @@
 """Tests for caching functionality"""
+import asyncio
 import pytest
-from app.cache import get_cache, set_cache, invalidate_cache
+from unittest.mock import patch
+from app.cache import get_cache, get_cache_many, set_cache, set_cache_many, invalidate_cache
 import json
 
 
-def test_cache_set_and_get():
+@pytest.mark.asyncio
+async def test_cache_set_and_get():
     """Test basic cache set and get operations"""
     key = "test:key:1"
     value = {"data": "test_value", "count": 123}
     ttl = 60
-    
+
     # Set cache
-    set_cache(key, value, ttl)
-    
+    await set_cache(key, value, ttl)
+
     # Get cache
-    cached_value = get_cache(key)
-    
+    cached_value = await get_cache(key)
+
     assert cached_value is not None
     assert cached_value["data"] == "test_value"
     assert cached_value["count"] == 123
-    
+
     # Clean up
-    invalidate_cache("test:*")
+    await invalidate_cache("test:*")
 
 
-def test_cache_get_nonexistent():
+@pytest.mark.asyncio
+async def test_cache_get_nonexistent():
     """Test getting a non-existent cache key"""
-    cached_value = get_cache("nonexistent:key")
+    cached_value = await get_cache("nonexistent:key")
     assert cached_value is None
 
 
-def test_cache_invalidation():
+@pytest.mark.asyncio
+async def test_cache_multi_get():
+    """Several keys are read in one round-trip, misses as None"""
+    await set_cache_many({"test:multi:1": {"value": 1}, "test:multi:2": {"value": 2}}, 60)
+
+    values = await get_cache_many(["test:multi:1", "test:multi:missing", "test:multi:2"])
+
+    assert values == [{"value": 1}, None, {"value": 2}]
+
+    # Clean up
+    await invalidate_cache("test:*")
+
+
+@pytest.mark.asyncio
+async def test_cache_zero_ttl_deletes():
+    """Setting a key with a TTL of 0 removes it"""
+    await set_cache("test:delete", {"value": 1}, 60)
+    await set_cache("test:delete", None, ttl=0)
+
+    assert await get_cache("test:delete") is None
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation():
     """Test cache invalidation with pattern matching"""
     # Set multiple cache keys
-    set_cache("workspace:123:kpis", {"value": 100}, 60)
-    set_cache("workspace:123:alerts", {"value": 200}, 60)
-    set_cache("workspace:456:kpis", {"value": 300}, 60)
-    
+    await set_cache("workspace:123:kpis", {"value": 100}, 60)
+    await set_cache("workspace:123:alerts", {"value": 200}, 60)
+    await set_cache("workspace:456:kpis", {"value": 300}, 60)
+
     # Verify they exist
-    assert get_cache("workspace:123:kpis") is not None
-    assert get_cache("workspace:123:alerts") is not None
-    assert get_cache("workspace:456:kpis") is not None
-    
+    assert await get_cache("workspace:123:kpis") is not None
+    assert await get_cache("workspace:123:alerts") is not None
+    assert await get_cache("workspace:456:kpis") is not None
+
     # Invalidate workspace 123
-    invalidate_cache("workspace:123:*")
-    
+    await invalidate_cache("workspace:123:*")
+
     # Verify workspace 123 keys are gone
-    assert get_cache("workspace:123:kpis") is None
-    assert get_cache("workspace:123:alerts") is None
-    
+    assert await get_cache("workspace:123:kpis") is None
+    assert await get_cache("workspace:123:alerts") is None
+
     # Verify workspace 456 keys still exist
-    assert get_cache("workspace:456:kpis") is not None
-    
+    assert await get_cache("workspace:456:kpis") is not None
+
     # Clean up
-    invalidate_cache("workspace:*")
+    await invalidate_cache("workspace:*")
+
+
+class FakeRedis:
+    """In-memory stand-in for the asyncio Redis client, counting reads"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.reads = 0
+
+    def _pttl(self, key):
+        if key not in self.values:
+            return -2
+        return self.ttls[key] * 1000 if key in self.ttls else -1
+
+    def _setex(self, key, ttl, value):
+        self.values[key] = value
+        self.ttls[key] = ttl
+
+    def pipeline(self, transaction=False):
+        fake = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def get(self, key):
+                self.calls.append(lambda: fake.values.get(key))
+
+            def pttl(self, key):
+                self.calls.append(lambda: fake._pttl(key))
+
+            def setex(self, key, ttl, value):
+                self.calls.append(lambda: fake._setex(key, ttl, value))
+
+            async def execute(self):
+                fake.reads += 1
+                return [call() for call in self.calls]
+
+        return Pipeline()
+
+    async def setex(self, key, ttl, value):
+        self._setex(key, ttl, value)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        if self.values.get(key) == token:
+            del self.values[key]
+
+
+@pytest.fixture
+def fake_redis():
+    """Cache module backed by FakeRedis, with empty local tier and flights"""
+    from app import cache
+    fake = FakeRedis()
+    with patch.object(cache, 'redis_client', fake), \
+            patch.object(cache, 'local_cache', cache.LocalCache(1024)), \
+            patch.dict(cache._inflight, clear=True), patch.dict(cache._locks, clear=True), \
+            patch.dict(cache.hot_keys, clear=True), patch.object(cache.settings, 'cache_stale_ttl_s', 300):
+        yield fake
+
+
+class TestTwoTierCache:
+    """Test the in-process tier and single-flight (no Redis server needed)"""
+
+    def test_local_tier_evicts_least_recently_used_by_size(self):
+        """Entries are evicted oldest-first once their total size exceeds the bound"""
+        from app.cache import LocalCache
+        local = LocalCache(max_bytes=10)
+        local.set("a", "aaaa", 60)
+        local.set("b", "bbbb", 60)
+        assert local.get("a") == "aaaa"  # a is now the most recently used
+
+        local.set("c", "cccc", 60)
+
+        assert local.get("b") is None
+        assert local.get("a") == "aaaa"
+        assert local.size == 8
+
+        local.set("huge", "x" * 11, 60)
+        assert local.get("huge") is None
+
+    def test_local_ttl_uses_longest_family_prefix(self):
+        """Per-family TTLs override the default by longest matching prefix"""
+        from app import cache
+        with patch.object(cache.settings, 'cache_local_ttls', {"cost_": 60, "cost_overview:": 5}), \
+                patch.object(cache.settings, 'cache_local_ttl_s', 30):
+            assert cache.local_ttl("cost_overview:ws:30d") == 5
+            assert cache.local_ttl("cost_trend:ws:30d") == 60
+            assert cache.local_ttl("home_kpis:ws") == 30
+
+    @pytest.mark.asyncio
+    async def test_hits_are_served_from_the_local_tier(self, fake_redis):
+        """A value read once from Redis is served locally afterwards"""
+        fake_redis.values["home_kpis:ws"] = json.dumps({"value": 1})
+
+        assert await get_cache("home_kpis:ws") == {"value": 1}
+        assert await get_cache("home_kpis:ws") == {"value": 1}
+        assert fake_redis.reads == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_compute_once(self, fake_redis):
+        """Requests missing the same key wait for the first one's result"""
+        from app.cache import get_or_compute
+        computed = 0
+
+        async def compute():
+            nonlocal computed
+            computed += 1
+            await asyncio.sleep(0.01)
+            return {"value": 42}
+
+        async def request():
+            return await get_or_compute("cost_overview:ws:30d", compute, ttl=300)
+
+        results = await asyncio.gather(*(asyncio.create_task(request()) for _ in range(20)))
+
+        assert computed == 1
+        assert results == [{"value": 42}] * 20
+
+    @pytest.mark.asyncio
+    async def test_failed_compute_releases_waiters(self, fake_redis):
+        """When the computing request fails, a waiting request computes instead"""
+        from app.cache import get_or_compute
+        attempts = 0
+
+        async def compute():
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0.01)
+            if attempts == 1:
+                raise RuntimeError("query failed")
+            return {"value": 1}
+
+        first = asyncio.create_task(get_or_compute("usage_overview:ws", compute, ttl=60))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(get_or_compute("usage_overview:ws", compute, ttl=60))
+
+        with pytest.raises(RuntimeError):
+            await first
+        assert await second == {"value": 1}
+        assert attempts == 2
+
+    @pytest.mark.asyncio
+    async def test_cluster_lock_waits_for_the_other_worker(self, fake_redis):
+        """With the cluster lock, a miss waits for the worker holding the key's lock"""
+        from app import cache
+        fake_redis.values["lock:performance_overview:ws"] = "other-worker"
+
+        async def other_worker():
+            await asyncio.sleep(0.02)
+            fake_redis.values["performance_overview:ws"] = json.dumps({"value": 7})
+
+        with patch.object(cache.settings, 'cache_cluster_lock', True):
+            asyncio.create_task(other_worker())
+            assert await get_cache("performance_overview:ws") == {"value": 7}
+
+    @pytest.mark.asyncio
+    async def test_stale_value_is_served_while_one_refresh_runs(self, fake_redis):
+        """Past its TTL a value is still returned, and recomputed once in the background"""
+        from app import cache
+        fake_redis.values["home_kpis:ws"] = json.dumps({"value": "old"})
+        fake_redis.ttls["home_kpis:ws"] = 200  # 100s past its TTL, within the 300s stale window
+        computed = 0
+
+        async def compute():
+            nonlocal computed
+            computed += 1
+            await asyncio.sleep(0.01)
+            return {"value": "new"}
+
+        results = await asyncio.gather(*(cache.get_or_compute("home_kpis:ws", compute, ttl=60) for _ in range(10)))
+
+        assert results == [{"value": "old"}] * 10
+        await asyncio.gather(*(asyncio.shield(flight) for flight in cache._inflight.values()))
+        assert computed == 1
+        assert json.loads(fake_redis.values["home_kpis:ws"]) == {"value": "new"}
+        assert fake_redis.ttls["home_kpis:ws"] == 360
+        assert await cache.get_or_compute("home_kpis:ws", compute, ttl=60) == {"value": "new"}
+
+    @pytest.mark.asyncio
+    async def test_superseded_flight_keeps_the_newer_lock(self, fake_redis):
+        """Settling an old flight must not release the cluster lock of the request that replaced it"""
+        from app import cache
+        cache._claim("home_kpis:ws")
+        old = cache._inflight["home_kpis:ws"]
+        assert await cache._acquire_lock("home_kpis:ws")
+        del fake_redis.values["lock:home_kpis:ws"]  # the old lock expired
+        cache._claim("home_kpis:ws")
+        new = cache._inflight["home_kpis:ws"]
+        assert await cache._acquire_lock("home_kpis:ws")
+        token = cache._locks["home_kpis:ws"]
+
+        cache._settle("home_kpis:ws", None, old)
+        await asyncio.sleep(0)
+
+        assert old.done() and not new.done()
+        assert cache._inflight["home_kpis:ws"] is new
+        assert cache._locks["home_kpis:ws"] == token
+        assert fake_redis.values["lock:home_kpis:ws"] == token
+
+        cache._settle("home_kpis:ws", None, new)
+        await asyncio.sleep(0)
+        assert "lock:home_kpis:ws" not in fake_redis.values
+
+    @pytest.mark.asyncio
+    async def test_stale_get_cache_lets_one_request_recompute(self, fake_redis):
+        """With get_cache, the first reader of a stale key misses and the others get the stale value"""
+        fake_redis.values["cost_trend:ws"] = json.dumps({"value": "old"})
+        fake_redis.ttls["cost_trend:ws"] = 100
+
+        assert await get_cache("cost_trend:ws") is None
+        assert await get_cache("cost_trend:ws") == {"value": "old"}
+
+        await set_cache("cost_trend:ws", {"value": "new"}, 60)
+        assert await get_cache("cost_trend:ws") == {"value": "new"}
+
+    @pytest.mark.asyncio
+    async def test_hot_keys_are_refreshed_before_they_expire(self, fake_redis):
+        """Keys hit often enough are recomputed ahead of expiry; cold keys are not"""
+        from app import cache
+        fake_redis.values["cost_overview:ws:30d"] = json.dumps({"value": "old"})
+        fake_redis.ttls["cost_overview:ws:30d"] = 310  # fresh for another 10s
+        fake_redis.values["cost_overview:ws:7d"] = json.dumps({"value": "old"})
+        fake_redis.ttls["cost_overview:ws:7d"] = 310
+        computed = []
+
+        def compute(key):
+            async def run():
+                computed.append(key)
+                return {"value": "new"}
+            return run
+
+        with patch.object(cache.settings, 'cache_hot_min_hits', 3), \
+                patch.object(cache.settings, 'cache_refresh_ahead_s', 30), \
+                patch.object(cache.settings, 'cache_refresh_interval_s', 0.01):
+            for _ in range(3):
+                await cache.get_or_compute("cost_overview:ws:30d", compute("30d"), ttl=300)
+            await cache.get_or_compute("cost_overview:ws:7d", compute("7d"), ttl=300)
+
+            refresher = asyncio.create_task(cache.refresh_hot_keys())
+            await asyncio.sleep(0.05)
+            refresher.cancel()
+
+        assert computed == ["30d"]
+        assert json.loads(fake_redis.values["cost_overview:ws:30d"]) == {"value": "new"}
+        assert fake_redis.ttls["cost_overview:ws:30d"] == 600
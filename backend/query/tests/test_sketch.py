@@ -0,0 +1,59 @@
+"""Tests for mergeable latency sketches"""
+import json
+import random
+from app.sketch import RELATIVE_ACCURACY, LatencySketch, merge_sketches, merged_sketches_sql
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_quantiles_within_relative_accuracy():
+    """Estimates stay within the sketch's relative accuracy of the exact value"""
+    rng = random.Random(7)
+    latencies = [int(rng.lognormvariate(6, 1)) + 1 for _ in range(10000)]
+    sketch = LatencySketch()
+    for latency in latencies:
+        sketch.add(latency)
+
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = exact_quantile(latencies, q)
+        assert abs(sketch.quantile(q) - exact) <= RELATIVE_ACCURACY * exact
+
+
+def test_merge_equals_sketch_of_union():
+    """Merging per-bucket sketches gives the same bins as one sketch of all values"""
+    buckets = [[100, 200, 300], [250, 5000], [120]]
+    combined = LatencySketch()
+    stored = []
+    for bucket in buckets:
+        sketch = LatencySketch()
+        for latency in bucket:
+            sketch.add(latency)
+            combined.add(latency)
+        # Stored as JSONB: string keys, returned by asyncpg as text
+        stored.append(json.dumps({str(i): n for i, n in sketch.bins.items()}))
+
+    merged = merge_sketches(stored + [None])
+
+    assert merged.bins == combined.bins
+    assert merged.count == 6
+
+
+def test_empty_sketch():
+    """Empty sketches have no quantiles and report zero percentiles"""
+    sketch = LatencySketch.from_json('{}')
+
+    assert sketch.quantile(0.5) is None
+    assert sketch.percentiles(50, 99) == {'p50': 0.0, 'p99': 0.0}
+
+
+def test_merged_sketches_sql_groups_bins():
+    """Sketches are merged per group in the database"""
+    sql = merged_sketches_sql({'bucket': "time_bucket(INTERVAL '1 hour', bucket)"}, "workspace_id = $1")
+
+    assert "time_bucket(INTERVAL '1 hour', bucket) AS bucket" in sql
+    assert "jsonb_each_text(traces_minutely.latency_sketch)" in sql
+    assert "GROUP BY 1, 2" in sql
+    assert "jsonb_object_agg(bin, n) AS latency_sketch" in sql
@@ -5,6 +5,7 @@ This script loads the generated synthetic data into the databases for testing.
 
 import os
 import json
+import math
 import asyncio
 import asyncpg
 from datetime import datetime
@@ -13,6 +14,48 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Latency sketch bin width (DDSketch, 1% relative accuracy)
+SKETCH_LOG_GAMMA = math.log((1 + 0.01) / (1 - 0.01))
+
+# Adds the rows returned by ``inserted`` to the per-minute rollup the dashboards
+# read. Keep in sync with rollup_upsert_sql() in backend/processing/app/writer.py
+ROLLUP_INSERTED_SQL = f"""
+    INSERT INTO traces_minutely (
+        bucket, workspace_id, agent_id, model, model_provider,
+        department_id, environment_id, version, status,
+        request_count, sampled_out_count, latency_sum_ms,
+        tokens_input_sum, tokens_output_sum, tokens_total_sum, cost_usd_sum,
+        latency_sketch
+    )
+    SELECT
+        time_bucket(INTERVAL '1 minute', timestamp), workspace_id, agent_id, COALESCE(model, ''), COALESCE(model_provider, ''), COALESCE(department_id, '00000000-0000-0000-0000-000000000000'::uuid), COALESCE(environment_id, '00000000-0000-0000-0000-000000000000'::uuid), COALESCE(version, ''), COALESCE(status, 'success'),
+        COUNT(*), 0, SUM(latency_ms),
+        COALESCE(SUM(tokens_input), 0), COALESCE(SUM(tokens_output), 0),
+        COALESCE(SUM(tokens_total), 0), COALESCE(SUM(cost_usd), 0),
+        COALESCE((
+        SELECT jsonb_object_agg(bin, n) FROM (
+            SELECT CEIL(LN(GREATEST(latency_ms, 1)) / {SKETCH_LOG_GAMMA!r})::int AS bin, COUNT(*) AS n
+            FROM unnest(array_agg(latency_ms)) AS sample(latency_ms)
+            WHERE latency_ms IS NOT NULL
+            GROUP BY 1
+        ) bins
+    ), '{{}}'::jsonb)
+    FROM inserted
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+    -- Concurrent writers lock rollup rows in the same order
+    ORDER BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+    ON CONFLICT (bucket, workspace_id, agent_id, model, model_provider, department_id, environment_id, version, status)
+    DO UPDATE SET
+        request_count = traces_minutely.request_count + EXCLUDED.request_count,
+        sampled_out_count = traces_minutely.sampled_out_count + EXCLUDED.sampled_out_count,
+        latency_sum_ms = traces_minutely.latency_sum_ms + EXCLUDED.latency_sum_ms,
+        tokens_input_sum = traces_minutely.tokens_input_sum + EXCLUDED.tokens_input_sum,
+        tokens_output_sum = traces_minutely.tokens_output_sum + EXCLUDED.tokens_output_sum,
+        tokens_total_sum = traces_minutely.tokens_total_sum + EXCLUDED.tokens_total_sum,
+        cost_usd_sum = traces_minutely.cost_usd_sum + EXCLUDED.cost_usd_sum,
+        latency_sketch = latency_sketch_merge(traces_minutely.latency_sketch, EXCLUDED.latency_sketch)
+"""
+
 
 async def load_traces_to_timescaledb(traces: List[Dict[str, Any]]):
     """Load traces into TimescaleDB."""
@@ -24,8 +67,17 @@ async def load_traces_to_timescaledb(traces: List[Dict[str, Any]]):
     try:
         print(f"Loading {len(traces)} traces into TimescaleDB...")
 
-        # Batch insert for performance
-        batch_size = 1000
+        # Stage each batch with COPY, then insert it and roll up the new rows in one statement
+        await conn.execute('''
+            CREATE TEMP TABLE traces_staging ON COMMIT DELETE ROWS AS
+            SELECT trace_id, workspace_id, agent_id, timestamp, latency_ms,
+                   input, output, error, status, model, model_provider,
+                   tokens_input, tokens_output, tokens_total, cost_usd,
+                   metadata, tags
+            FROM traces WITH NO DATA
+        ''')
+
+        batch_size = 10000
         for i in range(0, len(traces), batch_size):
             batch = traces[i:i + batch_size]
 
@@ -51,15 +103,23 @@ async def load_traces_to_timescaledb(traces: List[Dict[str, Any]]):
                     trace.get('tags', []),
                 ))
 
-            await conn.executemany('''
-                INSERT INTO traces (
-                    trace_id, workspace_id, agent_id, timestamp, latency_ms,
-                    input, output, error, status, model, model_provider,
-                    tokens_input, tokens_output, tokens_total, cost_usd,
-                    metadata, tags
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
-                ON CONFLICT (trace_id, timestamp) DO NOTHING
-            ''', values)
+            async with conn.transaction():
+                await conn.copy_records_to_table('traces_staging', records=values)
+                await conn.execute('''
+                    WITH inserted AS (
+                        INSERT INTO traces (
+                            trace_id, workspace_id, agent_id, timestamp, latency_ms,
+                            input, output, error, status, model, model_provider,
+                            tokens_input, tokens_output, tokens_total, cost_usd,
+                            metadata, tags
+                        )
+                        SELECT * FROM traces_staging
+                        ON CONFLICT (trace_id, timestamp) DO NOTHING
+                        RETURNING timestamp, workspace_id, agent_id, model, model_provider,
+                                  department_id, environment_id, version, status,
+                                  latency_ms, tokens_input, tokens_output, tokens_total, cost_usd
+                    )
+                ''' + ROLLUP_INSERTED_SQL)
 
             print(f"  Loaded batch {i // batch_size + 1}/{(len(traces) - 1) // batch_size + 1}")
 
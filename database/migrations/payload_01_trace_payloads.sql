@@ -0,0 +1,28 @@
+-- Payload Offload Migration: Content-Addressed Input/Output Bodies
+-- Purpose: Store large trace input/output bodies once per SHA-256 content hash.
+--          Traces keep a preview in input/output plus input_hash/output_hash.
+-- Date: October 18, 2026
+
+-- Step 1: Payload store (plain table, deduplicated by content hash)
+CREATE TABLE IF NOT EXISTS trace_payloads (
+    content_hash CHAR(64) PRIMARY KEY,
+    body TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW()  -- Refreshed at most daily by the writer
+);
+
+CREATE INDEX IF NOT EXISTS idx_trace_payloads_last_seen ON trace_payloads (last_seen_at);
+
+-- Step 2: Hash references on traces (NULL when the body is stored inline)
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS input_hash CHAR(64);
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS output_hash CHAR(64);
+
+-- Step 3: Purge bodies no longer referenced by retained traces (30 day retention)
+CREATE OR REPLACE PROCEDURE purge_trace_payloads(job_id INT, config JSONB)
+LANGUAGE SQL AS $$
+    DELETE FROM trace_payloads WHERE last_seen_at < NOW() - INTERVAL '32 days';
+$$;
+
+SELECT add_job('purge_trace_payloads', '1 day')
+WHERE NOT EXISTS (SELECT 1 FROM timescaledb_information.jobs WHERE proc_name = 'purge_trace_payloads');
@@ -0,0 +1,117 @@
+-- Rollup Migration: Per-Minute Trace Rollup Written by the Processing Service
+-- Purpose: traces_minutely holds per-minute sums for every trace (stored and
+--          sampled out), upserted in the same transaction as the traces, so
+--          recent-window KPIs read pre-summed rows instead of scanning traces.
+--          Replaces traces_sampled_minutely.
+-- Date: October 18, 2026
+-- Note: Stop the processing service while this runs; the backfill covers
+--       everything written before it.
+
+-- Step 1: Dimensions read by the rollup (already present after phase1_03/04)
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS department_id UUID;
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS environment_id UUID;
+ALTER TABLE traces ADD COLUMN IF NOT EXISTS version VARCHAR(50);
+
+-- Step 2: Rollup table (missing dimensions are stored as '' or the nil UUID)
+CREATE TABLE IF NOT EXISTS traces_minutely (
+    bucket TIMESTAMPTZ NOT NULL,
+    workspace_id UUID NOT NULL,
+    agent_id VARCHAR(128) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    model_provider VARCHAR(32) NOT NULL,
+    department_id UUID NOT NULL,
+    environment_id UUID NOT NULL,
+    version VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    sampled_out_count BIGINT NOT NULL DEFAULT 0,
+    latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+    tokens_input_sum BIGINT NOT NULL DEFAULT 0,
+    tokens_output_sum BIGINT NOT NULL DEFAULT 0,
+    tokens_total_sum BIGINT NOT NULL DEFAULT 0,
+    cost_usd_sum DECIMAL(14, 6) NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, workspace_id, agent_id, model, model_provider, department_id, environment_id, version, status)
+);
+
+SELECT create_hypertable('traces_minutely', 'bucket',
+    chunk_time_interval => INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+
+CREATE INDEX IF NOT EXISTS idx_traces_minutely_workspace_bucket
+    ON traces_minutely (workspace_id, bucket DESC);
+
+SELECT add_retention_policy('traces_minutely', INTERVAL '30 days', if_not_exists => TRUE);
+
+-- Step 3: Keys of sampled-out traces already counted, so redelivered ones are not
+CREATE TABLE IF NOT EXISTS traces_sampled_keys (
+    timestamp TIMESTAMPTZ NOT NULL,
+    trace_id VARCHAR(64) NOT NULL,
+    PRIMARY KEY (timestamp, trace_id)
+);
+
+SELECT create_hypertable('traces_sampled_keys', 'timestamp',
+    chunk_time_interval => INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+
+SELECT add_retention_policy('traces_sampled_keys', INTERVAL '7 days', if_not_exists => TRUE);
+
+-- Step 4: Backfill from stored traces
+INSERT INTO traces_minutely (
+    bucket, workspace_id, agent_id, model, model_provider,
+    department_id, environment_id, version, status,
+    request_count, latency_sum_ms,
+    tokens_input_sum, tokens_output_sum, tokens_total_sum, cost_usd_sum
+)
+SELECT
+    time_bucket(INTERVAL '1 minute', timestamp),
+    workspace_id,
+    agent_id,
+    COALESCE(model, ''),
+    COALESCE(model_provider, ''),
+    COALESCE(department_id, '00000000-0000-0000-0000-000000000000'::uuid),
+    COALESCE(environment_id, '00000000-0000-0000-0000-000000000000'::uuid),
+    COALESCE(version, ''),
+    COALESCE(status, 'success'),
+    COUNT(*),
+    SUM(latency_ms),
+    COALESCE(SUM(tokens_input), 0),
+    COALESCE(SUM(tokens_output), 0),
+    COALESCE(SUM(tokens_total), 0),
+    COALESCE(SUM(cost_usd), 0)
+FROM traces
+GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+ON CONFLICT DO NOTHING;
+
+-- Step 5: Fold in the sampled-out counters and retire their table
+DO $$
+BEGIN
+    IF to_regclass('traces_sampled_minutely') IS NOT NULL THEN
+        INSERT INTO traces_minutely (
+            bucket, workspace_id, agent_id, model, model_provider,
+            department_id, environment_id, version, status,
+            request_count, sampled_out_count, latency_sum_ms,
+            tokens_input_sum, tokens_output_sum, tokens_total_sum, cost_usd_sum
+        )
+        SELECT
+            bucket, workspace_id, agent_id, model, model_provider,
+            '00000000-0000-0000-0000-000000000000'::uuid,
+            '00000000-0000-0000-0000-000000000000'::uuid,
+            '', status,
+            request_count, request_count, latency_sum_ms,
+            tokens_input_sum, tokens_output_sum, tokens_total_sum, cost_usd_sum
+        FROM traces_sampled_minutely
+        ON CONFLICT (bucket, workspace_id, agent_id, model, model_provider, department_id, environment_id, version, status)
+        DO UPDATE SET
+            request_count = traces_minutely.request_count + EXCLUDED.request_count,
+            sampled_out_count = traces_minutely.sampled_out_count + EXCLUDED.sampled_out_count,
+            latency_sum_ms = traces_minutely.latency_sum_ms + EXCLUDED.latency_sum_ms,
+            tokens_input_sum = traces_minutely.tokens_input_sum + EXCLUDED.tokens_input_sum,
+            tokens_output_sum = traces_minutely.tokens_output_sum + EXCLUDED.tokens_output_sum,
+            tokens_total_sum = traces_minutely.tokens_total_sum + EXCLUDED.tokens_total_sum,
+            cost_usd_sum = traces_minutely.cost_usd_sum + EXCLUDED.cost_usd_sum;
+
+        DROP TABLE traces_sampled_minutely;
+    END IF;
+END $$;
@@ -0,0 +1,68 @@
+-- Rollup Migration: Latency Sketches in traces_minutely
+-- Purpose: Each traces_minutely row carries a DDSketch of its latencies
+--          (JSONB bin index -> count, 1% relative accuracy), merged by the
+--          processing service on every upsert, so P50-P99 over any window
+--          come from the rollup instead of percentile_cont over traces.
+-- Date: October 18, 2026
+-- Note: Run after rollup_01_traces_minutely.sql, with the processing service
+--       stopped. The backfill covers stored traces only; minutes with
+--       sampled-out traces written before this migration keep sketches of
+--       their stored traces.
+
+-- Step 1: Sketch column
+ALTER TABLE traces_minutely ADD COLUMN IF NOT EXISTS latency_sketch JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+-- Step 2: Merge function used by the rollup upsert
+CREATE OR REPLACE FUNCTION latency_sketch_merge(a JSONB, b JSONB) RETURNS JSONB
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(jsonb_object_agg(bin, n), '{}'::jsonb)
+    FROM (
+        SELECT key AS bin, SUM(value::bigint) AS n
+        FROM (
+            SELECT * FROM jsonb_each_text(COALESCE(a, '{}'::jsonb))
+            UNION ALL
+            SELECT * FROM jsonb_each_text(COALESCE(b, '{}'::jsonb))
+        ) entries
+        GROUP BY key
+    ) merged
+$$;
+
+-- Step 3: Backfill sketches from stored traces
+WITH bins AS (
+    SELECT
+        time_bucket(INTERVAL '1 minute', timestamp) AS bucket,
+        workspace_id,
+        agent_id,
+        COALESCE(model, '') AS model,
+        COALESCE(model_provider, '') AS model_provider,
+        COALESCE(department_id, '00000000-0000-0000-0000-000000000000'::uuid) AS department_id,
+        COALESCE(environment_id, '00000000-0000-0000-0000-000000000000'::uuid) AS environment_id,
+        COALESCE(version, '') AS version,
+        COALESCE(status, 'success') AS status,
+        CEIL(LN(GREATEST(latency_ms, 1)) / LN(1.01 / 0.99))::int AS bin,
+        COUNT(*) AS n
+    FROM traces
+    WHERE timestamp >= NOW() - INTERVAL '30 days'
+        AND latency_ms IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
+),
+sketches AS (
+    SELECT
+        bucket, workspace_id, agent_id, model, model_provider,
+        department_id, environment_id, version, status,
+        jsonb_object_agg(bin, n) AS latency_sketch
+    FROM bins
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+)
+UPDATE traces_minutely m
+SET latency_sketch = s.latency_sketch
+FROM sketches s
+WHERE m.bucket = s.bucket
+    AND m.workspace_id = s.workspace_id
+    AND m.agent_id = s.agent_id
+    AND m.model = s.model
+    AND m.model_provider = s.model_provider
+    AND m.department_id = s.department_id
+    AND m.environment_id = s.environment_id
+    AND m.version = s.version
+    AND m.status = s.status;
@@ -0,0 +1,32 @@
+-- Sampling Migration: Exact Counters for Sampled-Out Traces
+-- Purpose: Per-minute rollup of traces dropped by head/tail sampling, so
+--          request counts, latency, tokens and cost stay exact while only a
+--          sample of successful traces is stored in full.
+-- Date: October 18, 2026
+
+CREATE TABLE IF NOT EXISTS traces_sampled_minutely (
+    bucket TIMESTAMPTZ NOT NULL,
+    workspace_id UUID NOT NULL,
+    agent_id VARCHAR(128) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    model_provider VARCHAR(32) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+    tokens_input_sum BIGINT NOT NULL DEFAULT 0,
+    tokens_output_sum BIGINT NOT NULL DEFAULT 0,
+    tokens_total_sum BIGINT NOT NULL DEFAULT 0,
+    cost_usd_sum DECIMAL(14, 6) NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, workspace_id, agent_id, model, model_provider, status)
+);
+
+SELECT create_hypertable('traces_sampled_minutely', 'bucket',
+    chunk_time_interval => INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+
+CREATE INDEX IF NOT EXISTS idx_traces_sampled_workspace_bucket
+    ON traces_sampled_minutely (workspace_id, bucket DESC);
+
+-- Same retention as traces
+SELECT add_retention_policy('traces_sampled_minutely', INTERVAL '30 days', if_not_exists => TRUE);